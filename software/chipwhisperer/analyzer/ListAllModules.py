@@ -118,6 +118,16 @@ except ImportError, e:
 finally:
     modList.append(["traces.TraceContinerNative", ok, err])
 
+try:
+    import chipwhisperer.common.traces.TraceContainerChunked
+    ok = True
+    err = ""
+except ImportError, e:
+    ok = False
+    err = str(e)
+finally:
+    modList.append(["traces.TraceContainerChunked", ok, err])
+
 try:
     import chipwhisperer.common.traces.TraceContainerDPAv3
     ok = True
@@ -35,11 +35,12 @@ except ImportError:
     sys.exit()
 
 from chipwhisperer.common.GraphWidget import GraphWidget
+from chipwhisperer.analyzer.attacks.CPAAccumulator import CorrelationPeaks
 from chipwhisperer.common.utils import hexstr2list
+from chipwhisperer.common.traces.utils import NpyAppender
 
 from datetime import datetime
 from functools import partial
-import copy
 
 import numpy as np
 
@@ -499,7 +500,7 @@ class OutputVsTime(ResultsPlotData):
 
     def redrawPlot(self):
 
-        data = self.attack.getStatistics().diffs
+        data = list(self.attack.getStatistics().diffs)
 
         enabledlist = []
         for i in range(0, self.numKeys):
@@ -508,9 +509,18 @@ class OutputVsTime(ResultsPlotData):
 
 
         xrangelist = [0] * self.numKeys
-        for bnum in enabledlist:
+        for bnum in list(enabledlist):
             diffs = data[bnum]
 
+            if isinstance(diffs, CorrelationPeaks):
+                #Only the envelope is kept in Peaks Only mode
+                (points, data[bnum]) = diffs.envelope()
+                if points is None:
+                    enabledlist.remove(bnum)
+                else:
+                    xrangelist[bnum] = points + self.attack.getPointRange(bnum)[0]
+                continue
+
             if not hasattr(diffs[0], '__iter__'):
                 diffs = [[t] for t in diffs]
 
@@ -600,27 +610,11 @@ class PGEVsTrace(ResultsPlotData):
     def calculatePGE(self):
         """Calculate the Partial Guessing Entropy (PGE)"""
 
-        stats = self.attack.getStatistics()
-        pge = stats.pge_total
+        history = self.attack.getStatistics().history
         allpge = OrderedDict()
 
-        for i in pge:
-            tnum = i['trace']
-            if not tnum in allpge:
-                allpge[tnum] = [{'pgesum':0, 'trials':0} for z in range(0,stats.numSubkeys)]
-
-            allpge[tnum][i['subkey']]['pgesum'] += i['pge']
-            allpge[tnum][i['subkey']]['trials'] += 1
-
-        for (tnum, plist) in allpge.iteritems():
-            for j in plist:
-                if j['trials'] > 0:
-                    j['pge'] = float(j['pgesum']) / float(j['trials'])
-                    # print "%d "%j['trials'],
-                else:
-                    j['pge'] = None
-
-        #print ""
+        for (tnum, pges, trials) in zip(history.traces(), history.pge(), history.trials()):
+            allpge[int(tnum)] = [{'pge':(float(p) if t > 0 else None), 'trials':int(t)} for (p, t) in zip(pges, trials)]
 
         return allpge
 
@@ -681,7 +675,9 @@ class CorrelationVsTrace(ResultsPlotData):
     def redrawPlot(self):
         """Redraw the plot, loading data from attack"""
 
-        data = self.attack.getStatistics().maxes_list
+        history = self.attack.getStatistics().history
+        traces = history.traces()
+        trials = history.trials()
 
         enabledlist = []
         for i in range(0, self.numKeys):
@@ -692,19 +688,10 @@ class CorrelationVsTrace(ResultsPlotData):
         xrangelist = [0] * self.numKeys
         newdata = [0] * self.numKeys
         for bnum in enabledlist:
-            maxdata = data[bnum]
-
-            tlist = []
-            for m in maxdata:
-                tlist.append(m['trace'])
-
-            maxlist = np.zeros((self.numPerms, len(tlist)))
-            for i, m in enumerate(maxdata):
-                for j in range(0, self.numPerms):
-                    maxlist[m['maxes'][j][0], i] = m['maxes'][j][2]
-
-            newdata[bnum] = maxlist
-            xrangelist[bnum] = tlist
+            #Only trace counts this subkey has results for
+            valid = trials[:, bnum] > 0
+            newdata[bnum] = history.peaks(bnum)[:, valid]
+            xrangelist[bnum] = traces[valid]
 
         self.drawData(xrangelist, newdata, enabledlist)
 
@@ -885,7 +872,7 @@ class ResultsSave(QObject):
 
         self._filename = None
         self._enabled = False
-        self.dataarray = None
+        self._file = None
 
 
     def paramList(self):
@@ -928,37 +915,39 @@ class ResultsSave(QObject):
         # attackStats.diffs[i][hypkey]
         # attackStats.diffs_tnum[i]
 
-        if self._filename is None:
+        numkeys = len(attackStats.diffs)
+        numhyps = attackStats.numPerms
+
+        if self._file is None:
 
             # Generate filename
             self._filename = "tempstats_%s.npy" % datetime.now().strftime('%Y%m%d_%H%M%S')
 
-            # Generate Array
-            self.dataarray = []
-
+            # One record per update, np.load() gives an array which indexes like the old list of dicts
+            self._file = NpyAppender(self._filename, [('tracecnt', 'i8', (numkeys,)), ('diffsmax', 'f8', (numkeys, numhyps)),
+                                                      ('diffsmin', 'f8', (numkeys, numhyps))])
 
         # Record max & min, used as we don't know if user wanted absolute mode or not
-        numkeys = len(attackStats.diffs)
-        numhyps = len(attackStats.diffs[0])
+        record = np.zeros(1, dtype=self._file.dtype)
+        record['diffsmax'] = np.nan
+        record['diffsmin'] = np.nan
 
-        tempmin = np.ndarray((numkeys, numhyps))
-        tempmax = np.ndarray((numkeys, numhyps))
+        # Trace count of -1 for subkeys with no results
+        record['tracecnt'] = [-1 if t is None else t for t in attackStats.diffs_tnum]
 
         for i in range(0, numkeys):
-            for j in range(0, numhyps):
-                tempmax[i][j] = np.nanmax(attackStats.diffs[i][j])
-                tempmin[i][j] = np.nanmin(attackStats.diffs[i][j])
-
-        newdata = {"tracecnt":copy.deepcopy(attackStats.diffs_tnum), "diffsmax":tempmax, "diffsmin":tempmin}
+            if attackStats.diffs[i] is not None:
+                (record['diffsmax'][0, i], record['diffsmin'][0, i]) = attackStats.extremes(i)
 
-        self.dataarray.append(newdata)
-        np.save(self._filename, self.dataarray)
+        self._file.append(record)
 
     def attackDone(self):
         """Attack is done"""
 
+        if self._file is not None:
+            self._file.close()
+        self._file = None
         self._filename = None
-        self.dataarray = None
 
     def setEnabled(self, enabled):
         self._enabled = enabled
@@ -26,7 +26,9 @@
 #=================================================
 
 
+import os
 import sys
+import itertools
 
 try:
     from PySide.QtCore import *
@@ -39,6 +41,7 @@ from subprocess import Popen, PIPE
 
 import numpy as np
 from openadc.ExtendedParameter import ExtendedParameter
+from chipwhisperer.analyzer.attacks.CPAAccumulator import CorrelationPeaks
 
 try:
     import pyqtgraph as pg
@@ -50,10 +53,166 @@ except ImportError:
     print "ERROR: PyQtGraph is required for this program"
     sys.exit()
 
+class RankingHistory(object):
+    """
+    Attack results at each reporting interval: PGE of each subkey (summed over attack runs, which report the same
+    trace counts) and the peak value of every hypothesis, stored in preallocated arrays with one row per trace count.
+
+    Arrays start small and double in size up to maxRows (None for no limit). Once full, the history is decimated to
+    every second trace count to make space, so long attacks are kept at a coarser resolution. If spillDir is set the
+    arrays are memory-mapped files in that directory instead of being held in memory.
+    """
+
+    initialRows = 64
+    _fileCount = itertools.count()
+
+    def __init__(self, numSubkeys=16, numPerms=256, maxRows=1024, spillDir=None):
+        self.numSubkeys = numSubkeys
+        self.numPerms = numPerms
+        self.maxRows = maxRows
+        self.spillDir = spillDir
+        self._files = {}
+        self.clear()
+
+    def _alloc(self, name, shape, dtype):
+        """New zeroed array & its filename, the file is in spillDir if set (otherwise filename is None)"""
+        if self.spillDir is None:
+            return (np.zeros(shape, dtype=dtype), None)
+
+        fname = os.path.join(self.spillDir, "history_%s_%d.npy" % (name, self._fileCount.next()))
+        return (np.lib.format.open_memmap(fname, mode='w+', dtype=dtype, shape=shape), fname)
+
+    def _removeFile(self, fname):
+        if fname is not None:
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+
+    def _resize(self, rows):
+        """Reallocate all arrays with space for rows entries, keeping the first self._rows"""
+        n = self._rows
+        for name, extra, dtype in [('traces', (), np.int64), ('pgeSum', (self.numSubkeys,), np.float64),
+                                   ('trials', (self.numSubkeys,), np.int32),
+                                   ('peaks', (self.numSubkeys, self.numPerms), np.float32)]:
+            old = getattr(self, '_' + name, None)
+            (new, fname) = self._alloc(name, (rows,) + extra, dtype)
+            if old is not None and n:
+                new[0:n] = old[0:n]
+            if name == 'peaks':
+                new[n:] = np.nan
+            setattr(self, '_' + name, new)
+
+            del old
+            self._removeFile(self._files.pop(name, None))
+            if fname is not None:
+                self._files[name] = fname
+        self._capacity = rows
+
+    def clear(self):
+        self._traces = self._pgeSum = self._trials = self._peaks = None
+        self._rows = 0
+        self._rowOf = {}
+        self._step = None
+        self._base = 0
+        if self.maxRows is None:
+            self._resize(self.initialRows)
+        else:
+            self._resize(min(self.initialRows, self.maxRows))
+
+    def close(self):
+        """Release the arrays & delete any spill files"""
+        self._traces = self._pgeSum = self._trials = self._peaks = None
+        for fname in self._files.values():
+            self._removeFile(fname)
+        self._files = {}
+
+    def _decimate(self):
+        """Keep only trace counts on an evenly spaced grid (plus the last one), coarse enough to free half the rows"""
+        traces = self._traces[0:self._rows]
+        if self._step is None:
+            #Start from the reporting interval
+            self._base = traces.min()
+            self._step = max(1, np.diff(np.sort(traces)).min())
+
+        while True:
+            keep = (traces - self._base) % self._step == 0
+            keep[np.argmax(traces)] = True
+            keep = np.flatnonzero(keep)
+            if len(keep) <= self._rows // 2 + 1:
+                break
+            self._step *= 2
+        n = len(keep)
+
+        for data in (self._traces, self._pgeSum, self._trials, self._peaks):
+            data[0:n] = data[keep]
+        self._peaks[n:self._rows] = np.nan
+        self._pgeSum[n:self._rows] = 0
+        self._trials[n:self._rows] = 0
+
+        self._rows = n
+        self._rowOf = dict((int(t), i) for i, t in enumerate(self._traces[0:n]))
+
+    def _row(self, tnum):
+        """Row holding results for tnum traces, adding one if needed"""
+        row = self._rowOf.get(tnum)
+        if row is not None:
+            return row
+
+        if self._rows == self._capacity:
+            if self.maxRows is None or self._capacity < self.maxRows:
+                rows = self._capacity * 2
+                if self.maxRows is not None:
+                    rows = min(rows, self.maxRows)
+                self._resize(rows)
+            else:
+                self._decimate()
+
+        row = self._rows
+        self._traces[row] = tnum
+        self._rowOf[tnum] = row
+        self._rows += 1
+        return row
+
+    def add(self, bnum, tnum, pge, maxes):
+        """Record PGE & ranked peaks (structured array with 'hyp' and 'value' fields) for subkey bnum at tnum traces"""
+        if tnum is None:
+            tnum = 0
+        row = self._row(int(tnum))
+        self._pgeSum[row, bnum] += pge
+        self._trials[row, bnum] += 1
+        self._peaks[row, bnum, maxes['hyp']] = maxes['value']
+
+    def _order(self):
+        return np.argsort(self._traces[0:self._rows], kind='mergesort')
+
+    def traces(self):
+        """Trace counts with results, in increasing order"""
+        return self._traces[0:self._rows][self._order()]
+
+    def trials(self):
+        """Number of results averaged for each trace count & subkey, as array of (traces, subkeys)"""
+        return self._trials[0:self._rows][self._order()]
+
+    def pge(self):
+        """Average PGE for each trace count & subkey as array of (traces, subkeys), NaN where there is no result"""
+        order = self._order()
+        trials = self._trials[0:self._rows][order]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            pge = self._pgeSum[0:self._rows][order] / trials
+        pge[trials == 0] = np.nan
+        return pge
+
+    def peaks(self, bnum):
+        """Latest peak value of each hypothesis for subkey bnum at each trace count, as array of (hypotheses, traces)"""
+        return np.array(self._peaks[0:self._rows, bnum][self._order()].T)
+
+
 class DataTypeDiffs(object):
     """
     Data type used for attacks generating peaks indicating the 'best' success. Examples include
-    standard DPA & CPA attacks.
+    standard DPA & CPA attacks. The output of each subkey is either the full (hypotheses x points)
+    array, or just the CorrelationPeaks of it.
     """
     numSubkeys = 16
     numPerms = 256
@@ -62,8 +221,14 @@ class DataTypeDiffs(object):
         self.numSubkeys = numSubkeys
         self.numPerms = numPerms
         self.knownkey = None
+        self.history = RankingHistory(numSubkeys, numPerms)
         self.clear()
 
+    def setHistoryLimit(self, maxRows, spillDir=None):
+        """Maximum reporting intervals kept in the history (None for no limit), & optional directory to keep it in"""
+        self.history.close()
+        self.history = RankingHistory(self.numSubkeys, self.numPerms, maxRows, spillDir)
+
     def clear(self):
         #Diffs from CPA/DPA Attack
         self.diffs = [None]*self.numSubkeys
@@ -77,8 +242,7 @@ class DataTypeDiffs(object):
         self.maxValid = [False]*self.numSubkeys
         self.pge = [255]*self.numSubkeys
         self.diffs_tnum = [None]*self.numSubkeys
-        self.pge_total = []
-        self.maxes_list = [ list() for i in range(0, self.numSubkeys)]
+        self.history.clear()
 
         #TODO: Ensure this gets called by attack algorithms when rerunning
 
@@ -95,75 +259,97 @@ class DataTypeDiffs(object):
         if (id(data) != id(self.diffs[bnum])) or forceUpdate:
             self.maxValid[bnum] = False
 
-            if data is not None and copy:
+            if data is not None and copy and not isinstance(data, CorrelationPeaks):
                 self.diffs[bnum] = data[:]
                 self.diffs_tnum[bnum] = tnum
             else:
                 self.diffs[bnum] = data
                 self.diffs_tnum[bnum] = tnum
 
+    def _rankSubkey(self, bnum, useAbsolute=True, useSingle=False):
+        """Find peak value & location of every hypothesis for one subkey, and sort them best first"""
+        if isinstance(self.diffs[bnum], CorrelationPeaks):
+            #Only the peaks are known, so useSingle can't be done
+            (values, points) = self.diffs[bnum].peaks(useAbsolute)
+            useSingle = False
+        else:
+            diffs = np.asarray(self.diffs[bnum], dtype=np.float64)
+            if diffs.ndim == 1:
+                #One value per hypothesis
+                diffs = diffs.reshape(-1, 1)
+
+            if useAbsolute:
+                mag = np.fabs(diffs)
+            else:
+                mag = diffs
+
+            #Like nanargmax, but hypotheses which are all NaN give NaN instead of raising
+            nans = np.isnan(mag)
+            points = np.argmax(np.where(nans, -np.inf, mag), axis=1)
+            values = mag[np.arange(0, diffs.shape[0]), points]
+
+        #Best value first, hypotheses with equal values in descending order as the original value sort did. NaN
+        #values are ranked last.
+        order = np.lexsort((-np.arange(0, len(values)), -values))
+
+        maxes = np.zeros(len(order), dtype=self.maxes[bnum].dtype)
+        maxes['hyp'] = order
+        if useSingle:
+            #All table values are taken from same point MAX is taken from
+            maxes['point'] = points[order[0]]
+            maxes['value'] = diffs[order, points[order[0]]]
+        else:
+            maxes['point'] = points[order]
+            maxes['value'] = values[order]
+
+        self.maxes[bnum] = maxes
+        self.maxValid[bnum] = True
+
+    def extremes(self, bnum):
+        """Returns (max, min) output of each hypothesis for subkey bnum, NaN where a hypothesis has no output"""
+        data = self.diffs[bnum]
+        if isinstance(data, CorrelationPeaks):
+            return (data.maxValue, data.minValue)
+
+        data = np.asarray(data, dtype=np.float64)
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+        #fmax/fmin skip NaNs without warnings for hypotheses which are all NaN
+        return (np.fmax.reduce(data, axis=1), np.fmin.reduce(data, axis=1))
+
+    def _updatePGE(self, bytelist):
+        """PGE of each subkey in bytelist from its ranked hypotheses, 128 if the known key's result is NaN"""
+        if self.knownkey is None or len(bytelist) == 0:
+            return
+
+        known = np.asarray(self.knownkey)[bytelist].reshape(-1, 1)
+        ranked = np.array([self.maxes[i]['hyp'] for i in bytelist])
+        values = np.array([self.maxes[i]['value'] for i in bytelist])
+        match = ranked == known
+        pge = np.where(match.any(axis=1), match.argmax(axis=1), 255)
+        pge[(match & np.isnan(values)).any(axis=1)] = 128
+
+        for i, p in zip(bytelist, pge):
+            self.pge[i] = int(p)
+
     def findMaximums(self, bytelist=None, useAbsolute=True, useSingle=False):
         if bytelist is None:
             bytelist = range(0, self.numSubkeys)
 
-        # print useAbsolute
-
+        ranked = []
         for i in bytelist:
             if self.diffs[i] is None:
                 self.maxValid[i] = False
                 continue
 
             if self.maxValid[i] == False:
-                for hyp in range(0, 256):
-                    if useAbsolute:
-                        v = np.nanmax(np.fabs(self.diffs[i][hyp]))
-                    else:
-                        v = np.nanmax(self.diffs[i][hyp])
-
-                    mvalue = v
-
-                    #Get maximum value for this hypothesis
-                    try:
-                        mindex = np.amin(np.where(v == mvalue))
-                    except ValueError:
-                        mindex = 255
-                    self.maxes[i][hyp]['hyp'] = hyp
-                    self.maxes[i][hyp]['point'] = mindex
-                    self.maxes[i][hyp]['value'] = mvalue
-
-
-                #TODO: why does this fail?
-                #self.maxes[i][np.isnan(self.maxes[i]['value'])]['value'] = 0
-                #TODO: workaround for PGE, as NaN's get ranked first
-                numnans = np.isnan(self.maxes[i]['value']).sum()
-
-                self.maxes[i].sort(order='value')
-                self.maxes[i] = self.maxes[i][::-1]
-                self.maxValid[i] = True
-
-                if useSingle:
-                    #All table values are taken from same point MAX is taken from
-                    where = self.maxes[i][0]['point']
-                    for j in range(0,256):
-                        self.maxes[i][j]['point'] = where
-                        self.maxes[i][j]['value'] = self.diffs[i][self.maxes[i][j]['hyp']][where]
-
-                if self.knownkey is not None:
-                    try:
-                        self.pge[i] = np.where(self.maxes[i]['hyp'] == self.knownkey[i])[0][0] - numnans
-                        if self.pge[i] < 0:
-                            self.pge[i] = 128
-                    except IndexError:
-                        self.pge[i] = 255
-
-            tnum = self.diffs_tnum[i]
-            self.pge_total.append({'trace':tnum, 'subkey':i, 'pge':self.pge[i]})
-            
-            if len(self.maxes_list[i]) == 0 or self.maxes_list[i][-1]['trace'] != tnum:
-                self.maxes_list[i].append({'trace':tnum, 'maxes':np.array(self.maxes[i])})
-
-        return self.maxes
-
+                self._rankSubkey(i, useAbsolute, useSingle)
+                ranked.append(i)
 
+        self._updatePGE(ranked)
 
+        #Only new results go in the history, so repeated calls don't count as extra attack runs
+        for i in ranked:
+            self.history.add(i, self.diffs_tnum[i], self.pge[i], self.maxes[i])
 
+        return self.maxes
@@ -0,0 +1,461 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Authors: Colin O'Flynn
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+import os
+import numpy as np
+
+class CPAAccumulator(object):
+    """
+    Running sums for progressive CPA on one subkey. These are the sufficient statistics for the correlation,
+    so two accumulators built from different sets of traces can be merged to give the same result as if
+    all traces were processed by a single attack. Used to split attacks across processes or machines, and
+    to checkpoint long attacks to disk.
+    """
+
+    def __init__(self, numGuesses=256):
+        self.numGuesses = numGuesses
+        self.clear()
+
+    def clear(self):
+        self.sumh = np.zeros(self.numGuesses, dtype=np.float64)
+        self.sumhq = np.zeros(self.numGuesses, dtype=np.float64)
+        self.sumt = None
+        self.sumtq = None
+        self.sumht = None
+        self.totalTraces = 0
+
+    def isEmpty(self):
+        return self.totalTraces == 0
+
+    def numPoints(self):
+        if self.sumt is None:
+            return 0
+        return len(self.sumt)
+
+    def add(self, traces, hyp):
+        """Add a block of traces (numtraces x points) with the (numtraces x numGuesses) hypothesis matrix"""
+        traces = np.asarray(traces, dtype=np.float64)
+        hyp = np.asarray(hyp, dtype=np.float64)
+
+        if self.isEmpty():
+            npoints = np.shape(traces)[1]
+            self.sumt = np.zeros(npoints, dtype=np.float64)
+            self.sumtq = np.zeros(npoints, dtype=np.float64)
+            self.sumht = np.zeros((self.numGuesses, npoints), dtype=np.float64)
+
+        self.sumh += np.sum(hyp, axis=0)
+        self.sumhq += np.sum(np.square(hyp), axis=0)
+        self.sumt += np.sum(traces, axis=0)
+        self.sumtq += np.sum(np.square(traces), axis=0)
+        self.sumht += np.dot(np.transpose(hyp), traces)
+        self.totalTraces += len(traces)
+
+    def merge(self, other):
+        """Add the statistics from another accumulator (covering different traces) into this one"""
+        if other.isEmpty():
+            return self
+
+        if not isinstance(other, CPAAccumulator):
+            raise ValueError("Can't merge %s into %s" % (type(other).__name__, type(self).__name__))
+
+        if other.numGuesses != self.numGuesses:
+            raise ValueError("Can't merge accumulators with %d and %d guesses" % (self.numGuesses, other.numGuesses))
+
+        if self.isEmpty():
+            self.sumh = np.array(other.sumh, dtype=np.float64)
+            self.sumhq = np.array(other.sumhq, dtype=np.float64)
+            self.sumt = np.array(other.sumt, dtype=np.float64)
+            self.sumtq = np.array(other.sumtq, dtype=np.float64)
+            self.sumht = np.array(other.sumht, dtype=np.float64)
+            self.totalTraces = other.totalTraces
+            return self
+
+        if other.numPoints() != self.numPoints():
+            raise ValueError("Can't merge accumulators with %d and %d points" % (self.numPoints(), other.numPoints()))
+
+        self.sumh += other.sumh
+        self.sumhq += other.sumhq
+        self.sumt += other.sumt
+        self.sumtq += other.sumtq
+        self.sumht += other.sumht
+        self.totalTraces += other.totalTraces
+        return self
+
+    def correlation(self, start=0, end=None):
+        """Return the (numGuesses x points) correlation array, same as the diffs returned by the attack"""
+        if self.isEmpty():
+            return None
+
+        n = self.totalTraces
+        sumt = self.sumt[start:end]
+        sumnum = n * self.sumht[:, start:end] - np.outer(self.sumh, sumt)
+        sumden1 = np.square(self.sumh) - n * self.sumhq
+        sumden2 = np.square(sumt) - n * self.sumtq[start:end]
+        return sumnum / np.sqrt(np.outer(sumden1, sumden2))
+
+    def peaks(self, envelopeBins=0):
+        """Return the CorrelationPeaks of the correlation, without building the whole correlation array"""
+        if self.isEmpty():
+            return None
+        return CorrelationPeaks.fromCorrelation(self.correlation, self.numPoints(), self.numGuesses, envelopeBins)
+
+    def toDict(self, prefix=""):
+        d = {prefix + 'kind':'raw', prefix + 'numGuesses':self.numGuesses, prefix + 'totalTraces':self.totalTraces,
+             prefix + 'sumh':self.sumh, prefix + 'sumhq':self.sumhq}
+        if not self.isEmpty():
+            d[prefix + 'sumt'] = self.sumt
+            d[prefix + 'sumtq'] = self.sumtq
+            d[prefix + 'sumht'] = self.sumht
+        return d
+
+    @classmethod
+    def fromDict(cls, d, prefix=""):
+        acc = cls(int(d[prefix + 'numGuesses']))
+        acc.totalTraces = int(d[prefix + 'totalTraces'])
+        acc.sumh = np.array(d[prefix + 'sumh'], dtype=np.float64)
+        acc.sumhq = np.array(d[prefix + 'sumhq'], dtype=np.float64)
+        if not acc.isEmpty():
+            acc.sumt = np.array(d[prefix + 'sumt'], dtype=np.float64)
+            acc.sumtq = np.array(d[prefix + 'sumtq'], dtype=np.float64)
+            acc.sumht = np.array(d[prefix + 'sumht'], dtype=np.float64)
+        return acc
+
+class CPACenteredAccumulator(object):
+    """
+    Alternative to CPAAccumulator which stores the means and centered (co-)moments instead of raw sums. Each
+    block is reduced to its own means & moments which are combined with the pairwise update of Chan et al.,
+    so there is no sumt^2 - N*sumtq style cancellation even with large DC offsets in the traces. This means
+    integer ADC samples can be fed in directly without a normalization pass first.
+    """
+
+    def __init__(self, numGuesses=256):
+        self.numGuesses = numGuesses
+        self.clear()
+
+    def clear(self):
+        self.meanh = np.zeros(self.numGuesses, dtype=np.float64)
+        self.m2h = np.zeros(self.numGuesses, dtype=np.float64)
+        self.meant = None
+        self.m2t = None
+        self.cht = None
+        self.totalTraces = 0
+
+    def isEmpty(self):
+        return self.totalTraces == 0
+
+    def numPoints(self):
+        if self.meant is None:
+            return 0
+        return len(self.meant)
+
+    def add(self, traces, hyp):
+        """Add a block of traces (numtraces x points) with the (numtraces x numGuesses) hypothesis matrix"""
+        traces = np.asarray(traces, dtype=np.float64)
+        hyp = np.asarray(hyp, dtype=np.float64)
+
+        block = CPACenteredAccumulator(self.numGuesses)
+        block.totalTraces = len(traces)
+        block.meant = np.mean(traces, axis=0)
+        block.meanh = np.mean(hyp, axis=0)
+        tdiff = traces - block.meant
+        hdiff = hyp - block.meanh
+        block.m2t = np.sum(np.square(tdiff), axis=0)
+        block.m2h = np.sum(np.square(hdiff), axis=0)
+        block.cht = np.dot(np.transpose(hdiff), tdiff)
+
+        self.merge(block)
+
+    def merge(self, other):
+        """Combine with another accumulator (covering different traces) using the pairwise update"""
+        if other.isEmpty():
+            return self
+
+        if not isinstance(other, CPACenteredAccumulator):
+            raise ValueError("Can't merge %s into %s" % (type(other).__name__, type(self).__name__))
+
+        if other.numGuesses != self.numGuesses:
+            raise ValueError("Can't merge accumulators with %d and %d guesses" % (self.numGuesses, other.numGuesses))
+
+        if self.isEmpty():
+            self.meanh = np.array(other.meanh, dtype=np.float64)
+            self.m2h = np.array(other.m2h, dtype=np.float64)
+            self.meant = np.array(other.meant, dtype=np.float64)
+            self.m2t = np.array(other.m2t, dtype=np.float64)
+            self.cht = np.array(other.cht, dtype=np.float64)
+            self.totalTraces = other.totalTraces
+            return self
+
+        if other.numPoints() != self.numPoints():
+            raise ValueError("Can't merge accumulators with %d and %d points" % (self.numPoints(), other.numPoints()))
+
+        na = np.float64(self.totalTraces)
+        nb = np.float64(other.totalTraces)
+        n = na + nb
+        deltat = other.meant - self.meant
+        deltah = other.meanh - self.meanh
+
+        self.m2t += other.m2t + np.square(deltat) * (na * nb / n)
+        self.m2h += other.m2h + np.square(deltah) * (na * nb / n)
+        self.cht += other.cht + np.outer(deltah, deltat) * (na * nb / n)
+        self.meant += deltat * (nb / n)
+        self.meanh += deltah * (nb / n)
+        self.totalTraces += other.totalTraces
+        return self
+
+    def correlation(self, start=0, end=None):
+        """Return the (numGuesses x points) correlation array, same as the diffs returned by the attack"""
+        if self.isEmpty():
+            return None
+
+        return self.cht[:, start:end] / np.sqrt(np.outer(self.m2h, self.m2t[start:end]))
+
+    def peaks(self, envelopeBins=0):
+        """Return the CorrelationPeaks of the correlation, without building the whole correlation array"""
+        if self.isEmpty():
+            return None
+        return CorrelationPeaks.fromCorrelation(self.correlation, self.numPoints(), self.numGuesses, envelopeBins)
+
+    def toDict(self, prefix=""):
+        d = {prefix + 'kind':'centered', prefix + 'numGuesses':self.numGuesses, prefix + 'totalTraces':self.totalTraces,
+             prefix + 'meanh':self.meanh, prefix + 'm2h':self.m2h}
+        if not self.isEmpty():
+            d[prefix + 'meant'] = self.meant
+            d[prefix + 'm2t'] = self.m2t
+            d[prefix + 'cht'] = self.cht
+        return d
+
+    @classmethod
+    def fromDict(cls, d, prefix=""):
+        acc = cls(int(d[prefix + 'numGuesses']))
+        acc.totalTraces = int(d[prefix + 'totalTraces'])
+        acc.meanh = np.array(d[prefix + 'meanh'], dtype=np.float64)
+        acc.m2h = np.array(d[prefix + 'm2h'], dtype=np.float64)
+        if not acc.isEmpty():
+            acc.meant = np.array(d[prefix + 'meant'], dtype=np.float64)
+            acc.m2t = np.array(d[prefix + 'm2t'], dtype=np.float64)
+            acc.cht = np.array(d[prefix + 'cht'], dtype=np.float64)
+        return acc
+
+class CorrelationPeaks(object):
+    """
+    Largest & smallest output of each guess over all points and where they are, which is all that ranking the
+    guesses needs. Built a block of points at a time, so the full (numGuesses x points) correlation never has to
+    be in memory and isn't kept between reporting intervals.
+
+    If envelopeBins is set, the largest & smallest output in each of that many bins of points is also kept, so the
+    output can still be plotted against sample number at lower resolution.
+    """
+
+    #Points converted at once when building from a correlation function
+    blockSize = 4096
+
+    def __init__(self, numGuesses=256, numPoints=0, envelopeBins=0):
+        self.numGuesses = numGuesses
+        self.numPoints = numPoints
+        self.maxValue = np.empty(numGuesses, dtype=np.float64)
+        self.maxValue.fill(-np.inf)
+        self.maxPoint = np.zeros(numGuesses, dtype=np.int64)
+        self.minValue = np.empty(numGuesses, dtype=np.float64)
+        self.minValue.fill(np.inf)
+        self.minPoint = np.zeros(numGuesses, dtype=np.int64)
+
+        if envelopeBins and numPoints:
+            self.binSize = int(np.ceil(numPoints / float(envelopeBins)))
+            nbins = int(np.ceil(numPoints / float(self.binSize)))
+            self.envMax = np.empty((numGuesses, nbins), dtype=np.float64)
+            self.envMax.fill(-np.inf)
+            self.envMin = np.empty((numGuesses, nbins), dtype=np.float64)
+            self.envMin.fill(np.inf)
+        else:
+            self.binSize = None
+            self.envMax = None
+            self.envMin = None
+
+    @classmethod
+    def fromCorrelation(cls, correlation, numPoints, numGuesses=256, envelopeBins=0):
+        """Build from correlation(start, end), which returns the (numGuesses x (end-start)) outputs for those points"""
+        peaks = cls(numGuesses, numPoints, envelopeBins)
+
+        blockSize = cls.blockSize
+        if peaks.binSize:
+            #Blocks must hold whole envelope bins
+            blockSize = max(1, blockSize // peaks.binSize) * peaks.binSize
+
+        for start in range(0, numPoints, blockSize):
+            peaks.add(start, correlation(start, min(start + blockSize, numPoints)))
+
+        return peaks.finish()
+
+    @classmethod
+    def fromArray(cls, data, envelopeBins=0):
+        """Build from a full (numGuesses x points) output array"""
+        data = np.asarray(data, dtype=np.float64)
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+        return cls.fromCorrelation(lambda start, end: data[:, start:end], data.shape[1], data.shape[0], envelopeBins)
+
+    def add(self, start, block):
+        """Update with the outputs for points start to start+len(block[0]), start must be at the start of an envelope bin"""
+        nans = np.isnan(block)
+        rows = np.arange(0, self.numGuesses)
+
+        high = np.where(nans, -np.inf, block)
+        idx = np.argmax(high, axis=1)
+        value = high[rows, idx]
+        better = value > self.maxValue
+        self.maxValue[better] = value[better]
+        self.maxPoint[better] = idx[better] + start
+
+        low = np.where(nans, np.inf, block)
+        idx = np.argmin(low, axis=1)
+        value = low[rows, idx]
+        better = value < self.minValue
+        self.minValue[better] = value[better]
+        self.minPoint[better] = idx[better] + start
+
+        if self.binSize:
+            bins = np.arange(0, block.shape[1], self.binSize)
+            first = start // self.binSize
+            last = first + len(bins)
+            self.envMax[:, first:last] = np.maximum(self.envMax[:, first:last], np.maximum.reduceat(high, bins, axis=1))
+            self.envMin[:, first:last] = np.minimum(self.envMin[:, first:last], np.minimum.reduceat(low, bins, axis=1))
+
+    def finish(self):
+        """Mark guesses (or bins) which were all NaN with NaN, call once all points are added"""
+        for data in (self.maxValue, self.minValue, self.envMax, self.envMin):
+            if data is not None:
+                data[np.isinf(data)] = np.nan
+        return self
+
+    def peaks(self, useAbsolute=True):
+        """Returns (values, points) of the peak for each guess, largest magnitude if useAbsolute, otherwise largest"""
+        if not useAbsolute:
+            return (self.maxValue, self.maxPoint)
+
+        with np.errstate(invalid='ignore'):
+            useMin = -self.minValue > self.maxValue
+        values = np.where(useMin, -self.minValue, self.maxValue)
+        points = np.where(useMin, self.minPoint, self.maxPoint)
+        return (values, points)
+
+    def envelope(self):
+        """Returns (points, outputs) for plotting, outputs is the largest magnitude output of each bin (keeping its sign)"""
+        if self.binSize is None:
+            return (None, None)
+
+        with np.errstate(invalid='ignore'):
+            useMin = -self.envMin > self.envMax
+        points = np.arange(0, self.envMax.shape[1]) * self.binSize
+        return (points, np.where(useMin, self.envMin, self.envMax))
+
+def accumulatorFromDict(d, prefix=""):
+    """Create the right accumulator type for data written by toDict()"""
+    if (prefix + 'kind') in d and str(d[prefix + 'kind']) == 'centered':
+        return CPACenteredAccumulator.fromDict(d, prefix)
+    return CPAAccumulator.fromDict(d, prefix)
+
+def saveAccumulators(fname, accumulators, tracerange=None):
+    """
+    Save a dictionary of bnum: CPAAccumulator to a .npz file. tracerange is the (start, end) of traces
+    already processed, used when resuming. The file is written to a temporary name first, and the previous
+    file is kept as fname.bak until the new one is in place, so a crash while saving never leaves no
+    checkpoint (loadAccumulators() falls back to whichever file survived).
+    """
+    d = {}
+    bnums = sorted(accumulators.keys())
+    d['bnums'] = np.array(bnums, dtype=np.int32)
+    if tracerange is not None:
+        d['tracerange'] = np.array(tracerange, dtype=np.int64)
+    for bnum in bnums:
+        d.update(accumulators[bnum].toDict(prefix='b%d_' % bnum))
+
+    tmpname = fname + '.tmp.npz'
+    bakname = fname + '.bak'
+    np.savez(tmpname, **d)
+    if os.path.exists(fname):
+        #os.rename() won't replace an existing file on Windows
+        if os.path.exists(bakname):
+            os.remove(bakname)
+        os.rename(fname, bakname)
+    os.rename(tmpname, fname)
+    if os.path.exists(bakname):
+        os.remove(bakname)
+
+def _accumulatorFiles(fname):
+    """Files which may hold the accumulators saved to fname, in the order to try them"""
+    return [f for f in (fname, fname + '.tmp.npz', fname + '.bak') if os.path.exists(f)]
+
+def accumulatorsExist(fname):
+    """True if loadAccumulators(fname) has a file to load"""
+    return len(_accumulatorFiles(fname)) > 0
+
+def _loadAccumulatorFile(fname):
+    f = np.load(fname)
+    try:
+        accs = {}
+        for bnum in f['bnums']:
+            accs[int(bnum)] = accumulatorFromDict(f, prefix='b%d_' % bnum)
+
+        if 'tracerange' in f.files:
+            tracerange = tuple(int(t) for t in f['tracerange'])
+        else:
+            tracerange = None
+    finally:
+        f.close()
+
+    return (accs, tracerange)
+
+def loadAccumulators(fname):
+    """
+    Load a file written by saveAccumulators(), returns (accumulators, tracerange). If saving was interrupted
+    the new (fname.tmp.npz) or previous (fname.bak) file is loaded instead.
+    """
+    fnames = _accumulatorFiles(fname)
+    if len(fnames) == 0:
+        raise IOError("No accumulator file %s" % fname)
+
+    for f in fnames[:-1]:
+        try:
+            return _loadAccumulatorFile(f)
+        except Exception as e:
+            print "Could not load accumulators from %s (%s), trying %s" % (f, str(e), fnames[fnames.index(f) + 1])
+    return _loadAccumulatorFile(fnames[-1])
+
+def mergeAccumulatorFiles(fnames, outname=None):
+    """Merge checkpoints from several shards of the same attack, optionally saving the result to outname"""
+    merged = {}
+    for fname in fnames:
+        (accs, _) = loadAccumulators(fname)
+        for bnum in accs:
+            if bnum not in merged:
+                merged[bnum] = type(accs[bnum])(accs[bnum].numGuesses)
+            merged[bnum].merge(accs[bnum])
+
+    if outname is not None:
+        saveAccumulators(outname, merged)
+
+    return merged
@@ -33,6 +33,8 @@ from pyqtgraph.parametertree import Parameter
 
 from openadc.ExtendedParameter import ExtendedParameter
 from chipwhisperer.analyzer.attacks.AttackStats import DataTypeDiffs
+from chipwhisperer.analyzer.attacks.CPAAccumulator import CPAAccumulator, CPACenteredAccumulator, CorrelationPeaks
+from chipwhisperer.analyzer.attacks.ParallelSubkeys import ProgressiveSubkeysMixin
 from chipwhisperer.common.autoscript import AutoScript
 
 class CPAProgressiveOneSubkey(object):
@@ -41,16 +43,76 @@ class CPAProgressiveOneSubkey(object):
         self.clearStats()
 
     def clearStats(self):
-        self.sumhq = [0]*256
+        self.sumhq = np.zeros(256, dtype=np.float64)
         self.sumtq = [0]
         self.sumt = [0]
-        self.sumh = [0]*256
-        self.sumht = [0]*256
+        self.sumh = np.zeros(256, dtype=np.float64)
+        #Allocated once number of points is known, one row per guess
+        self.sumht = None
         self.totalTraces = 0
 
+        #Only used in centered mode, replaces all of the above sums
+        self.centeredAcc = None
+
         self.modelstate = {'knownkey':None}
 
-    def oneSubkey(self, bnum, pointRange, traces_all, numtraces, plaintexts, ciphertexts, knownkeys, progressBar, model, leakagetype, state, pbcnt):
+    def getAccumulator(self):
+        """Return a copy of the running sums as a CPAAccumulator (or CPACenteredAccumulator in centered mode)"""
+        if self.centeredAcc is not None:
+            return CPACenteredAccumulator().merge(self.centeredAcc)
+
+        acc = CPAAccumulator()
+        if self.totalTraces > 0:
+            acc.sumh = np.array(self.sumh, dtype=np.float64)
+            acc.sumhq = np.array(self.sumhq, dtype=np.float64)
+            acc.sumt = np.array(self.sumt, dtype=np.float64)
+            acc.sumtq = np.array(self.sumtq, dtype=np.float64)
+            acc.sumht = np.array(self.sumht, dtype=np.float64)
+            acc.totalTraces = self.totalTraces
+        return acc
+
+    def setAccumulator(self, acc):
+        """Replace the running sums with those from a CPAAccumulator, so the attack continues from that state"""
+        self.clearStats()
+        if isinstance(acc, CPACenteredAccumulator):
+            self.centeredAcc = CPACenteredAccumulator().merge(acc)
+            self.totalTraces = acc.totalTraces
+        elif not acc.isEmpty():
+            self.sumh = np.array(acc.sumh, dtype=np.float64)
+            self.sumhq = np.array(acc.sumhq, dtype=np.float64)
+            self.sumt = np.array(acc.sumt, dtype=np.float64)
+            self.sumtq = np.array(acc.sumtq, dtype=np.float64)
+            self.sumht = np.array(acc.sumht, dtype=np.float64)
+            self.totalTraces = acc.totalTraces
+
+    def correlation(self, start=0, end=None):
+        """Correlation of all guesses for points start to end, from the running sums"""
+        if self.centeredAcc is not None:
+            return self.centeredAcc.correlation(start, end)
+
+        n = self.totalTraces
+        sumt = self.sumt[start:end]
+        sumnum = n * self.sumht[:, start:end] - np.outer(self.sumh, sumt)
+        sumden1 = (np.square(self.sumh) - n * self.sumhq)
+        sumden2 = (np.square(sumt) - n * self.sumtq[start:end])
+        return sumnum / np.sqrt(np.outer(sumden1, sumden2))
+
+    def peaks(self, envelopeBins=0):
+        """CorrelationPeaks of the current correlation, computed a block of points at a time"""
+        if self.centeredAcc is not None:
+            return self.centeredAcc.peaks(envelopeBins)
+        return CorrelationPeaks.fromCorrelation(self.correlation, np.shape(self.sumht)[1], 256, envelopeBins)
+
+    def oneSubkey(self, bnum, pointRange, traces_all, numtraces, plaintexts, ciphertexts, knownkeys, progressBar, model, leakagetype, state, pbcnt, vectorized=True, centered=False,
+                  peaks=False, envelopeBins=0):
+        """
+        Add traces & return (output, pbcnt). The output is the (256 x points) correlation, or if peaks is True only
+        its CorrelationPeaks (with an envelope of envelopeBins points, if set).
+        """
+
+        if self.totalTraces > 0 and centered != (self.centeredAcc is not None):
+            raise ValueError("Subkey %d already holds %s state, can't continue it in %s mode" %
+                             (bnum, "centered" if self.centeredAcc is not None else "raw sum", "centered" if centered else "raw sum"))
 
         diffs = [0]*256
         self.totalTraces += numtraces
@@ -65,10 +127,32 @@ class CPAProgressiveOneSubkey(object):
             # padafter = len(traces_all[0, :]) - pointRange[1]
             # print "%d - %d (%d %d)" % (pointRange[0], pointRange[1], padbefore, padafter)
 
+        if centered:
+            (diffs, pbcnt) = self.centeredSubkey(bnum, traces, numtraces, plaintexts, ciphertexts, knownkeys, progressBar, model, leakagetype, state, pbcnt, vectorized, peaks)
+            if peaks:
+                diffs = self.peaks(envelopeBins)
+            return (diffs, pbcnt)
+
         self.sumtq += np.sum(np.square(traces), axis=0, dtype=np.float64)
         self.sumt += np.sum(traces, axis=0)
         sumden2 = (np.square(self.sumt) - self.totalTraces * self.sumtq)
 
+        if self.sumht is None:
+            self.sumht = np.zeros((256, np.shape(traces)[1]), dtype=np.float64)
+
+        #The batch can't stop part way through the guesses, so if the user has already asked to skip this subkey use
+        #the loop, which stops at the first guess exactly like the reference engine
+        if progressBar and progressBar.wasSkipped():
+            vectorized = False
+
+        if vectorized and hasattr(model, 'leakageMatrix'):
+            hyp = model.leakageMatrix(plaintexts, ciphertexts, bnum, leakagetype, state)
+            if hyp is not None:
+                (diffs, pbcnt) = self.allSubkeysBatch(bnum, traces, numtraces, hyp, sumden2, progressBar, pbcnt, peaks)
+                if peaks:
+                    diffs = self.peaks(envelopeBins)
+                return (diffs, pbcnt)
+
         #For each 0..0xFF possible value of the key byte
         for key in range(0, 256):
             #Initialize arrays & variables to zero
@@ -159,19 +243,116 @@ class CPAProgressiveOneSubkey(object):
             # if padbefore > 0:
             #    diffs[key] = np.concatenate([np.zeros(padbefore), diffs[key]])
 
+        if peaks:
+            diffs = CorrelationPeaks.fromArray(diffs, envelopeBins)
+
+        return (diffs, pbcnt)
+
+    def hypothesisMatrix(self, bnum, numtraces, plaintexts, ciphertexts, knownkeys, model, leakagetype, state, vectorized=True):
+        """Returns the (numtraces x 256) hypothetical leakage for all guesses, using leakageMatrix() if possible"""
+        if vectorized and hasattr(model, 'leakageMatrix'):
+            hyp = model.leakageMatrix(plaintexts, ciphertexts, bnum, leakagetype, state)
+            if hyp is not None:
+                return hyp
+
+        hyp = np.zeros((numtraces, 256), dtype=np.float64)
+        pt = None
+        ct = None
+        for tnum in range(numtraces):
+            if len(plaintexts) > 0:
+                pt = plaintexts[tnum]
+
+            if len(ciphertexts) > 0:
+                ct = ciphertexts[tnum]
+
+            if knownkeys and len(knownkeys) > 0:
+                state['knownkey'] = knownkeys[tnum]
+            else:
+                state['knownkey'] = None
+
+            for key in range(0, 256):
+                hyp[tnum, key] = model.leakage(pt, ct, key, bnum, leakagetype, state)
+
+        return hyp
+
+    def centeredSubkey(self, bnum, traces, numtraces, plaintexts, ciphertexts, knownkeys, progressBar, model, leakagetype, state, pbcnt, vectorized=True, skipOutput=False):
+        """
+        Update using a CPACenteredAccumulator (means & co-moments) instead of raw sums. Numerically stable
+        so traces with a large DC offset or raw integer samples don't need to be normalized first.
+        If skipOutput is True the correlation isn't calculated, & None is returned in its place.
+        """
+        if self.centeredAcc is None:
+            self.centeredAcc = CPACenteredAccumulator()
+
+        hyp = self.hypothesisMatrix(bnum, numtraces, plaintexts, ciphertexts, knownkeys, model, leakagetype, state, vectorized)
+        self.centeredAcc.add(traces, hyp)
+
+        if progressBar:
+            progressBar.setValue(pbcnt)
+            progressBar.updateStatus((self.totalTraces-numtraces, self.totalTraces), bnum)
+            pbcnt = pbcnt + 256
+            if progressBar.wasCanceled():
+                raise KeyboardInterrupt
+
+        if skipOutput:
+            return (None, pbcnt)
+
+        return (self.centeredAcc.correlation(), pbcnt)
+
+    def allSubkeysBatch(self, bnum, traces, numtraces, hyp, sumden2, progressBar, pbcnt, skipOutput=False):
+        """
+        Same update as the loop in oneSubkey(), but done for all 256 guesses at once. hyp is the
+        (numtraces x 256) hypothesis matrix from the model, so sumht is updated with a single matrix
+        product instead of one multiply per guess. If skipOutput is True the correlation isn't
+        calculated, & None is returned in its place.
+        """
+        hyp = np.asarray(hyp, dtype=np.float64)
+
+        self.sumh += np.sum(hyp, axis=0)
+        self.sumhq += np.sum(np.square(hyp), axis=0)
+        self.sumht += np.dot(np.transpose(hyp), traces)
+
+        if progressBar:
+            progressBar.setValue(pbcnt)
+            progressBar.updateStatus((self.totalTraces-numtraces, self.totalTraces), bnum)
+            pbcnt = pbcnt + 256
+            if progressBar.wasCanceled():
+                raise KeyboardInterrupt
+
+        if skipOutput:
+            return (None, pbcnt)
+
+        sumnum = self.totalTraces * self.sumht - np.outer(self.sumh, self.sumt)
+        sumden1 = (np.square(self.sumh) - self.totalTraces * self.sumhq)
+        sumden = np.outer(sumden1, sumden2)
+        diffs = sumnum / np.sqrt(sumden)
+
         return (diffs, pbcnt)
 
-class CPAProgressive(AutoScript, QObject):
+class CPAProgressive(ProgressiveSubkeysMixin, AutoScript, QObject):
     """
     CPA Attack done as a loop, but using an algorithm which can progressively add traces & give output stats
     """
     paramListUpdated = Signal(list)
+    oneSubkeyClass = CPAProgressiveOneSubkey
 
     def __init__(self, targetModel, leakageFunction, showScriptParameter=None, parent=None):
         super(CPAProgressive, self).__init__()
 
         resultsParams = [{'name':'Iteration Mode', 'key':'itmode', 'type':'list', 'values':{'Depth-First':'df', 'Breadth-First':'bf'}, 'value':'bf'},
                          {'name':'Skip when PGE=0', 'key':'checkpge', 'type':'bool', 'value':False},
+                         {'name':'Parallel Subkeys', 'key':'parmode', 'type':'list', 'values':{'Off':'off', 'Threads':'thread', 'Processes':'process'}, 'value':'off', 'set':self.updateScript},
+                         {'name':'Parallel Workers (0=All Cores)', 'key':'parjobs', 'type':'int', 'value':0, 'limits':(0, 256), 'set':self.updateScript},
+                         {'name':'Checkpoint File', 'key':'ckptfile', 'type':'str', 'value':'', 'set':self.updateScript},
+                         {'name':'Resume from Checkpoint', 'key':'ckptresume', 'type':'bool', 'value':False, 'set':self.updateScript},
+                         {'name':'Checkpoint Interval (Traces)', 'key':'ckptinterval', 'type':'int', 'value':10000, 'limits':(0, 1E9), 'set':self.updateScript,
+                          'tip':'Traces between checkpoint saves, 0 to save after every reporting interval'},
+                         {'name':'Hypothesis Engine', 'key':'hypengine', 'type':'list', 'values':{'Vectorized':True, 'Per-Trace Loop':False}, 'value':True, 'set':self.updateScript},
+                         {'name':'Accumulator', 'key':'accmode', 'type':'list', 'values':{'Raw Sums':False, 'Centered (Stable)':True}, 'value':False, 'set':self.updateScript},
+                         {'name':'Attack Output', 'key':'outmode', 'type':'list', 'values':{'Full Output':False, 'Peaks Only':True}, 'value':False, 'set':self.updateScript,
+                          'tip':'Peaks Only keeps just the maximum & minimum of each guess, for attacks over very long traces'},
+                         {'name':'Envelope Bins (Peaks Only)', 'key':'envbins', 'type':'int', 'value':1000, 'limits':(0, 1E6), 'set':self.updateScript,
+                          'tip':'Output vs Point plot resolution in Peaks Only mode, 0 for none'},
                          ]
         self.params = Parameter.create(name='Progressive CPA', type='group', children=resultsParams)
         if showScriptParameter is not None:
@@ -184,125 +365,57 @@ class CPAProgressive(AutoScript, QObject):
         self.sr = None
 
         self.stats = DataTypeDiffs()
+        self.setVectorized(True)
+        self.setCenteredAccumulator(False)
+        self.setPeaksOnly(False)
+        self.setParallelMode('off')
+        self.setCheckpoint(None)
         self.updateScript()
 
     def updateScript(self, ignored=None):
         # self.addFunction('init', 'setReportingInterval', '%d' % self.findParam('reportinterval').value())
-        pass
-
-    def paramList(self):
-        return [self.params]
-
-    def setTargetBytes(self, brange):
-        self.brange = brange
-
-    def setReportingInterval(self, ri):
-        self._reportingInterval = ri
-
-    def addTraces(self, tracedata, tracerange, progressBar=None, pointRange=None):
-        brange=self.brange
-
-        self.all_diffs = range(0,16)
-
-        numtraces = tracerange[1] - tracerange[0]
-
-        if progressBar:
-            pbcnt = 0
-            progressBar.setMinimum(0)
-            progressBar.setMaximum(len(brange) * 256 * (numtraces / self._reportingInterval + 1))
-
-        pbcnt = 0
-        cpa = [None]*(max(brange)+1)
-        for bnum in brange:
-            cpa[bnum] = CPAProgressiveOneSubkey()
-
-        brangeMap = [None]*(max(brange)+1)
-        i = 1
-        for bnum in brange:
-            brangeMap[bnum] = i
-            i += 1
-
-        skipPGE = False  # self.findParam('checkpge').value()
-        bf = True  # self.findParam('itmode').value() == 'bf'
-
-        #bf specifies a 'breadth-first' search. bf means we search across each
-        #subkey by only the amount of traces specified. Depth-First means we
-        #search each subkey completely, then move onto the next.
-        if bf:
-            brange_df = [0]
-            brange_bf = brange
+        self.addFunction('init', 'setVectorized', '%s' % self.findParam('hypengine').value())
+        self.addFunction('init', 'setCenteredAccumulator', '%s' % self.findParam('accmode').value())
+        self.addFunction('init', 'setPeaksOnly', '%s, %d' % (self.findParam('outmode').value(), self.findParam('envbins').value()))
+        self.addFunction('init', 'setParallelMode', "'%s', %d" % (self.findParam('parmode').value(), self.findParam('parjobs').value()))
+        if self.findParam('ckptfile').value():
+            self.addFunction('init', 'setCheckpoint', "r'%s', %s, %d" % (self.findParam('ckptfile').value(), self.findParam('ckptresume').value(),
+                                                                        self.findParam('ckptinterval').value()))
         else:
-            brange_bf = [0]
-            brange_df = brange
-
-
-        for bnum_df in brange_df:
-            tstart = 0
-            tend = self._reportingInterval
-
-            while tstart < numtraces:
-                if tend > numtraces:
-                    tend = numtraces
-
-                if tstart > numtraces:
-                    tstart = numtraces
-
-
-                data = []
-                textins = []
-                textouts = []
-                knownkeys = []
-                for i in range(tstart, tend):
+            self.delFunction('init', 'setCheckpoint')
 
-                    # Handle Offset
-                    tnum = i + tracerange[0]
+    def setVectorized(self, vectorized):
+        """If True use the model's leakageMatrix() to process all 256 guesses at once, when available"""
+        self._vectorized = vectorized
 
-                    d = tracedata.getTrace(tnum)
+    def setCenteredAccumulator(self, centered):
+        """If True track centered means & co-moments instead of raw sums, see CPACenteredAccumulator"""
+        self._centered = centered
 
-                    if d is None:
-                        continue
+    def setPeaksOnly(self, peaks, envelopeBins=1000):
+        """
+        If True the statistics only get the CorrelationPeaks of each subkey instead of the full correlation, with
+        the output envelope over envelopeBins bins of points (0 for none) for plotting
+        """
+        self._peaksOnly = peaks
+        self._envelopeBins = envelopeBins
 
-                    data.append(d)
-                    textins.append(tracedata.getTextin(tnum))
-                    textouts.append(tracedata.getTextout(tnum))
-                    knownkeys.append(tracedata.getKnownKey(tnum))
+    def _accumulatorClass(self):
+        if self._centered:
+            return CPACenteredAccumulator
+        return CPAAccumulator
 
-                traces = np.array(data)
-                textins = np.array(textins)
-                textouts = np.array(textouts)
-                # knownkeys = np.array(knownkeys)
+    def _outputArgs(self):
+        return {'vectorized':self._vectorized, 'centered':self._centered, 'peaks':self._peaksOnly, 'envelopeBins':self._envelopeBins}
 
-                for bnum_bf in brange_bf:
-
-                    if bf:
-                        bnum = bnum_bf
-                    else:
-                        bnum = bnum_df
-
-
-                    skip = False
-                    if (self.stats.simplePGE(bnum) != 0) or (skipPGE == False):
-                        if isinstance(pointRange, list):
-                            bptrange = pointRange[bnum]
-                        else:
-                            bptrange = pointRange
-                        (data, pbcnt) = cpa[bnum].oneSubkey(bnum, bptrange, traces, tend - tstart, textins, textouts, knownkeys, progressBar, self.model, self.leakage, cpa[bnum].modelstate, pbcnt)
-                        self.stats.updateSubkey(bnum, data, tnum=tend)
-                    else:
-                        skip = True
-
-                    if progressBar.wasSkipped() or skip:
-                        progressBar.clearSkipped()
-                        pbcnt = brangeMap[bnum] * 256 * (numtraces / self._reportingInterval + 1)
-
-                        if bf is False:
-                            tstart = numtraces
+    def paramList(self):
+        return [self.params]
 
-                tend += self._reportingInterval
-                tstart += self._reportingInterval
+    def setTargetBytes(self, brange):
+        self.brange = brange
 
-                if self.sr is not None:
-                    self.sr()
+    def setReportingInterval(self, ri):
+        self._reportingInterval = ri
 
     def getStatistics(self):
         return self.stats
@@ -35,6 +35,8 @@ from pyqtgraph.parametertree import Parameter
 
 from openadc.ExtendedParameter import ExtendedParameter
 from chipwhisperer.analyzer.attacks.AttackStats import DataTypeDiffs
+from chipwhisperer.analyzer.attacks.CPAAccumulator import CPAAccumulator
+from chipwhisperer.analyzer.attacks.ParallelSubkeys import ProgressiveSubkeysMixin
 from chipwhisperer.common.autoscript import AutoScript
 
 
@@ -128,6 +130,31 @@ class CPAProgressiveOneSubkey(object):
 
     def clearStats(self):
         self.anstate = None
+        self._pendingAcc = None
+
+    def getAccumulator(self):
+        """Return a copy of the running sums as a CPAAccumulator"""
+        if self.anstate is None:
+            if self._pendingAcc is not None:
+                return self._pendingAcc
+            return CPAAccumulator()
+
+        acc = CPAAccumulator()
+        acc.sumh = np.array(self.anstate._sumh)
+        acc.sumhq = np.array(self.anstate._sumhq)
+        acc.sumt = np.array(self.anstate._sumt)
+        acc.sumtq = np.array(self.anstate._sumtq)
+        acc.sumht = np.array(self.anstate._sumht)
+        acc.totalTraces = self.anstate.totalTraces
+        return acc
+
+    def setAccumulator(self, acc):
+        """Continue from the state in a CPAAccumulator. Loaded into the C state once the trace size is known"""
+        if not isinstance(acc, CPAAccumulator):
+            raise ValueError("C accelerated CPA only keeps raw sums, can't continue from a %s" % type(acc).__name__)
+        self.clearStats()
+        if not acc.isEmpty():
+            self._pendingAcc = acc
 
     def oneSubkey(self, bnum, pointRange, traces_all, numtraces, plaintexts, ciphertexts, knownkeys, progressBar, model, leakagetype, state, pbcnt):
 
@@ -137,10 +164,25 @@ class CPAProgressiveOneSubkey(object):
             # traces = np.array(traces_all[:, pointRange[0] : pointRange[1]])
             traces = traces_all[:, pointRange[0] : pointRange[1]]
 
+        #C code needs contiguous arrays of the right type, the block may be a view of the stored traces
+        traces = np.ascontiguousarray(traces, dtype=np.float64)
+        plaintexts = np.ascontiguousarray(plaintexts, dtype=np.uint8)
+        ciphertexts = np.ascontiguousarray(ciphertexts, dtype=np.uint8)
+
         npoints = np.shape(traces)[1]
 
         if self.anstate is None:
             self.anstate = analysis_state_t(npoints, numtraces)
+
+            if self._pendingAcc is not None:
+                #Copy in-place, as the C pointers reference these arrays
+                self.anstate._sumh[:] = self._pendingAcc.sumh
+                self.anstate._sumhq[:] = self._pendingAcc.sumhq
+                self.anstate._sumt[:] = self._pendingAcc.sumt
+                self.anstate._sumtq[:] = self._pendingAcc.sumtq
+                self.anstate._sumht[:] = self._pendingAcc.sumht
+                self.anstate.totalTraces = self._pendingAcc.totalTraces
+                self._pendingAcc = None
             
         mstate = aesmodel_setup_t(bnum=bnum)
         
@@ -172,17 +214,24 @@ class CPAProgressiveOneSubkey(object):
 
         return (guessdata, pbcnt)
 
-class CPAProgressive_CAccel(AutoScript, QObject):
+class CPAProgressive_CAccel(ProgressiveSubkeysMixin, AutoScript, QObject):
     """
     CPA Attack done as a loop, but using an algorithm which can progressively add traces & give output stats
     """
     paramListUpdated = Signal(list)
+    oneSubkeyClass = CPAProgressiveOneSubkey
 
     def __init__(self, targetModel, leakageFunction, showScriptParameter=None, parent=None):
         super(CPAProgressive_CAccel, self).__init__()
 
         resultsParams = [{'name':'Iteration Mode', 'key':'itmode', 'type':'list', 'values':{'Depth-First':'df', 'Breadth-First':'bf'}, 'value':'bf'},
                          {'name':'Skip when PGE=0', 'key':'checkpge', 'type':'bool', 'value':False},
+                         {'name':'Parallel Subkeys', 'key':'parmode', 'type':'list', 'values':{'Off':'off', 'Threads':'thread', 'Processes':'process'}, 'value':'off', 'set':self.updateScript},
+                         {'name':'Parallel Workers (0=All Cores)', 'key':'parjobs', 'type':'int', 'value':0, 'limits':(0, 256), 'set':self.updateScript},
+                         {'name':'Checkpoint File', 'key':'ckptfile', 'type':'str', 'value':'', 'set':self.updateScript},
+                         {'name':'Resume from Checkpoint', 'key':'ckptresume', 'type':'bool', 'value':False, 'set':self.updateScript},
+                         {'name':'Checkpoint Interval (Traces)', 'key':'ckptinterval', 'type':'int', 'value':10000, 'limits':(0, 1E9), 'set':self.updateScript,
+                          'tip':'Traces between checkpoint saves, 0 to save after every reporting interval'},
                          ]
         self.params = Parameter.create(name='Progressive CPA', type='group', children=resultsParams)
         if showScriptParameter is not None:
@@ -195,10 +244,17 @@ class CPAProgressive_CAccel(AutoScript, QObject):
         self.sr = None
 
         self.stats = DataTypeDiffs()
+        self.setParallelMode('off')
+        self.setCheckpoint(None)
         self.updateScript()
 
     def updateScript(self, ignored=None):
-        pass
+        self.addFunction('init', 'setParallelMode', "'%s', %d" % (self.findParam('parmode').value(), self.findParam('parjobs').value()))
+        if self.findParam('ckptfile').value():
+            self.addFunction('init', 'setCheckpoint', "r'%s', %s, %d" % (self.findParam('ckptfile').value(), self.findParam('ckptresume').value(),
+                                                                        self.findParam('ckptinterval').value()))
+        else:
+            self.delFunction('init', 'setCheckpoint')
 
     def paramList(self):
         return [self.params]
@@ -209,116 +265,6 @@ class CPAProgressive_CAccel(AutoScript, QObject):
     def setReportingInterval(self, ri):
         self._reportingInterval = ri
 
-    def addTraces(self, tracedata, tracerange, progressBar=None, pointRange=None):
-        brange=self.brange
-
-        foundkey = []
-
-        self.all_diffs = range(0,16)
-
-        numtraces = tracerange[1] - tracerange[0]
-
-        if progressBar:
-            pbcnt = 0
-            progressBar.setMinimum(0)
-            progressBar.setMaximum(len(brange) * 256 * (numtraces / self._reportingInterval + 1))
-
-        pbcnt = 0
-        #r = Parallel(n_jobs=4)(delayed(traceOneSubkey)(bnum, pointRange, traces_all, numtraces, plaintexts, ciphertexts, keyround, modeltype, progressBar, self.model, pbcnt) for bnum in brange)
-        #self.all_diffs, pb = zip(*r)
-        #pbcnt = 0
-        cpa = [None]*(max(brange)+1)
-        for bnum in brange:
-            cpa[bnum] = CPAProgressiveOneSubkey()
-
-        brangeMap = [None]*(max(brange)+1)
-        i = 1
-        for bnum in brange:
-            brangeMap[bnum] = i
-            i += 1
-
-        skipPGE = False  # self.findParam('checkpge').value()
-        bf = True  # self.findParam('itmode').value() == 'bf'
-
-        #bf specifies a 'breadth-first' search. bf means we search across each
-        #subkey by only the amount of traces specified. Depth-First means we
-        #search each subkey completely, then move onto the next.
-        if bf:
-            brange_df = [0]
-            brange_bf = brange
-        else:
-            brange_bf = [0]
-            brange_df = brange
-
-
-        for bnum_df in brange_df:
-
-            tstart = 0
-            tend = self._reportingInterval
-
-            while tstart < numtraces:
-                if tend > numtraces:
-                    tend = numtraces
-
-                if tstart > numtraces:
-                    tstart = numtraces
-
-                data = []
-                textins = []
-                textouts = []
-                knownkeys = []
-                for i in range(tstart, tend):
-
-                    # Handle Offset
-                    tnum = i + tracerange[0]
-
-                    d = tracedata.getTrace(tnum)
-
-                    if d is None:
-                        continue
-
-                    data.append(d)
-                    textins.append(tracedata.getTextin(tnum))
-                    textouts.append(tracedata.getTextout(tnum))
-                    knownkeys.append(tracedata.getKnownKey(tnum))
-
-                traces = np.array(data)
-                textins = np.array(textins)
-                textouts = np.array(textouts)
-
-
-                for bnum_bf in brange_bf:
-
-                    if bf:
-                        bnum = bnum_bf
-                    else:
-                        bnum = bnum_df
-
-
-                    skip = False
-                    if (self.stats.simplePGE(bnum) != 0) or (skipPGE == False):
-                        if isinstance(pointRange, list):
-                            bptrange = pointRange[bnum]
-                        else:
-                            bptrange = pointRange
-                        (data, pbcnt) = cpa[bnum].oneSubkey(bnum, bptrange, traces, tend - tstart, textins, textouts, knownkeys, progressBar, self.model, self.leakage, cpa[bnum].modelstate, pbcnt)
-                        self.stats.updateSubkey(bnum, data, tnum=tend)
-                    else:
-                        skip = True
-
-                    if progressBar.wasSkipped() or skip:
-                        progressBar.clearSkipped()
-                        pbcnt = brangeMap[bnum] * 256 * (numtraces / self._reportingInterval + 1)
-
-                        if bf is False:
-                            tstart = numtraces
-
-                tend += self._reportingInterval
-                tstart += self._reportingInterval
-
-                if self.sr is not None:
-                    self.sr()
-
     def getStatistics(self):
         return self.stats
 
@@ -36,6 +36,7 @@ except ImportError:
 
 import numpy as np
 from chipwhisperer.analyzer.attacks.AttackStats import DataTypeDiffs
+from chipwhisperer.common.traces.utils import getTraceBlockData
 
 class CPASimpleLoop(QObject):
     """
@@ -151,31 +152,9 @@ class CPASimpleLoop(QObject):
             progressBar.setMinimum(0)
             progressBar.setMaximum(len(brange) * 256)
 
-        numtraces = tracerange[1] - tracerange[0]
-
         # Load all traces
-        data = []
-        textins = []
-        textouts = []
-        knownkeys = []
-        for i in range(tracerange[0], tracerange[1]):
-
-            # Handle Offset
-            tnum = i + tracerange[0]
-
-            d = tracedata.getTrace(tnum)
-
-            if d is None:
-                continue
-
-            data.append(d)
-            textins.append(tracedata.getTextin(tnum))
-            textouts.append(tracedata.getTextout(tnum))
-            knownkeys.append(tracedata.getKnownKey(tnum))
-
-        traces = np.array(data)
-        textins = np.array(textins)
-        textouts = np.array(textouts)
+        (traces, textins, textouts, knownkeys) = getTraceBlockData(tracedata, tracerange[0], tracerange[1])
+        numtraces = len(traces)
 
         pbcnt = 0
         for bnum in brange:
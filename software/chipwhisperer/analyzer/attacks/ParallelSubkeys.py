@@ -0,0 +1,433 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Authors: Colin O'Flynn
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+import importlib
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from multiprocessing.sharedctypes import RawArray
+import traceback
+
+import numpy as np
+
+from chipwhisperer.analyzer.attacks.CPAAccumulator import CPAAccumulator, accumulatorsExist, loadAccumulators, saveAccumulators
+from chipwhisperer.common.traces.utils import getTraceBlockData
+
+def _subkeyWorker(conn, oneSubkeyClass, modelName, leakage, brange, tracebuf, diffbuf, maxtraces, npoints, kwargs):
+    """Worker process: owns the accumulators for the subkeys in brange, reads traces from tracebuf"""
+    model = importlib.import_module(modelName)
+    cpa = {}
+    for bnum in brange:
+        cpa[bnum] = oneSubkeyClass()
+
+    traces_all = np.frombuffer(tracebuf, dtype=np.float64).reshape(maxtraces, npoints)
+    diffs_all = None
+    if not kwargs.get('peaks'):
+        diffs_all = np.frombuffer(diffbuf, dtype=np.float64).reshape(len(brange), 256, npoints)
+
+    while True:
+        cmd = conn.recv()
+        if cmd is None:
+            break
+
+        if cmd[0] == 'getstate':
+            conn.send(dict((bnum, cpa[bnum].getAccumulator()) for bnum in brange))
+            continue
+
+        if cmd[0] == 'setstate':
+            for bnum in brange:
+                cpa[bnum].setAccumulator(cmd[1][bnum])
+            continue
+
+        (numtraces, plaintexts, ciphertexts, knownkeys, pointRanges) = cmd[1:]
+        try:
+            #Full outputs go through the shared buffer (sending the width), others such as CorrelationPeaks are small enough to send
+            widths = {}
+            for i, bnum in enumerate(brange):
+                (data, _) = cpa[bnum].oneSubkey(bnum, pointRanges[bnum], traces_all[0:numtraces], numtraces, plaintexts,
+                                               ciphertexts, knownkeys, None, model, leakage, cpa[bnum].modelstate, 0, **kwargs)
+                if kwargs.get('peaks'):
+                    widths[bnum] = data
+                    continue
+                data = np.asarray(data)
+                widths[bnum] = data.shape[1]
+                diffs_all[i, :, 0:widths[bnum]] = data
+            conn.send(widths)
+        except Exception:
+            conn.send(traceback.format_exc())
+
+    conn.close()
+
+class SubkeyParallelRunner(object):
+    """
+    Runs the per-subkey CPA engines (e.g. CPAProgressiveOneSubkey) for several subkeys at once. Each subkey
+    has independent accumulators, so they can be split across cores:
+
+    'thread'  - Uses a thread pool on the caller's oneSubkey objects. Only helpful for engines where the
+                heavy lifting releases the GIL (NumPy matrix products, the C accelerated library).
+    'process' - Subkeys are divided between worker processes which own their accumulators. The trace
+                block is copied once into shared memory instead of being pickled per worker, and the
+                results come back through a shared buffer.
+    """
+
+    def __init__(self, oneSubkeyClass, model, leakage, brange, mode='thread', jobs=0, kwargs=None):
+        if mode not in ('thread', 'process'):
+            raise ValueError("Invalid parallel mode: %s" % str(mode))
+
+        if jobs is None or jobs < 1:
+            jobs = multiprocessing.cpu_count()
+
+        self.oneSubkeyClass = oneSubkeyClass
+        self.model = model
+        self.leakage = leakage
+        self.brange = list(brange)
+        self.mode = mode
+        self.jobs = min(jobs, len(self.brange))
+        self.kwargs = kwargs if kwargs is not None else {}
+        self.cpa = None
+        self._pool = None
+        self._workers = []
+
+    def start(self, cpa, traces):
+        """
+        Start the workers. cpa is the list of oneSubkey objects (only used in 'thread' mode), traces is
+        the first trace block, used to size the shared buffers in 'process' mode. If a later block is
+        larger the workers are restarted with bigger buffers.
+        """
+        self.cpa = cpa
+
+        if self.mode == 'thread':
+            self._pool = ThreadPool(self.jobs)
+            return
+
+        #Workers start from the state of the caller's objects, which is non-empty when resuming
+        self._startWorkers(dict((bnum, cpa[bnum].getAccumulator()) for bnum in self.brange), np.shape(traces))
+
+    def _startWorkers(self, accs, shape):
+        """Start the worker processes with shared buffers for blocks of up to shape traces, restoring accs"""
+        (maxtraces, npoints) = shape
+        self._maxtraces = maxtraces
+        self._npoints = npoints
+        self._tracebuf = RawArray('d', maxtraces * npoints)
+        self._traces = np.frombuffer(self._tracebuf, dtype=np.float64).reshape(maxtraces, npoints)
+
+        for w in range(0, self.jobs):
+            wrange = self.brange[w::self.jobs]
+            if self.kwargs.get('peaks'):
+                #Results are sent through the pipe
+                diffbuf = RawArray('d', 1)
+                diffs = None
+            else:
+                diffbuf = RawArray('d', len(wrange) * 256 * npoints)
+                diffs = np.frombuffer(diffbuf, dtype=np.float64).reshape(len(wrange), 256, npoints)
+            (conn, childconn) = multiprocessing.Pipe()
+            p = multiprocessing.Process(target=_subkeyWorker, args=(childconn, self.oneSubkeyClass, self.model.__name__, self.leakage,
+                                                                     wrange, self._tracebuf, diffbuf, maxtraces, npoints, self.kwargs))
+            p.daemon = True
+            p.start()
+            self._workers.append((p, conn, wrange, diffs))
+            conn.send(('setstate', dict((bnum, accs[bnum]) for bnum in wrange)))
+
+    def run(self, traces, numtraces, plaintexts, ciphertexts, knownkeys, pointRanges):
+        """
+        Add one block of traces to every subkey. pointRanges is a dictionary of bnum: pointRange. Returns a
+        dictionary of bnum: diffs, where each diffs array is a copy owned by the caller.
+        """
+        if self.mode == 'thread':
+            def oneSubkey(bnum):
+                (data, _) = self.cpa[bnum].oneSubkey(bnum, pointRanges[bnum], traces, numtraces, plaintexts, ciphertexts, knownkeys,
+                                                     None, self.model, self.leakage, self.cpa[bnum].modelstate, 0, **self.kwargs)
+                return data
+
+            results = self._pool.map(oneSubkey, self.brange)
+            return dict(zip(self.brange, results))
+
+        ntraces = len(traces)
+        if ntraces > self._maxtraces or np.shape(traces)[1] != self._npoints:
+            #The shared buffers are inherited when the workers start, so they can't be resized in place. Restart
+            #the workers with buffers big enough for this block, carrying their accumulators over.
+            accs = self.getAccumulators()
+            self.close()
+            self._startWorkers(accs, (max(ntraces, self._maxtraces), np.shape(traces)[1]))
+        self._traces[0:ntraces] = traces
+
+        for (p, conn, wrange, diffs) in self._workers:
+            conn.send(('add', ntraces, plaintexts, ciphertexts, knownkeys, pointRanges))
+
+        results = {}
+        for (p, conn, wrange, diffs) in self._workers:
+            widths = conn.recv()
+            if not isinstance(widths, dict):
+                raise RuntimeError("Subkey worker failed:\n%s" % widths)
+            for i, bnum in enumerate(wrange):
+                if diffs is None:
+                    results[bnum] = widths[bnum]
+                else:
+                    results[bnum] = np.array(diffs[i, :, 0:widths[bnum]])
+        return results
+
+    def getAccumulators(self):
+        """Returns a dictionary of bnum: CPAAccumulator with the current state of every subkey"""
+        if self.mode == 'thread':
+            return dict((bnum, self.cpa[bnum].getAccumulator()) for bnum in self.brange)
+
+        accs = {}
+        for (p, conn, wrange, diffs) in self._workers:
+            conn.send(('getstate',))
+        for (p, conn, wrange, diffs) in self._workers:
+            accs.update(conn.recv())
+        return accs
+
+    def close(self):
+        """Stop all workers"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+        for (p, conn, wrange, diffs) in self._workers:
+            try:
+                conn.send(None)
+            except IOError:
+                pass
+            p.join()
+        self._workers = []
+
+class ProgressiveSubkeysMixin(object):
+    """
+    Trace block loop shared by the progressive CPA attacks (CPAProgressive, CPAProgressive_CAccel): reporting
+    intervals, checkpoints and parallel subkeys. The attack class provides oneSubkeyClass, the per-subkey engine,
+    and may override _outputArgs() to pass extra keyword arguments to its oneSubkey().
+    """
+
+    oneSubkeyClass = None
+
+    def _outputArgs(self):
+        return {}
+
+    def _accumulatorClass(self):
+        """Accumulator type the subkey engines keep with the current settings, checkpoints must match it"""
+        return CPAAccumulator
+
+    def setParallelMode(self, mode, jobs=0):
+        """Process subkeys in parallel: mode is 'off', 'thread' or 'process', jobs=0 uses all cores"""
+        self._parallelMode = mode
+        self._parallelJobs = jobs
+
+    def setCheckpoint(self, fname, resume=False, interval=10000):
+        """
+        Save the running sums to fname every interval traces (at the end of a reporting interval, 0 for every one)
+        and once all traces are done. If resume is True and fname exists, the attack continues from the saved
+        state instead of restarting from the first trace.
+        """
+        self._checkpointFile = fname
+        self._checkpointResume = resume
+        self._checkpointInterval = interval
+
+    def addTraces(self, tracedata, tracerange, progressBar=None, pointRange=None):
+        brange=self.brange
+
+        self.all_diffs = range(0,16)
+
+        numtraces = tracerange[1] - tracerange[0]
+
+        if progressBar:
+            pbcnt = 0
+            progressBar.setMinimum(0)
+            progressBar.setMaximum(len(brange) * 256 * (numtraces / self._reportingInterval + 1))
+
+        cpa = [None]*(max(brange)+1)
+        for bnum in brange:
+            cpa[bnum] = self.oneSubkeyClass()
+
+        brangeMap = [None]*(max(brange)+1)
+        i = 1
+        for bnum in brange:
+            brangeMap[bnum] = i
+            i += 1
+
+        skipPGE = False  # self.findParam('checkpge').value()
+        bf = True  # self.findParam('itmode').value() == 'bf'
+
+        #bf specifies a 'breadth-first' search. bf means we search across each
+        #subkey by only the amount of traces specified. Depth-First means we
+        #search each subkey completely, then move onto the next.
+        if bf:
+            brange_df = [0]
+            brange_bf = brange
+        else:
+            brange_bf = [0]
+            brange_df = brange
+
+        resumeFrom = self._loadCheckpoint(cpa, tracerange)
+        self._checkpointSaved = resumeFrom
+
+        #Parallel mode runs all subkeys for each block at once, so only applies to breadth-first
+        runner = None
+        if bf and self._parallelMode != 'off':
+            runner = SubkeyParallelRunner(self.oneSubkeyClass, self.model, self.leakage, brange, self._parallelMode,
+                                          self._parallelJobs, self._outputArgs())
+
+        try:
+            self._addTracesBlocks(tracedata, tracerange, progressBar, pointRange, brange_df, brange_bf, bf, cpa, brangeMap, skipPGE, runner, resumeFrom)
+        finally:
+            if runner is not None:
+                runner.close()
+
+    def _addTracesBlocks(self, tracedata, tracerange, progressBar, pointRange, brange_df, brange_bf, bf, cpa, brangeMap, skipPGE, runner, resumeFrom=0):
+        numtraces = tracerange[1] - tracerange[0]
+        pbcnt = 0
+
+        for bnum_df in brange_df:
+            tstart = resumeFrom
+            tend = resumeFrom + self._reportingInterval
+
+            while tstart < numtraces:
+                if tend > numtraces:
+                    tend = numtraces
+
+                if tstart > numtraces:
+                    tstart = numtraces
+
+                (traces, textins, textouts, knownkeys) = getTraceBlockData(tracedata, tstart + tracerange[0], tend + tracerange[0])
+
+                if runner is not None:
+                    pbcnt = self._runParallelBlock(runner, cpa, traces, tstart, tend, textins, textouts, knownkeys, progressBar, pointRange, pbcnt)
+                    self._saveCheckpoint(cpa, runner, tracerange, tend)
+                    tend += self._reportingInterval
+                    tstart += self._reportingInterval
+                    if self.sr is not None:
+                        self.sr()
+                    continue
+
+                for bnum_bf in brange_bf:
+
+                    if bf:
+                        bnum = bnum_bf
+                    else:
+                        bnum = bnum_df
+
+
+                    skip = False
+                    if (self.stats.simplePGE(bnum) != 0) or (skipPGE == False):
+                        if isinstance(pointRange, list):
+                            bptrange = pointRange[bnum]
+                        else:
+                            bptrange = pointRange
+                        (data, pbcnt) = cpa[bnum].oneSubkey(bnum, bptrange, traces, len(traces), textins, textouts, knownkeys, progressBar, self.model, self.leakage, cpa[bnum].modelstate, pbcnt, **self._outputArgs())
+                        self.stats.updateSubkey(bnum, data, tnum=tend)
+                    else:
+                        skip = True
+
+                    if progressBar.wasSkipped() or skip:
+                        progressBar.clearSkipped()
+                        pbcnt = brangeMap[bnum] * 256 * (numtraces / self._reportingInterval + 1)
+
+                        if bf is False:
+                            tstart = numtraces
+
+                self._saveCheckpoint(cpa, runner, tracerange, tend)
+                tend += self._reportingInterval
+                tstart += self._reportingInterval
+
+                if self.sr is not None:
+                    self.sr()
+
+    def _loadCheckpoint(self, cpa, tracerange):
+        """If resuming, load the checkpoint into the subkey engines and return the number of traces already done"""
+        if not self._checkpointFile or not self._checkpointResume or not accumulatorsExist(self._checkpointFile):
+            return 0
+
+        (accs, ckptrange) = loadAccumulators(self._checkpointFile)
+        if ckptrange is None or ckptrange[0] != tracerange[0]:
+            print "Checkpoint %s does not start at trace %d, not resuming" % (self._checkpointFile, tracerange[0])
+            return 0
+
+        expected = self._accumulatorClass()
+        for bnum in self.brange:
+            if bnum in accs and type(accs[bnum]) is not expected:
+                raise ValueError("Checkpoint %s holds a %s for subkey %d but this attack uses a %s, set the accumulator "
+                                 "mode to match or disable resuming" % (self._checkpointFile, type(accs[bnum]).__name__, bnum,
+                                                                        expected.__name__))
+
+        args = self._outputArgs()
+        for bnum in self.brange:
+            if bnum in accs:
+                cpa[bnum].setAccumulator(accs[bnum])
+                if not accs[bnum].isEmpty():
+                    if args.get('peaks'):
+                        data = accs[bnum].peaks(args.get('envelopeBins', 0))
+                    else:
+                        data = accs[bnum].correlation()
+                    self.stats.updateSubkey(bnum, data, tnum=ckptrange[1] - tracerange[0])
+
+        return min(ckptrange[1], tracerange[1]) - tracerange[0]
+
+    def _saveCheckpoint(self, cpa, runner, tracerange, tend):
+        if not self._checkpointFile:
+            return
+
+        #Each save writes every subkey's sums (and fetches them from the workers), so not every reporting interval
+        if tend < tracerange[1] - tracerange[0] and tend - self._checkpointSaved < self._checkpointInterval:
+            return
+        self._checkpointSaved = tend
+
+        if runner is not None and runner.cpa is not None:
+            accs = runner.getAccumulators()
+        else:
+            accs = dict((bnum, cpa[bnum].getAccumulator()) for bnum in self.brange)
+
+        saveAccumulators(self._checkpointFile, accs, (tracerange[0], tracerange[0] + tend))
+
+    def _runParallelBlock(self, runner, cpa, traces, tstart, tend, textins, textouts, knownkeys, progressBar, pointRange, pbcnt):
+        brange = self.brange
+        pointRanges = {}
+        for bnum in brange:
+            if isinstance(pointRange, list):
+                pointRanges[bnum] = pointRange[bnum]
+            else:
+                pointRanges[bnum] = pointRange
+
+        if runner.cpa is None:
+            runner.start(cpa, traces)
+
+        results = runner.run(traces, len(traces), textins, textouts, knownkeys, pointRanges)
+
+        #Merge back in subkey order, as the serial version would
+        for bnum in brange:
+            self.stats.updateSubkey(bnum, results[bnum], tnum=tend)
+
+            if progressBar:
+                pbcnt = pbcnt + 256
+                progressBar.setValue(pbcnt)
+                progressBar.updateStatus((tstart, tend), bnum)
+                if progressBar.wasCanceled():
+                    raise KeyboardInterrupt
+
+        if progressBar and progressBar.wasSkipped():
+            progressBar.clearSkipped()
+
+        return pbcnt
@@ -51,6 +51,7 @@ import chipwhisperer.analyzer.attacks.models.AES256_8bit as models_AES256_8bit
 from chipwhisperer.analyzer.attacks.AttackBaseClass import AttackBaseClass
 from chipwhisperer.analyzer.attacks.AttackProgressDialog import AttackProgressDialog
 from chipwhisperer.analyzer.attacks.ProfilingTemplate import ProfilingTemplate
+from chipwhisperer.common.traces.utils import getTraceBlockData
 
 from AttackGenericParameters import AttackGenericParameters
 
@@ -181,23 +182,9 @@ class Profiling(AttackBaseClass, AttackGenericParameters):
             endingTrace = self.getTraceNum() * itNum + self.getTraceStart()
 
             # print "%d-%d"%(startingPoint, endingPoint)
-            data = []
-            textins = []
-            textouts = []
-
             print "%d-%d"%(startingTrace, endingTrace)
 
-            for i in range(startingTrace, endingTrace):
-                d = self.trace.getTrace(i)
-
-                if d is None:
-                    continue
-
-                d = d[startingPoint:endingPoint]
-
-                data.append(d)
-                textins.append(self.trace.getTextin(i))
-                textouts.append(self.trace.getTextout(i))
+            (data, textins, textouts, _) = getTraceBlockData(self.trace, startingTrace, endingTrace, (startingPoint, endingPoint))
 
             #self.attack.clearStats()
             self.attack.setByteList(self.bytesEnabled())
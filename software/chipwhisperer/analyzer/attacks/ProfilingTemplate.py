@@ -65,6 +65,9 @@ class TemplateBasic(AutoScript, QObject):
     """
     scriptsUpdated = Signal()
 
+    #Number of traces fetched at once when generating templates
+    blockSize = 1000
+
     def __init__(self, tmanager=None):
         super(TemplateBasic, self).__init__()
         self._tmanager = None
@@ -114,15 +117,19 @@ class TemplateBasic(AutoScript, QObject):
             progressBar.setMinimum(0)
             progressBar.setMaximum(tend - tstart + subkeys)
 
-        for tnum in range(tstart, tend):
-            # partData = self.traceManager().getAuxData(tnum, self.partObject.attrDictPartition)["filedata"]
-            pnum = partMethod.getPartitionNum(self.traceManager(), tnum)
-            t = self.traceManager().getTrace(tnum)
-            for bnum in range(0, subkeys):
-                templateTraces[bnum][pnum[bnum]].append(t[poiList[bnum]])
+        for bstart in range(tstart, tend, self.blockSize):
+            bend = min(bstart + self.blockSize, tend)
+            validtnums = []
+            traces = self.traceManager().getTraceBlock(bstart, bend, None, validtnums)
+
+            for (t, tnum) in zip(traces, validtnums):
+                # partData = self.traceManager().getAuxData(tnum, self.partObject.attrDictPartition)["filedata"]
+                pnum = partMethod.getPartitionNum(self.traceManager(), tnum)
+                for bnum in range(0, subkeys):
+                    templateTraces[bnum][pnum[bnum]].append(t[poiList[bnum]])
 
             if progressBar:
-                progressBar.setValue(tnum - tstart)
+                progressBar.setValue(bend - tstart)
                 if progressBar.wasCanceled():
                     progressBar.setValue(progressBar.maximum())
                     return None
@@ -26,12 +26,39 @@
 #=================================================
 
 import numpy as np
+from scipy import stats
 
 
 class DataAnalysis(object):
+    """
+    Statistics over many repeated attacks, from the results saved by ResultsSave. Each record holds the max & min
+    output of every hypothesis for every subkey at one trace count, records with the same trace count are different
+    tests (attack runs) which get averaged.
+    """
+
+    #Records ranked at once, limits the size of the temporary (records x subkeys x hypotheses) arrays
+    blockSize = 4096
 
     def loadData(self, filename):
-        self.rawdata = np.load(filename)
+        try:
+            self.rawdata = np.load(filename)
+        except ValueError:
+            #Older files are a pickled list of dictionaries
+            self.rawdata = np.load(filename, allow_pickle=True)
+
+    def _stacked(self):
+        """Returns (trace counts, diffsmax, diffsmin) as arrays with one row per record"""
+        if self.rawdata.dtype.names:
+            tracecnt = self.rawdata['tracecnt']
+            diffsmax = self.rawdata['diffsmax']
+            diffsmin = self.rawdata['diffsmin']
+        else:
+            tracecnt = np.array([[-1 if t is None else t for t in r['tracecnt']] for r in self.rawdata])
+            diffsmax = np.array([r['diffsmax'] for r in self.rawdata], dtype=np.float64)
+            diffsmin = np.array([r['diffsmin'] for r in self.rawdata], dtype=np.float64)
+
+        #Subkeys without results have no trace count (-1)
+        return (np.max(tracecnt, axis=1), diffsmax, diffsmin)
 
     def setKnownkey(self, knownkey):
         numsubkeys = len(self.rawdata[0]["diffsmax"])
@@ -40,64 +67,97 @@ class DataAnalysis(object):
 
         self.knownkey = knownkey
 
+    def ranks(self, useAbs=True):
+        """
+        Returns (trace counts, PGE) with the PGE of every subkey in every record, as an array of (records x subkeys).
+        Hypotheses with equal outputs are ranked in descending numerical order (as the original per-record sort did),
+        PGE is 128 if the known key's output is NaN.
+        """
+        (tracecnt, diffsmax, diffsmin) = self._stacked()
+        (nrecords, nkeys, nhyp) = diffsmax.shape
+
+        knownkey = np.asarray(self.knownkey, dtype=np.int64)
+        valid = knownkey < nhyp
+        known = np.where(valid, knownkey, 0)
+        hyps = np.arange(0, nhyp)
+
+        pge = np.empty((nrecords, nkeys), dtype=np.int64)
+        for start in range(0, nrecords, self.blockSize):
+            end = min(start + self.blockSize, nrecords)
+            if useAbs:
+                #fmax ignores a NaN in either one
+                score = np.fmax(np.fabs(diffsmax[start:end]), np.fabs(diffsmin[start:end]))
+            else:
+                score = np.asarray(diffsmax[start:end], dtype=np.float64)
+
+            knownscore = score[:, np.arange(0, nkeys), known][:, :, np.newaxis]
+            with np.errstate(invalid='ignore'):
+                better = (score > knownscore) | ((score == knownscore) & (hyps > known[:, np.newaxis]))
+            block = better.sum(axis=2)
+            block[np.isnan(knownscore[:, :, 0])] = 128
+            pge[start:end] = block
+
+        pge[:, ~valid] = 255
+        return (tracecnt, pge)
+
+    def statistics(self, useAbs=True, confidence=0.95):
+        """
+        Results of all tests at each trace count, as a dictionary of arrays with one row per trace count:
+            traces   - trace count
+            tests    - number of tests (records) at this trace count
+            pge      - average partial guessing entropy of each subkey (traces x subkeys)
+            ge       - guessing entropy of the full key in bits, the average of sum(log2(PGE + 1)) over the subkeys
+            gsr      - global success rate, fraction of tests where every subkey has PGE 0
+        pgeLow/pgeHigh and geLow/geHigh are the confidence interval of the average (Student's t, NaN with only one test),
+        and gsrLow/gsrHigh the Wilson score interval of the success rate.
+        """
+        (tracecnt, pge) = self.ranks(useAbs)
+        ge = np.sum(np.log2(pge + 1.0), axis=1)
+        success = np.all(pge == 0, axis=1).astype(np.float64)
+
+        (traces, group) = np.unique(tracecnt, return_inverse=True)
+        tests = np.bincount(group).astype(np.float64)
+
+        def meanci(data):
+            """Mean & confidence interval of each column of data, per trace count"""
+            data = data.reshape(len(data), -1)
+            total = np.array([np.bincount(group, data[:, k], len(traces)) for k in range(0, data.shape[1])]).T
+            squares = np.array([np.bincount(group, np.square(data[:, k]), len(traces)) for k in range(0, data.shape[1])]).T
+            mean = total / tests[:, np.newaxis]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                var = np.maximum(squares - total * mean, 0) / (tests[:, np.newaxis] - 1)
+                width = stats.t.ppf((1 + confidence) / 2.0, tests - 1)[:, np.newaxis] * np.sqrt(var / tests[:, np.newaxis])
+            return (mean, mean - width, mean + width)
+
+        results = {'traces':traces, 'tests':tests.astype(np.int64)}
+        (results['pge'], results['pgeLow'], results['pgeHigh']) = meanci(pge.astype(np.float64))
+        (ge, low, high) = meanci(ge)
+        (results['ge'], results['geLow'], results['geHigh']) = (ge[:, 0], low[:, 0], high[:, 0])
+
+        gsr = np.bincount(group, success, len(traces)) / tests
+        z = stats.norm.ppf((1 + confidence) / 2.0)
+        centre = (gsr + z * z / (2 * tests)) / (1 + z * z / tests)
+        width = z * np.sqrt(gsr * (1 - gsr) / tests + z * z / (4 * tests * tests)) / (1 + z * z / tests)
+        results['gsr'] = gsr
+        #The interval always contains the estimate, but rounding can put the ends just past it when gsr is 0 or 1
+        results['gsrLow'] = np.minimum(centre - width, gsr)
+        results['gsrHigh'] = np.maximum(centre + width, gsr)
+
+        return results
 
     def calculate(self, useAbs=True):
+        """Returns a dictionary of trace count: {'pge':PGE of each subkey summed over tests, 'gsr':successful tests, 'tests':tests}"""
+        (tracecnt, pge) = self.ranks(useAbs)
+        success = np.all(pge == 0, axis=1)
 
-        nkeys = len(self.knownkey)
-        nhyp = len(self.rawdata[0]["diffsmax"][0])
-        ntests = len(self.rawdata)
-
+        (traces, group) = np.unique(tracecnt, return_inverse=True)
+        pgesum = np.array([np.bincount(group, pge[:, k], len(traces)) for k in range(0, pge.shape[1])]).T
+        gsr = np.bincount(group, success, len(traces))
+        tests = np.bincount(group, minlength=len(traces))
 
         data = {}
-
-
-        for tindex in range(0, ntests):
-
-            tnum = self.rawdata[tindex]["tracecnt"][0]
-
-            print tnum
-
-            if tnum not in data.keys():
-                data[tnum] = {'pge':[0] * nkeys, 'gsr':0, 'tests':0}
-
-            pge = [0] * nkeys
-            maxes = [0] * nkeys
-            for i in range(0, nkeys):
-                maxes[i] = np.zeros(nhyp, dtype=[('hyp', 'i2'), ('value', 'f8')])
-
-            for i in range(0, nkeys):
-                for hyp in range(0, nhyp):
-                    if useAbs:
-                        v1 = abs(self.rawdata[tindex]["diffsmax"][i][hyp])
-                        v2 = abs(self.rawdata[tindex]["diffsmin"][i][hyp])
-                        mvalue = max(v1, v2)
-                    else:
-                        mvalue = self.rawdata[tindex]["diffsmax"][i][hyp]
-
-                    maxes[i][hyp]['hyp'] = hyp
-                    maxes[i][hyp]['value'] = mvalue
-
-                    # TODO: workaround for PGE, as NaN's get ranked first
-                    numnans = np.isnan(maxes[i]['value']).sum()
-
-                    maxes[i].sort(order='value')
-                    maxes[i] = maxes[i][::-1]
-
-                    try:
-                        pge[i] = np.where(maxes[i]['hyp'] == self.knownkey[i])[0][0] - numnans
-                        if pge[i] < 0:
-                            pge[i] = 128
-                    except IndexError:
-                        pge[i] = 255
-
-            if all(v == 0 for v in pge):
-                gsr = 1
-            else:
-                gsr = 0
-
-            data[tnum]['pge'] = [data[tnum]['pge'][k] + pge[k] for k in range(0, len(pge))]
-            data[tnum]['gsr'] += gsr
-            data[tnum]['tests'] += 1
+        for i, tnum in enumerate(traces):
+            data[tnum] = {'pge':[int(v) for v in pgesum[i]], 'gsr':int(gsr[i]), 'tests':int(tests[i])}
 
         return data
 
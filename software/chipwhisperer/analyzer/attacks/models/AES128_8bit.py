@@ -26,6 +26,7 @@
 
 from chipwhisperer.analyzer.models.aes.funcs import sbox, inv_sbox
 from chipwhisperer.analyzer.models.aes.key_schedule import keyScheduleRounds
+import numpy as np
 try:
     # OrderedDict is new in 2.7
     from collections import OrderedDict
@@ -71,6 +72,12 @@ SHIFT = []
 
 INVSHIFT = [0, 5, 10, 15, 4, 9, 14, 3, 8, 13, 2, 7, 12, 1, 6, 11]
 
+#Lookup tables used by leakageMatrix()
+_HW8BitTable = np.array(HW8Bit, dtype=np.uint8)
+_sboxTable = np.array([sbox(n) for n in range(0, 256)], dtype=np.uint8)
+_invSboxTable = np.array([inv_sbox(n) for n in range(0, 256)], dtype=np.uint8)
+_allGuesses = np.arange(0, 256, dtype=np.uint8)
+
 
 def processKnownKey(setting, inpkey):
 
@@ -111,6 +118,38 @@ def leakage(pt, ct, guess, bnum, setting, state):
     else:
         raise ValueError("Invalid setting: %s" % str(setting))
 
+def leakageMatrix(pt, ct, bnum, setting, state):
+    """
+    Vectorized version of leakage(), which returns the hypothetical leakage for all 256 guesses
+    at once as a (numtraces x 256) array. pt & ct are 2-D arrays (one row per trace). Returns
+    None if the setting has no vectorized version, in which case call leakage() per trace.
+    """
+
+    if setting == LEAK_HW_SBOXOUT_FIRSTROUND:
+        st1 = np.bitwise_xor.outer(np.asarray(pt, dtype=np.uint8)[:, bnum], _allGuesses)
+        return _HW8BitTable[_sboxTable[st1]]
+
+    elif setting == LEAK_HW_INVSBOXOUT_FIRSTROUND:
+        st1 = np.bitwise_xor.outer(np.asarray(pt, dtype=np.uint8)[:, bnum], _allGuesses)
+        return _HW8BitTable[_invSboxTable[st1]]
+
+    elif setting == LEAK_HD_LASTROUND_STATE:
+        ct = np.asarray(ct, dtype=np.uint8)
+        st10 = ct[:, INVSHIFT[bnum]]
+        st9 = _invSboxTable[np.bitwise_xor.outer(ct[:, bnum], _allGuesses)]
+        return _HW8BitTable[np.bitwise_xor(st9, st10[:, np.newaxis])]
+
+    elif setting == LEAK_HD_SBOX_IN_OUT:
+        st1 = np.bitwise_xor.outer(np.asarray(pt, dtype=np.uint8)[:, bnum], _allGuesses)
+        st2 = _sboxTable[st1]
+        return _HW8BitTable[np.bitwise_xor(st1, st2)]
+
+    elif setting == LEAK_HD_SBOX_IN_SUCCESSIVE or setting == LEAK_HD_SBOX_OUT_SUCCESSIVE:
+        return None
+
+    else:
+        raise ValueError("Invalid setting: %s" % str(setting))
+
 def getHW(var):
     """Given a variable, return the hamming weight (number of 1's)"""
     return HW8Bit[var]
@@ -79,3 +79,10 @@ class AddNoiseRandom(PreprocessingBase):
             
         else:
             return self.trace.getTrace(n)
+
+    def getTraceBlock(self, start, end, pointRange=None, valid=None):
+        if self.enabled and self._maxNoise != 0:
+            traces = self.trace.getTraceBlock(start, end, pointRange, valid)
+            return traces + np.random.normal(scale=self._maxNoise, size=np.shape(traces))
+        else:
+            return self.trace.getTraceBlock(start, end, pointRange, valid)
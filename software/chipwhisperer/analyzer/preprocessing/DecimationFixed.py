@@ -91,3 +91,10 @@ class DecimationFixed(PreprocessingBase):
             return self.trace.getTrace(n)       
     
    
+
+    def getTraceBlock(self, start, end, pointRange=None, valid=None):
+        if self.enabled:
+            traces = self.trace.getTraceBlock(start, end, None, valid)
+            return self.applyPointRange(traces[:, ::self._decfactor], pointRange)
+        else:
+            return self.trace.getTraceBlock(start, end, pointRange, valid)
@@ -105,3 +105,9 @@ class Filter(PreprocessingBase):
         else:
             return self.trace.getTrace(n)       
 
+    def getTraceBlock(self, start, end, pointRange=None, valid=None):
+        if self.enabled:
+            traces = self.trace.getTraceBlock(start, end, None, valid)
+            return self.applyPointRange(sp.signal.lfilter(self.b, self.a, traces, axis=1), pointRange)
+        else:
+            return self.trace.getTraceBlock(start, end, pointRange, valid)
@@ -57,15 +57,25 @@ class NormBase(QWidget):
     def loadZFile(self, f):
         pass
 
+    def processBlock(self, traces, tindexes):
+        """Process a 2-D block of traces, tindexes is the trace number of each row"""
+        return np.array([self.processTrace(t, tindex) for (t, tindex) in zip(traces, tindexes)])
+
 class normmean(NormBase):
     """Normalize by mean (e.g. make traces zero-mean)"""
     def processTrace(self, t, tindex):
         return t - np.mean(t)
 
+    def processBlock(self, traces, tindexes):
+        return traces - np.mean(traces, axis=1)[:, np.newaxis]
+
 class normmeanstd(NormBase):
     """Normalize by mean & std-dev """
     def processTrace(self, t, tindex):
         return (t - np.mean(t)) / np.std(t)
+
+    def processBlock(self, traces, tindexes):
+        return (traces - np.mean(traces, axis=1)[:, np.newaxis]) / np.std(traces, axis=1)[:, np.newaxis]
         
 class normlinfunc(NormBase):
     """Normalize by two polynomial functions based on additional information"""
@@ -114,6 +124,19 @@ class normlinfunc(NormBase):
 
         return (t - f1) / f2
 
+    def processBlock(self, traces, tindexes):
+        if isinstance(self.f1coeff, (int, long)) and self.f1coeff == 0:
+            f1 = 0
+        else:
+            f1 = np.polyval(self.f1coeff, self.zdata[tindexes])[:, np.newaxis]
+
+        if isinstance(self.f2coeff, (int, long)) and self.f2coeff == 1:
+            f2 = 1
+        else:
+            f2 = np.polyval(self.f2coeff, self.zdata[tindexes])[:, np.newaxis]
+
+        return (traces - f1) / f2
+
 
 
 class Normalize(PreprocessingBase):
@@ -234,6 +257,19 @@ class Normalize(PreprocessingBase):
         else:
             return self.trace.getTrace(n)
 
+    def getTraceBlock(self, start, end, pointRange=None, valid=None):
+        if self.enabled:
+            tindexes = []
+            traces = self.trace.getTraceBlock(start, end, None, tindexes)
+            if valid is not None:
+                valid.extend(tindexes)
+            if len(traces) == 0:
+                return traces
+            proc = self.norm.processBlock(traces, np.array(tindexes))
+            return self.applyPointRange(proc, pointRange)
+        else:
+            return self.trace.getTraceBlock(start, end, pointRange, valid)
+
     # def init(self):
     #    if self.ptEnd == 0:
     #        points = np.shape(self.trace.getTrace(0))[0]
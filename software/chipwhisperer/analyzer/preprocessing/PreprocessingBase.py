@@ -37,6 +37,7 @@ except ImportError:
 from openadc.ExtendedParameter import ExtendedParameter
 from pyqtgraph.parametertree import Parameter
 from chipwhisperer.common.autoscript import AutoScript
+import numpy as np
 
 class PreprocessingBase(AutoScript, QObject):
     """
@@ -85,6 +86,33 @@ class PreprocessingBase(AutoScript, QObject):
         else:
             return self.trace.getTrace(n)
 
+    def getTraceBlock(self, start, end, pointRange=None, valid=None):
+        """
+        Get traces start to end-1 as a 2-D array. Modules should override this with a batched version of
+        getTrace(), otherwise getTrace() is called for every trace. Traces where getTrace() returns None
+        are left out; if valid is a list the numbers of the traces returned are appended to it.
+        """
+        if not self.enabled or type(self).getTrace == PreprocessingBase.getTrace:
+            return self.trace.getTraceBlock(start, end, pointRange, valid)
+
+        traces = []
+        for n in range(start, end):
+            trace = self.getTrace(n)
+            if trace is None:
+                continue
+
+            traces.append(trace)
+            if valid is not None:
+                valid.append(n)
+
+        return self.applyPointRange(np.array(traces), pointRange)
+
+    def applyPointRange(self, traces, pointRange):
+        """Helper for getTraceBlock(), selects points from a 2-D trace block"""
+        if pointRange is None or len(traces) == 0:
+            return traces
+        return traces[:, pointRange[0]:pointRange[1]]
+
     def getTextin(self, n):
         """Get text-in number n"""
         return self.trace.getTextin(n)
@@ -97,6 +125,18 @@ class PreprocessingBase(AutoScript, QObject):
         """Get known-key number n"""
         return self.trace.getKnownKey(n)
 
+    def getTextinBlock(self, start, end):
+        """Get text-in start to end-1 as a 2-D array"""
+        return self.trace.getTextinBlock(start, end)
+
+    def getTextoutBlock(self, start, end):
+        """Get text-out start to end-1 as a 2-D array"""
+        return self.trace.getTextoutBlock(start, end)
+
+    def getKnownKeyBlock(self, start, end):
+        """Get known-key start to end-1 as a list"""
+        return self.trace.getKnownKeyBlock(start, end)
+
     def init(self):
         """Do any initilization required once all traces are loaded"""
         pass
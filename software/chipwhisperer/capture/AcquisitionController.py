@@ -32,7 +32,10 @@ except ImportError:
     print "ERROR: PySide is required for this program"
     sys.exit()
 
-import random
+import os
+import struct
+
+import numpy as np
 
 from openadc.ExtendedParameter import ExtendedParameter
 import chipwhisperer.common.qrc_resources
@@ -51,163 +54,68 @@ except ImportError:
 
 from chipwhisperer.common.MainChip import MainChip
 from chipwhisperer.common.ProjectFormat import ProjectFormat
+from chipwhisperer.capture.CaptureEngine import CaptureEngine
 
 
 class AcquisitionController(QObject):
+    """
+    GUI wrapper for CaptureEngine. traceDone is a display update sent at most updateRate times a second,
+    traceComplete & newTextResponse are sent for every trace.
+    """
+
     traceDone = Signal(int, list, int)
+    traceComplete = Signal(int)
     captureDone = Signal(bool)
 
     # (key, plaintext, response)
     newTextResponse = Signal(list, list, list, list)
 
-    def __init__(self, scope, target=None, writer=None, auxList=None, keyTextPattern=None):
+    def __init__(self, scope, target=None, writer=None, auxList=None, keyTextPattern=None, backgroundWriter=None, updateRate=10):
         super(AcquisitionController, self).__init__()
 
-        self.target = target
-        self.scope = scope
-        self.writer = writer
-        self.auxList = auxList
-        self.running = False
-        self.setKeyTextPattern(keyTextPattern)
-
-        self.maxtraces = 1
-
-        if self.auxList is not None:
-            for aux in auxList:
-                aux.captureInit()
+        self.engine = CaptureEngine(scope, target, writer, auxList=auxList, keyTextPattern=keyTextPattern,
+                                    backgroundWriter=backgroundWriter, updateRate=updateRate)
+        self.engine.traceCallback = self.traceComplete.emit
+        self.engine.textCallback = self.newTextResponse.emit
+        self.engine.updateCallback = self.traceDone.emit
+        self.engine.eventCallback = QCoreApplication.processEvents
 
     def setKeyTextPattern(self, pat):
-        self._keyTextPattern = pat
-        if pat:
-            self._keyTextPattern.initPair()
-
-    def TargetDoTrace(self, plaintext, key=None):
-        if self.target is None:
-            return
-
-        if key:
-            self.target.loadEncryptionKey(key)
-        self.target.loadInput(plaintext)
-        self.target.go()
-
-        while self.target.isDone() == False:
-            continue
-
-        # print "DEBUG: Target go()"
-
-        resp = self.target.readOutput()
-        # print "DEBUG: Target readOutput()"
-
-        # print "pt:",
-        # for i in plaintext:
-        #    print " %02X"%i,
-        # print ""
+        self.engine.setKeyTextPattern(pat)
 
-        # print "sc:",
-        # for i in resp:
-        #    print " %02X"%i,
-        # print ""
+    def setUpdateRate(self, updateRate):
+        self.engine.setUpdateRate(updateRate)
 
-        self.newTextResponse.emit(self.key, plaintext, resp, self.target.getExpected())
-
-        return resp
+    def TargetDoTrace(self, plaintext, key=None):
+        return self.engine.TargetDoTrace(plaintext, key)
 
     def doSingleReading(self, update=True, N=None):
+        return self.engine.doSingleReading(update, N)
 
-        # Get key / plaintext now
-        data = self._keyTextPattern.newPair()
-        self.key = data[0]
-        self.textin = data[1]
-
-        # Set mode
-        if self.target is not None:
-            self.target.reinit()
-            self.target.setModeEncrypt()
-            self.target.loadEncryptionKey(self.key)
-
-        if self.auxList is not None:
-            for aux in self.auxList:
-                aux.traceArm()
-
-        if self.scope is not None:
-            self.scope.arm()
-
-        if self.auxList is not None:
-            for aux in self.auxList:
-                aux.traceArmPost()
+    def setMaxtraces(self, maxtraces):
+        self.engine.setMaxtraces(maxtraces)
 
-        if self.target is not None:
-            # Load input, start encryption, get output. Key was set already, don't resend
-            self.textout = self.TargetDoTrace(self.textin, key=None)
+    def setPipelined(self, enabled):
+        self.engine.setPipelined(enabled)
 
-        # Get ADC reading
-        if self.scope is not None:
-            try:
-                if self.scope.capture(update, N, waitingCallback=QApplication.processEvents) == True:
-                    print "Timeout"
-                    return False
-            except IOError, e:
-                print "IOError: %s" % str(e)
-                return False
+    def setAlwaysReloadKey(self, enabled):
+        self.engine.setAlwaysReloadKey(enabled)
 
-        if self.auxList is not None:
-            for aux in self.auxList:
-                aux.traceDone()
+    def setTargetTimeout(self, timeout):
+        self.engine.setTargetTimeout(timeout)
 
-        return True
+    def setSegments(self, segments):
+        self.engine.setSegments(segments)
 
-    def setMaxtraces(self, maxtraces):
-        self.maxtraces = maxtraces
+    def phaseSummary(self):
+        return self.engine.phaseSummary()
 
     def abortCapture(self, doAbort=True):
-        if doAbort:
-            self.running = False
+        self.engine.abortCapture(doAbort)
 
     def doReadings(self, addToList=None):
-        self.running = True
-
-        self._keyTextPattern.initPair()
-        data = self._keyTextPattern.newPair()
-        self.key = data[0]
-        self.textin = data[1]
-
-        if self.writer is not None:
-            self.writer.prepareDisk()
-            self.writer.setKnownKey(self.key)
-
-        # TODO, what should this call be??
-        if self.auxList is not None:
-            for aux in self.auxList:
-                aux.traceArm()
-
-        nt = 0
-
-        while (nt < self.maxtraces) and self.running:
-            if self.doSingleReading(True, None) == True:
-                if self.writer is not None:
-                    self.writer.addTrace(self.scope.datapoints, self.textin, self.textout, self.key)
-
-                nt = nt + 1
-                self.traceDone.emit(nt, self.scope.datapoints, self.scope.offset)
-
-            QCoreApplication.processEvents()
-
-
-        if self.auxList is not None:
-            for aux in self.auxList:
-                aux.captureComplete()
-
-        if self.writer is not None:
-            # Don't clear trace as we re-use the buffer
-            self.writer.closeAll(clearTrace=False)
-
-        if addToList is not None:
-            if self.writer is not None:
-                addToList.append(self.writer)
-
-        self.captureDone.emit(self.running)
-
-        self.running = False
+        finished = self.engine.doReadings(addToList)
+        self.captureDone.emit(finished)
 
 def hexStrToByteArray(hexStr):
     ba = bytearray()
@@ -216,13 +124,25 @@ def hexStrToByteArray(hexStr):
     return ba
 
 class AcqKeyTextPattern_Base(QObject):
+    """
+    Random data comes from a numpy RNG which initPair() seeds, either from the 'Random Seed' setting or a new random
+    seed if that is 0. seed() gives the seed actually used, which is saved with the traces so the same keys & texts
+    can be generated again. Random data is generated bufferSize pairs at a time.
+    """
 
     paramListUpdated = Signal(list)
 
+    bufferSize = 1024
+
     def __init__(self, console=None, showScriptParameter=None, target=None):
         super(AcqKeyTextPattern_Base, self).__init__()
         self.showScriptParameter = showScriptParameter
         self.console = console
+        self._seedSetting = 0
+        self._seedRun = 0
+        self._seed = 0
+        self._rng = np.random.RandomState()
+        self._bufIndex = 0
         basicParams = self.setupParams()
         self.params = Parameter.create(name='Key/Text Pattern', type='group', children=basicParams)
         ExtendedParameter.setupExtended(self.params, self)
@@ -263,6 +183,26 @@ class AcqKeyTextPattern_Base(QObject):
         """Perform any extra init stuff required. Called at the end of main init() & when target changed."""
         pass
 
+    def setSeed(self, seed):
+        """Seed for random keys/texts, 0 for a new random seed every run"""
+        self._seedSetting = seed
+        self._seedRun = 0
+
+    def seed(self):
+        """Seed used for the current run"""
+        return self._seed
+
+    def _initRNG(self):
+        """Seed the RNG for a new run, each run (e.g. capture segment) with a fixed seed gets the next seed along"""
+        if self._seedSetting:
+            # Only move on once the last seed has actually been used for some pairs
+            if self._bufIndex:
+                self._seedRun += 1
+            self._seed = (self._seedSetting + self._seedRun) & 0xFFFFFFFF
+        else:
+            self._seed = struct.unpack("<I", os.urandom(4))[0]
+        self._rng = np.random.RandomState(self._seed)
+
     def setInitialKey(self, initialKey, binaryKey=False):
         pass
 
@@ -289,6 +229,8 @@ class AcqKeyTextPattern_Basic(AcqKeyTextPattern_Base):
                       {'name':'Plaintext', 'type':'list', 'values':['Random', 'Fixed'], 'value':'Random', 'set':self.setPlainType},
                       {'name':'Fixed Encryption Key', 'key':'initkey', 'type':'str', 'set':self.setInitialKey},
                       {'name':'Fixed Plaintext Key', 'key':'inittext', 'type':'str', 'set':self.setInitialText},
+                      {'name':'Random Seed', 'key':'seed', 'type':'int', 'limits':(0, 0xFFFFFFFF), 'value':0, 'set':self.setSeed,
+                       'tip':'Seed for random keys/plaintexts, 0 picks a new one each time. The seed used is saved in the trace config.'},
                   ]
         return basicParams
 
@@ -341,17 +283,25 @@ class AcqKeyTextPattern_Basic(AcqKeyTextPattern_Base):
     def initPair(self):
         self.setInitialKey(self.findParam('initkey').value())
         self.setInitialText(self.findParam('inittext').value())
+        self._initRNG()
+        self._fillBuffer()
+
+    def _fillBuffer(self):
+        self._keyBuf = self._rng.randint(0, 256, (self.bufferSize, self.keyLen())).astype(np.uint8)
+        self._textBuf = self._rng.randint(0, 256, (self.bufferSize, 16)).astype(np.uint8)
+        self._bufIndex = 0
 
     def newPair(self):
+        if self._bufIndex == self.bufferSize:
+            self._fillBuffer()
+
         if self._fixedKey is False:
-            self._key = bytearray(self.keyLen())
-            for i in range(0, self.keyLen()):
-                self._key[i] = random.randint(0, 255)
+            self._key = bytearray(self._keyBuf[self._bufIndex].tostring())
 
         if self._fixedPlain is False:
-            self._textin = bytearray(16)
-            for i in range(0, 16):
-                self._textin[i] = random.randint(0, 255)
+            self._textin = bytearray(self._textBuf[self._bufIndex].tostring())
+
+        self._bufIndex += 1
 
         # Check key works with target
         self.validateKey()
@@ -389,6 +339,14 @@ class AcqKeyTextPattern_CRITTest(AcqKeyTextPattern_Base):
             raise ValueError("Invalid key length: %d bytes" % self.keyLen())
 
         self._textin1 = hexStrToByteArray("00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00")
+        self._initRNG()
+
+        if AES:
+            self._cipher = AES.new(str(self._key), AES.MODE_ECB)
+        else:
+            print "No AES Module, Using random data instead!"
+            self._cipher = None
+        self._fillBuffer()
 
         if self.keyLen() == 16:
             self._textin2 = hexStrToByteArray("da 39 a3 ee 5e 6b 4b 0d 32 55 bf ef 95 60 18 90")
@@ -401,20 +359,30 @@ class AcqKeyTextPattern_CRITTest(AcqKeyTextPattern_Base):
 
         self.group1 = True
 
+    def _fillBuffer(self):
+        """Next bufferSize group 1 texts, each the encryption of the one before"""
+        if self._cipher:
+            data = self._textin1
+            chain = []
+            for i in range(0, self.bufferSize):
+                chain.append(data)
+                data = bytearray(self._cipher.encrypt(str(data)))
+            self._textin1 = data
+        else:
+            chain = [bytearray(row.tostring()) for row in self._rng.randint(0, 256, (self.bufferSize, 16)).astype(np.uint8)]
+
+        self._group1Buf = chain
+        self._bufIndex = 0
+
     def newPair(self):
 
         if self.group1:
             self.group1 = False
-            self._textin = self._textin1
 
-            if AES:
-                cipher = AES.new(str(self._key), AES.MODE_ECB)
-                self._textin1 = bytearray(cipher.encrypt(str(self._textin1)))
-            else:
-                print "No AES Module, Using rand() instead!"
-                self._textin1 = bytearray(16)
-                for i in range(0, 16):
-                    self._textin1[i] = random.randint(0, 255)
+            if self._bufIndex == self.bufferSize:
+                self._fillBuffer()
+            self._textin = self._group1Buf[self._bufIndex]
+            self._bufIndex += 1
 
         else:
             self.group1 = True
@@ -0,0 +1,439 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+class RateLimiter(object):
+    """ready() returns True at most maxRate times a second, or every time if maxRate is 0/None"""
+
+    def __init__(self, maxRate=10):
+        self._last = 0
+        self.setRate(maxRate)
+
+    def setRate(self, maxRate):
+        if maxRate:
+            self._interval = 1.0 / maxRate
+        else:
+            self._interval = 0
+
+    def ready(self):
+        now = time.time()
+        if now - self._last >= self._interval:
+            self._last = now
+            return True
+        return False
+
+class CaptureEngine(object):
+    """
+    Capture loop without any GUI dependencies, so it can be run from scripts. AcquisitionController wraps
+    this for the GUI.
+
+    keyTextPattern is any object with initPair() and newPair() returning (key, textin). Progress is reported
+    through optional callbacks:
+
+    traceCallback(nt) - after every trace
+    textCallback(key, textin, textout, expected) - after every target response
+    updateCallback(nt, datapoints, offset) - display update, at most updateRate times a second
+    eventCallback() - run GUI events, at most updateRate times a second (also while waiting on the scope)
+
+    Scope plot updates are rate limited the same way, by passing update=False to scope.capture() in between.
+
+    The target is only reinit() & sent the key when the key changes, unless setAlwaysReloadKey(True). With
+    setPipelined(True) the target response is read (and the next key/text generated) in a worker thread
+    while the scope data is read out.
+
+    Time spent in each phase of the capture is totalled in phaseTimes (seconds), see phaseSummary().
+
+    With setSegments(K), scopes with segmented memory (armSegments()/captureSegments()) are armed once for K
+    encryptions, and all K traces read back together from scope.segmentData. Other scopes ignore this.
+    """
+
+    phaseNames = ['key', 'arm', 'target', 'capture', 'store']
+
+    def __init__(self, scope, target=None, writer=None, auxList=None, keyTextPattern=None, backgroundWriter=None, updateRate=10):
+        self.target = target
+        self.scope = scope
+        self.writer = writer
+        self.backgroundWriter = backgroundWriter
+        self.auxList = auxList
+        self.running = False
+        self.setKeyTextPattern(keyTextPattern)
+
+        self.traceCallback = None
+        self.textCallback = None
+        self.updateCallback = None
+        self.eventCallback = None
+        self._updateLimiter = RateLimiter(updateRate)
+        self._eventLimiter = RateLimiter(updateRate)
+
+        self.maxtraces = 1
+        self.pipelined = False
+        self.alwaysReloadKey = False
+        self._loadedKey = None
+        self._nextPair = None
+        self.targetTimeout = 5.0
+        self.segments = 1
+        self.resetPhaseTimes()
+
+        if self.auxList is not None:
+            for aux in auxList:
+                aux.captureInit()
+
+    def setKeyTextPattern(self, pat):
+        self._keyTextPattern = pat
+        if pat:
+            self._keyTextPattern.initPair()
+
+    def setUpdateRate(self, updateRate):
+        """Maximum display updates per second, 0 to update after every trace"""
+        self._updateLimiter.setRate(updateRate)
+        self._eventLimiter.setRate(updateRate)
+
+    def setMaxtraces(self, maxtraces):
+        self.maxtraces = maxtraces
+
+    def setPipelined(self, enabled):
+        """Read the target response & generate the next key/text while the scope is being read out"""
+        self.pipelined = enabled
+
+    def setAlwaysReloadKey(self, enabled):
+        """Call target reinit() & loadEncryptionKey() for every trace, not only when the key changes"""
+        self.alwaysReloadKey = enabled
+
+    def setSegments(self, segments):
+        """Number of traces recorded per arm, if the scope supports segmented capture"""
+        self.segments = segments
+
+    def setTargetTimeout(self, timeout):
+        """Seconds to wait for the target to finish before dropping the trace, None to wait forever"""
+        self.targetTimeout = timeout
+
+    def resetPhaseTimes(self):
+        self.phaseTimes = OrderedDict((name, 0.0) for name in self.phaseNames)
+
+    def phaseSummary(self):
+        return ", ".join("%s %.2fs" % (name, t) for name, t in self.phaseTimes.items())
+
+    def _phaseDone(self, name, start):
+        """Add time since start to phase, returns current time so it can start the next phase"""
+        now = time.time()
+        self.phaseTimes[name] += now - start
+        return now
+
+    def abortCapture(self, doAbort=True):
+        if doAbort:
+            self.running = False
+
+    def processEvents(self):
+        """Passed to the scope as waitingCallback, runs eventCallback if it is due"""
+        if self.eventCallback is not None and self._eventLimiter.ready():
+            self.eventCallback()
+
+    def TargetDoTrace(self, plaintext, key=None):
+        if self.target is None:
+            return
+
+        if key:
+            self.target.loadEncryptionKey(key)
+        self.target.loadInput(plaintext)
+        self.target.go()
+
+        resp = self._targetResponse()
+
+        if self.textCallback is not None:
+            self.textCallback(self.key, plaintext, resp, self.target.getExpected())
+
+        return resp
+
+    def _targetResponse(self):
+        if self.target.waitDone(self.targetTimeout) == False:
+            raise IOError("Target timeout")
+
+        return self.target.readOutput()
+
+    def _newPair(self):
+        if self._nextPair is not None:
+            pair = self._nextPair
+            self._nextPair = None
+            return pair
+        return self._keyTextPattern.newPair()
+
+    def _pipelineWorker(self, result):
+        """Runs while the scope is read out: get target response, then generate the next key/text"""
+        try:
+            result['resp'] = self._targetResponse()
+            if self.running:
+                self._nextPair = self._keyTextPattern.newPair()
+        except Exception:
+            result['error'] = sys.exc_info()
+
+    def _loadKey(self):
+        """Set mode & load self.key into target, only if key changed"""
+        if self.target is not None:
+            if self.alwaysReloadKey or self._loadedKey is None or list(self.key) != self._loadedKey:
+                self.target.reinit()
+                self.target.setModeEncrypt()
+                self.target.loadEncryptionKey(self.key)
+                self._loadedKey = list(self.key)
+
+    def doSegmentReadings(self, nsegs, update=True):
+        """
+        Arm the scope once and run nsegs encryptions, one scope segment each. Returns list of (textin, textout, key)
+        for the traces in scope.segmentData, or None if the capture failed.
+        """
+        tstart = time.time()
+
+        if self.auxList is not None:
+            for aux in self.auxList:
+                aux.traceArm()
+
+        self.scope.armSegments(nsegs)
+
+        if self.auxList is not None:
+            for aux in self.auxList:
+                aux.traceArmPost()
+        tstart = self._phaseDone('arm', tstart)
+
+        texts = []
+        for i in range(0, nsegs):
+            data = self._newPair()
+            self.key = data[0]
+            self.textin = data[1]
+            self._loadKey()
+            tstart = self._phaseDone('key', tstart)
+
+            try:
+                self.textout = self.TargetDoTrace(self.textin, key=None)
+            except IOError, e:
+                print "IOError: %s" % str(e)
+                return None
+            tstart = self._phaseDone('target', tstart)
+
+            texts.append((self.textin, self.textout, self.key))
+
+        try:
+            timeout = self.scope.captureSegments(update, waitingCallback=self.processEvents)
+        except IOError, e:
+            print "IOError: %s" % str(e)
+            timeout = None
+        self._phaseDone('capture', tstart)
+
+        if timeout == True:
+            print "Timeout"
+            return None
+        elif timeout is None:
+            return None
+
+        if self.auxList is not None:
+            for aux in self.auxList:
+                for t in texts:
+                    aux.traceDone()
+
+        return texts
+
+    def doSingleReading(self, update=True, N=None):
+        tstart = time.time()
+
+        # Get key / plaintext now
+        data = self._newPair()
+        self.key = data[0]
+        self.textin = data[1]
+
+        self._loadKey()
+        tstart = self._phaseDone('key', tstart)
+
+        if self.auxList is not None:
+            for aux in self.auxList:
+                aux.traceArm()
+
+        if self.scope is not None:
+            self.scope.arm()
+
+        if self.auxList is not None:
+            for aux in self.auxList:
+                aux.traceArmPost()
+        tstart = self._phaseDone('arm', tstart)
+
+        worker = None
+        if self.target is not None:
+            if self.pipelined and self.scope is not None:
+                # Start encryption, response is read while the scope data is transferred
+                self.target.loadInput(self.textin)
+                self.target.go()
+                result = {}
+                worker = threading.Thread(target=self._pipelineWorker, args=(result,))
+                worker.start()
+            else:
+                # Load input, start encryption, get output. Key was set already, don't resend
+                try:
+                    self.textout = self.TargetDoTrace(self.textin, key=None)
+                except IOError, e:
+                    print "IOError: %s" % str(e)
+                    self._phaseDone('target', tstart)
+                    return False
+                tstart = self._phaseDone('target', tstart)
+
+        # Get ADC reading
+        timeout = False
+        if self.scope is not None:
+            try:
+                timeout = self.scope.capture(update, N, waitingCallback=self.processEvents)
+            except IOError, e:
+                print "IOError: %s" % str(e)
+                timeout = None
+        tstart = self._phaseDone('capture', tstart)
+
+        if worker is not None:
+            worker.join()
+            self._phaseDone('target', tstart)
+            if 'error' in result:
+                if isinstance(result['error'][1], IOError):
+                    print "IOError: %s" % str(result['error'][1])
+                    return False
+                raise result['error'][0], result['error'][1], result['error'][2]
+
+            self.textout = result['resp']
+            if self.textCallback is not None:
+                self.textCallback(self.key, self.textin, self.textout, self.target.getExpected())
+
+        if timeout == True:
+            print "Timeout"
+            return False
+        elif timeout is None:
+            return False
+
+        if self.auxList is not None:
+            for aux in self.auxList:
+                aux.traceDone()
+
+        return True
+
+    def doReadings(self, addToList=None):
+        """Capture maxtraces traces, returns True if finished or False if aborted"""
+        self.running = True
+
+        self._keyTextPattern.initPair()
+        data = self._keyTextPattern.newPair()
+        self.key = data[0]
+        self.textin = data[1]
+        self._loadedKey = None
+        self._nextPair = None
+        self.resetPhaseTimes()
+
+        if self.writer is not None:
+            self.writer.prepareDisk()
+            self.writer.setKnownKey(self.key)
+            self.writer.setBackgroundWriter(self.backgroundWriter)
+
+            try:
+                self.writer.config.setAttr("patternSeed", self._keyTextPattern.seed())
+            except AttributeError:
+                # Pattern has no random seed
+                pass
+
+            # Scopes without sampleFormat() only give floating-point samples
+            if hasattr(self.scope, 'sampleFormat'):
+                self.writer.setSampleFormat(*self.scope.sampleFormat())
+
+        # TODO, what should this call be??
+        if self.auxList is not None:
+            for aux in self.auxList:
+                aux.traceArm()
+
+        nt = 0
+        shown = 0
+
+        segments = self.segments
+        if segments > 1:
+            try:
+                self.scope.armSegments
+            except AttributeError:
+                # Scope doesn't have segmented memory, one trace per arm
+                segments = 1
+
+        while (nt < self.maxtraces) and self.running and segments > 1:
+            update = self._updateLimiter.ready()
+            texts = self.doSegmentReadings(min(segments, self.maxtraces - nt), update)
+            if texts is not None:
+                tstart = time.time()
+                for i, (textin, textout, key) in enumerate(texts):
+                    if self.writer is not None:
+                        self.writer.addTrace(self.scope.segmentData[i], textin, textout, key)
+
+                    nt = nt + 1
+                    if self.traceCallback is not None:
+                        self.traceCallback(nt)
+                self._phaseDone('store', tstart)
+
+                if update and self.updateCallback is not None:
+                    self.updateCallback(nt, self.scope.datapoints, self.scope.offset)
+                    shown = nt
+
+            self.processEvents()
+
+        while (nt < self.maxtraces) and self.running:
+            update = self._updateLimiter.ready()
+            if self.doSingleReading(update, None) == True:
+                if self.writer is not None:
+                    tstart = time.time()
+                    self.writer.addTrace(self.scope.datapoints, self.textin, self.textout, self.key)
+                    self._phaseDone('store', tstart)
+
+                nt = nt + 1
+                if self.traceCallback is not None:
+                    self.traceCallback(nt)
+
+                if update and self.updateCallback is not None:
+                    self.updateCallback(nt, self.scope.datapoints, self.scope.offset)
+                    shown = nt
+
+            self.processEvents()
+
+        # Make sure the final count is shown
+        if shown != nt and self.updateCallback is not None:
+            self.updateCallback(nt, self.scope.datapoints, self.scope.offset)
+
+        if self.auxList is not None:
+            for aux in self.auxList:
+                aux.captureComplete()
+
+        if self.writer is not None:
+            # Don't clear trace as we re-use the buffer
+            if self.backgroundWriter is not None:
+                # Config is updated now (so the trace manager has the right size), files are saved in the background
+                self.backgroundWriter.closeWriter(self.writer)
+            else:
+                self.writer.closeAll(clearTrace=False)
+
+        if addToList is not None:
+            if self.writer is not None:
+                addToList.append(self.writer)
+
+        finished = self.running
+        self.running = False
+        return finished
@@ -76,11 +76,15 @@ class CaptureProgressDialog(QDialog):
         self.setMaximum(ntraces)
 
     def traceDoneSlot(self, num, data, offset=0):
-        self.incTrace()
+        """num is the number of traces done in this segment, this may not be called for every trace"""
+        self.tnum = self.segstart + num
+        self.setValue(self.tnum)
+        self.updateLabels()
 
     def startCapture(self):
         self.tnum = 0
         self.segnum = 0
+        self.segstart = 0
 
     def updateLabels(self):
         self.segNum.setText("Current Segment = %d" % self.segnum)
@@ -89,6 +93,7 @@ class CaptureProgressDialog(QDialog):
 
     def incSeg(self):
         self.segnum += 1
+        self.segstart = self.tnum
         self.updateLabels()
 
     def incTrace(self):
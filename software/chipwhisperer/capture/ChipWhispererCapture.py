@@ -45,6 +45,7 @@ except ImportError:
 from datetime import datetime
 import random
 import os.path
+from collections import deque
 import traceback
 
 from openadc.ExtendedParameter import ExtendedParameter
@@ -84,6 +85,8 @@ try:
 except ImportError:
     PicoScopeInterface = None
 
+from chipwhisperer.capture.scopes.SimulatedScopeInterface import SimulatedScopeInterface
+
 try:
     import  chipwhisperer.capture.targets.SimpleSerial as target_SimpleSerial
 except ImportError:
@@ -133,6 +136,8 @@ except ImportError:
 from chipwhisperer.common.MainChip import MainChip
 from chipwhisperer.common.ProjectFormat import ProjectFormat
 from chipwhisperer.common.traces.TraceContainerNative import TraceContainerNative
+from chipwhisperer.common.traces.TraceContainerChunked import TraceContainerChunked
+from chipwhisperer.common.traces.BackgroundTraceWriter import BackgroundTraceWriter
 from chipwhisperer.common.traces.TraceContainerDPAv3 import TraceContainerDPAv3
 
 try:
@@ -318,6 +323,8 @@ class ChipWhispererCapture(MainChip):
 
         self.scope = None
         self.trace = None
+        #Number of capture buffers reused across segments
+        self.waveBufferRing = 2
         self.auxList = None
         self.target = TargetInterface(log=self.console, showScriptParameter=self.showScriptParameter)
         self.target.paramListUpdated.connect(self.reloadTargetParamList)
@@ -333,6 +340,7 @@ class ChipWhispererCapture(MainChip):
         
         valid_traces["None"] = None
         valid_traces["ChipWhisperer/Native"] = TraceContainerNative
+        valid_traces["ChipWhisperer/Chunked"] = TraceContainerChunked
         valid_traces["DPAContestv3"] = TraceContainerDPAv3
         valid_aux["None"] = None
 
@@ -359,6 +367,8 @@ class ChipWhispererCapture(MainChip):
         if PicoScopeInterface is not None:
             valid_scopes["PicoScope"] = PicoScopeInterface(parent=self, console=self.console, showScriptParameter=self.showScriptParameter)
 
+        valid_scopes["Simulated"] = SimulatedScopeInterface(parent=self, console=self.console, showScriptParameter=self.showScriptParameter)
+
         self.esm = EncryptionStatusMonitor(self)
 
         self.serialTerminal = SerialTerminalDialog(self)
@@ -393,6 +403,12 @@ class ChipWhispererCapture(MainChip):
                          'as each segment is buffered into RAM before being written to disk.'},
                         {'name':'Open Monitor', 'type':'action', 'action':self.esm.show},
                         {'name':'Key/Text Pattern', 'type':'list', 'values':valid_acqPatterns, 'value':valid_acqPatterns['Basic'], 'set':self.setAcqPattern},
+                        {'name':'Pipelined Acquisition', 'type':'bool', 'value':False, 'set':self.setPipelined, 'tip':'Read the target response '
+                         'and generate the next key/text while the scope data is read out. Only use if the target & scope do not share a port.'},
+                        {'name':'Reload Key Every Trace', 'type':'bool', 'value':False, 'set':self.setAlwaysReloadKey, 'tip':'Reset the target '
+                         'and resend the key before every trace, instead of only when the key changes.'},
+                        {'name':'Traces per Arm', 'type':'int', 'limits':(1, 1E6), 'value':1, 'set':self.setScopeSegments, 'tip':'Record this many '
+                         'encryptions into the segmented memory of the scope before reading them back. Ignored if the scope does not support it.'},
                         # {'name':'Fixed Plaintext', 'type':'bool', 'value':False, 'set':self.setFixedPlain },
                         # {'name':'Fixed Plaintext Value', 'type':'str', 'value':self.plaintextStr, 'set':self.setPlaintext},
                     ]},
@@ -403,6 +419,9 @@ class ChipWhispererCapture(MainChip):
         self.da = None
         self.numTraces = 100
         self.numSegments = 1
+        self.pipelined = False
+        self.alwaysReloadKey = False
+        self.scopeSegments = 1
 
         self.addToolbars()
         self.addSettingsDocks()
@@ -462,6 +481,20 @@ class ChipWhispererCapture(MainChip):
     def getNumSegments(self):
         return self.numSegments
 
+    def setPipelined(self, enabled):
+        self.pipelined = enabled
+
+    def setAlwaysReloadKey(self, enabled):
+        self.alwaysReloadKey = enabled
+
+    def setScopeSegments(self, segments):
+        self.scopeSegments = segments
+
+    def setupAcquisition(self, ac):
+        ac.setPipelined(self.pipelined)
+        ac.setAlwaysReloadKey(self.alwaysReloadKey)
+        ac.setSegments(self.scopeSegments)
+
     def FWLoaderGo(self):
         print "NOTE: Call to cap.FWLoaderGo() not required anymore, will be removed in future versions"
 
@@ -752,7 +785,7 @@ class ChipWhispererCapture(MainChip):
                 self.scope.con()
                 self.statusBar().showMessage("Scope Connected")
                 #Pass to target if required
-                if hasattr(self.target, "setOpenADC"):
+                if hasattr(self.target, "setOpenADC") and hasattr(self.scope, "qtadc"):
                     self.target.setOpenADC(self.scope.qtadc.ser)
 
             else:
@@ -779,6 +812,7 @@ class ChipWhispererCapture(MainChip):
 
         try:
             ac = AcquisitionController(self.scope, target, writer=None, auxList=self.auxList, keyTextPattern=self.acqPattern)
+            self.setupAcquisition(ac)
             ac.newTextResponse.connect(self.esm.newData)
 
             self.capture1Act.setEnabled(False)
@@ -869,64 +903,82 @@ class ChipWhispererCapture(MainChip):
 
         cprog.startCapture()
 
-        # This system re-uses one wave buffer a bunch of times. This is required since the memory will become
+        # This system re-uses wave buffers a bunch of times. This is required since the memory will become
         # fragmented, even though you are just freeing & reallocated the same size buffer. It's slightly less
         # clear but it ensures you don't suddently have a capture interrupted with a memory error. This can
         # happen even if you have loads of memory free (e.g. are only using ~200MB for the buffer), well before
         # the 1GB limit that a 32-bit process would expect to give you trouble at.
-        waveBuffer = None
-
-        for i in range(0, self.numSegments):
-
-            cprog.incSeg()
-
-            if self.trace is not None:
-                writer = self.trace(self.traceparams)
-            else:
-                writer = None
-
-            starttime = datetime.now()
-            baseprefix = starttime.strftime('%Y.%m.%d-%H.%M.%S')
-            prefix = baseprefix + "_"
-
-            # Load trace writer information
-            if writer:
-                writer.config.setAttr("prefix", prefix)
-                writer.config.setConfigFilename(self.project().datadirectory + "traces/config_" + prefix + ".cfg")
-                writer.config.setAttr("date", starttime.strftime('%Y-%m-%d %H:%M:%S'))
-                writer.setTraceHint(tracesPerRun)
+        #
+        # Buffers are used in a ring, so the last segment's traces are still intact while the next one is captured.
+        waveBuffers = deque(maxlen=self.waveBufferRing)
 
-                if waveBuffer is not None:
-                    writer.setTraceBuffer(waveBuffer)
+        # Segments are saved to disk while the next one is captured
+        bgWriter = BackgroundTraceWriter()
 
-
-            if self.auxList is not None:
-                for aux in self.auxList:
-                    aux.setPrefix(baseprefix)
-
-            ac = AcquisitionController(self.scope, target, writer, auxList=self.auxList, keyTextPattern=self.acqPattern)
-            ac.newTextResponse.connect(self.esm.newData)
-            ac.traceDone.connect(cprog.traceDoneSlot)
-            ac.traceDone.connect(self.glitchMonitor.traceDone)
-            self.glitchMonitor.campaignStart(baseprefix)
-            ac.setMaxtraces(tracesPerRun)
-            cprog.abortCapture.connect(ac.abortCapture)
-
-            self.capture1Act.setEnabled(False)
-            self.captureMAct.setEnabled(False)
-
-            ac.doReadings(addToList=self.manageTraces)
-
-            tcnt += tracesPerRun
-            self.statusBar().showMessage("%d Captures Completed" % tcnt)
-            self.glitchMonitor.campaignDone()
-
-            stoptime = datetime.now()
-
-            # Re-use the wave buffer for later segments
-            if writer is not None:
-                waveBuffer = writer.traces
-                writerlist.append(writer)
+        # Queued segments must be finished (and the writer thread stopped) even if the capture fails
+        try:
+            for i in range(0, self.numSegments):
+
+                cprog.incSeg()
+
+                if self.trace is not None:
+                    writer = self.trace(self.traceparams)
+                else:
+                    writer = None
+
+                starttime = datetime.now()
+                baseprefix = starttime.strftime('%Y.%m.%d-%H.%M.%S')
+                prefix = baseprefix + "_"
+
+                # Load trace writer information
+                if writer:
+                    writer.config.setAttr("prefix", prefix)
+                    writer.config.setConfigFilename(self.project().datadirectory + "traces/config_" + prefix + ".cfg")
+                    writer.config.setAttr("date", starttime.strftime('%Y-%m-%d %H:%M:%S'))
+                    writer.setTraceHint(tracesPerRun)
+
+                    if len(waveBuffers) == waveBuffers.maxlen:
+                        # Buffer can't be reused until the segment using it is on disk
+                        (oldWriter, oldBuffer) = waveBuffers.popleft()
+                        bgWriter.wait(oldWriter)
+                        writer.setTraceBuffer(oldBuffer)
+
+
+                if self.auxList is not None:
+                    for aux in self.auxList:
+                        aux.setPrefix(baseprefix)
+
+                ac = AcquisitionController(self.scope, target, writer, auxList=self.auxList, keyTextPattern=self.acqPattern, backgroundWriter=bgWriter)
+                self.setupAcquisition(ac)
+                ac.newTextResponse.connect(self.esm.newData)
+                ac.traceDone.connect(cprog.traceDoneSlot)
+                ac.traceComplete.connect(self.glitchMonitor.traceDone)
+                self.glitchMonitor.campaignStart(baseprefix)
+                ac.setMaxtraces(tracesPerRun)
+                cprog.abortCapture.connect(ac.abortCapture)
+
+                self.capture1Act.setEnabled(False)
+                self.captureMAct.setEnabled(False)
+
+                ac.doReadings(addToList=self.manageTraces)
+
+                tcnt += tracesPerRun
+                self.statusBar().showMessage("%d Captures Completed" % tcnt)
+                self.console.append("Segment %d capture time: %s" % (i, ac.phaseSummary()))
+                self.glitchMonitor.campaignDone()
+
+                stoptime = datetime.now()
+
+                # Re-use the wave buffer for later segments
+                if writer is not None:
+                    if writer.traces is not None:
+                        waveBuffers.append((writer, writer.traces))
+                    writerlist.append(writer)
+        finally:
+            try:
+                bgWriter.close()
+            except IOError, e:
+                self.console.append("ERROR: %s" % str(e))
 
         self.console.append("Capture delta time: %s" % str(stoptime - overallstarttime))
 
@@ -88,6 +88,16 @@ except ImportError, e:
 finally:
     modList.append(["scopes.ChipWhispererGlitch", ok, err])
 
+try:
+    import chipwhisperer.capture.scopes.SimulatedScopeInterface
+    ok = True
+    err = ""
+except ImportError, e:
+    ok = False
+    err = str(e)
+finally:
+    modList.append(["scopes.SimulatedScope", ok, err])
+
 
 try:
     import chipwhisperer.capture.targets.ChipWhispererTargets
@@ -139,6 +149,16 @@ except ImportError, e:
 finally:
     modList.append(["targets.ChipWhispererSPI", ok, err])
 
+try:
+    import chipwhisperer.capture.targets.SimulatedTarget
+    ok = True
+    err = ""
+except ImportError, e:
+    ok = False
+    err = str(e)
+finally:
+    modList.append(["targets.SimulatedTarget", ok, err])
+
 try:
     import chipwhisperer.common.traces.TraceContainerNative
     ok = True
@@ -149,6 +169,16 @@ except ImportError, e:
 finally:
     modList.append(["traces.TraceContinerNative", ok, err])
 
+try:
+    import chipwhisperer.common.traces.TraceContainerChunked
+    ok = True
+    err = ""
+except ImportError, e:
+    ok = False
+    err = str(e)
+finally:
+    modList.append(["traces.TraceContainerChunked", ok, err])
+
 try:
     import chipwhisperer.common.traces.TraceContainerDPAv3
     ok = True
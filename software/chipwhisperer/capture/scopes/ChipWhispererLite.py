@@ -355,6 +355,9 @@ class USART(object):
     USART_CMD_DISABLE = 0x0012
     USART_CMD_NUMWAIT = 0x0014
 
+    #Largest data payload the firmware accepts in one control transfer
+    MAX_TX = 58
+
     def __init__(self, usbdev=None):
         self._usbdev = usbdev
         self._timeout = 200
@@ -424,14 +427,11 @@ class USART(object):
         """
         # print "%d: %s" % (len(data), str(data))
 
-        data = bytearray(data, 'latin-1')
-        datasent = 0
+        if not isinstance(data, bytearray):
+            data = bytearray(data, 'latin-1')
 
-        while datasent < len(data):
-            datatosend = len(data) - datasent
-            datatosend = min(datatosend, 58)
-            self._usbdev.ctrl_transfer(0x41, self.CMD_USART0_DATA, 0, 0, data[datasent:(datasent + datatosend)], timeout=self._timeout)
-            datasent += datatosend
+        for datasent in range(0, len(data), self.MAX_TX):
+            self._usbdev.ctrl_transfer(0x41, self.CMD_USART0_DATA, 0, 0, data[datasent:(datasent + self.MAX_TX)], timeout=self._timeout)
 
     def inWaiting(self):
         """
@@ -444,8 +444,8 @@ class USART(object):
 
     def read(self, dlen=0, timeout=50):
         """
-        Read data from input buffer, if 'dlen' is 0 everything present is read. If timeout is non-zero
-        system will block for a while until data is present in buffer.
+        Read data from input buffer, if 'dlen' is 0 everything present is read. Otherwise blocks until
+        'dlen' bytes have arrived or 'timeout' milliseconds have passed (0 uses the USB timeout).
         """
 
         waiting = self.inWaiting()
@@ -456,17 +456,30 @@ class USART(object):
         if timeout == 0:
             timeout = self._timeout
 
+        deadline = time.time() + timeout / 1000.0
+        delay = 0.0001
 
         resp = []
 
-        while dlen and timeout > 0:
+        while dlen:
             if waiting:
-                newdata = self._usbdev.ctrl_transfer(0xC1, self.CMD_USART0_DATA, 0, 0, min(waiting, dlen), timeout=timeout)
+                newdata = self._usbdev.ctrl_transfer(0xC1, self.CMD_USART0_DATA, 0, 0, min(waiting, dlen), timeout=self._timeout)
                 resp.extend(newdata)
                 dlen -= len(newdata)
+                waiting -= len(newdata)
+                delay = 0.0001
+
+                #Read everything that was waiting before asking again
+                if dlen == 0 or waiting > 0:
+                    continue
+            elif time.time() > deadline:
+                break
+            else:
+                #Nothing yet, back off so we don't flood the USB with requests
+                time.sleep(delay)
+                delay = min(delay * 2, 0.002)
+
             waiting = self.inWaiting()
-            timeout -= 1
-            time.sleep(0.001)
 
         return resp
 
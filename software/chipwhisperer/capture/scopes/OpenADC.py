@@ -27,6 +27,7 @@
 
 
 import sys
+import numpy as np
 
 try:
     # OrderedDict is new in 2.7
@@ -529,7 +530,7 @@ class OpenADCInterface_ZTEX(QWidget):
 
 class OpenADCInterface(QObject):
     connectStatus = Signal(bool)
-    dataUpdated = Signal(list, int)
+    dataUpdated = Signal(object, int)
     paramListUpdated = Signal(list)
 
     def __init__(self, parent=None, console=None, showScriptParameter=None):
@@ -540,6 +541,7 @@ class OpenADCInterface(QObject):
         self.qtadc.dataUpdated.connect(self.doDataUpdated)
         self.scopetype = None
         self.datapoints = []
+        self._plotUpdate = True
 
         try:
             cwrev2 = OpenADCInterface_ZTEX(self.qtadc, console=console, showScriptParameter=showScriptParameter)
@@ -671,9 +673,11 @@ class OpenADCInterface(QObject):
             self.connectStatus.emit(True)
 
     def doDataUpdated(self,  l, offset=0):
+        #Samples are passed on (& stored) as a numpy array, no-op if OpenADC already gave one
+        l = np.asarray(l)
         self.datapoints = l
         self.offset = offset
-        if len(l) > 0:
+        if len(l) > 0 and self._plotUpdate:
             self.dataUpdated.emit(l, offset)
 
     def arm(self):
@@ -683,8 +687,16 @@ class OpenADCInterface(QObject):
         self.advancedSettings.armPostScope()
 
     def capture(self, update=True, NumberPoints=None, waitingCallback=None):
-        """Raises IOError if unknown failure, returns 'True' if timeout, 'False' if no timeout"""
-        return self.qtadc.capture(update, NumberPoints, waitingCallback)
+        """
+        Raises IOError if unknown failure, returns 'True' if timeout, 'False' if no timeout. Data is always read,
+        update=False only skips the plot update (dataUpdated signal).
+        """
+        self._plotUpdate = update
+        return self.qtadc.capture(True, NumberPoints, waitingCallback)
+
+    def sampleFormat(self):
+        """Raw sample format as (dtype, gain, offset): datapoints are 10-bit ADC codes scaled to code / 1024 - 0.5"""
+        return (np.uint16, 1.0 / 1024, -0.5)
 
     def paramList(self):
         p = []
@@ -55,10 +55,11 @@ from picoscope import ps2000
 import collections
 
 import time
+import numpy as np
 
 class PicoScope(QWidget):
     paramListUpdated = Signal(list) 
-    dataUpdated = Signal(list, int)
+    dataUpdated = Signal(object, int)
 
     def __init__(self, psClass, console=None, showScriptParameter=None):
         super(PicoScope, self).__init__()
@@ -102,6 +103,9 @@ class PicoScope(QWidget):
 
         self.params = Parameter.create(name='Scope Settings', type='group', children=scopeParams)
         ExtendedParameter.setupExtended(self.params, self)  
+
+        self.segmentData = None
+        self._nsegs = 1
             
     def getAdditionalParams(self):
         """Override this to define additional parameters"""
@@ -166,7 +170,40 @@ class PicoScope(QWidget):
 
 
     def arm(self):       
+        if self._nsegs != 1:
+            self._setSegments(1)
+        self.ps.runBlock()
+
+    def _setSegments(self, nsegs):
+        self.ps.memorySegments(nsegs)
+        self.ps.setNoOfCaptures(nsegs)
+        self._nsegs = nsegs
+        #Memory per segment changed
+        self.UpdateSampleRateFreq()
+
+    def armSegments(self, nsegs):
+        """Rapid block mode: record nsegs triggers into separate memory segments"""
+        if self._nsegs != nsegs:
+            self._setSegments(nsegs)
         self.ps.runBlock()
+
+    def captureSegments(self, Update=False, waitingCallback=None):
+        while(self.ps.isReady() == False): time.sleep(0.01)
+
+        npoints = self.findParam('samplelength').value()
+        if self.segmentData is None or self.segmentData.shape != (self._nsegs, npoints):
+            self.segmentData = np.zeros((self._nsegs, npoints))
+
+        #Segments are converted straight into the (reused) output array
+        for i in range(0, self._nsegs):
+            self.ps.getDataV(self.findParam('tracesource').value(), npoints, startIndex=self.findParam('sampleoffset').value(),
+                             segmentIndex=i, dataV=self.segmentData[i])
+
+        self.datapoints = self.segmentData[-1]
+        self.dataUpdated.emit(self.datapoints, 0)
+        waitingCallback()
+
+        return False
         
     def capture(self, Update=False, N=None, waitingCallback=None):
         while(self.ps.isReady() == False): time.sleep(0.01)
@@ -182,7 +219,7 @@ class PicoScope(QWidget):
 
 class PicoScopeInterface(QObject):
     connectStatus = Signal(bool)
-    dataUpdated = Signal(list, int)
+    dataUpdated = Signal(object, int)
     paramListUpdated = Signal(list)    
 
     def __init__(self, parent=None, console=None, showScriptParameter=None):          
@@ -190,6 +227,8 @@ class PicoScopeInterface(QObject):
         self.parent = parent
         self.scopetype = None
         self.datapoints = []
+        self.segmentData = None
+        self._plotUpdate = True
 
         scope_cons = {}
         
@@ -218,7 +257,8 @@ class PicoScopeInterface(QObject):
     def passUpdated(self, lst, offset):
         self.datapoints = lst
         self.offset = offset
-        self.dataUpdated.emit(lst, offset)
+        if self._plotUpdate:
+            self.dataUpdated.emit(lst, offset)
 
     def setCurrentScope(self, scope, update=True):
         if scope is not None:
@@ -243,15 +283,27 @@ class PicoScopeInterface(QObject):
     def doDataUpdated(self,  l, offset=0):
         self.datapoints = l
         self.offset = offset
-        if len(l) > 0:
+        if len(l) > 0 and self._plotUpdate:
             self.dataUpdated.emit(l, offset)
 
     def arm(self):
         self.scopetype.arm()
 
     def capture(self, update=True, NumberPoints=None, waitingCallback=None):
-        """Raises IOError if unknown failure, returns 'True' if successful, 'False' if timeout"""
+        """Raises IOError if unknown failure, returns 'True' if successful, 'False' if timeout. update=False only skips the plot update (dataUpdated signal)"""
+        self._plotUpdate = update
         return self.scopetype.capture(update, NumberPoints, waitingCallback)
+
+    def armSegments(self, nsegs):
+        """Arm for nsegs triggers, read back with captureSegments()"""
+        self.scopetype.armSegments(nsegs)
+
+    def captureSegments(self, update=True, waitingCallback=None):
+        """Wait for all segments & read them into segmentData (one row per trace), returns 'True' if timeout"""
+        self._plotUpdate = update
+        ret = self.scopetype.captureSegments(update, waitingCallback)
+        self.segmentData = self.scopetype.segmentData
+        return ret
         
     def paramList(self):
         p = []       
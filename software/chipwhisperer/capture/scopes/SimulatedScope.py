@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Authors: Colin O'Flynn
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+import numpy as np
+
+class SimulatedScope(object):
+    """
+    Scope without any hardware, for testing the capture code. Every trigger() records one trace of gaussian noise,
+    plus leakage values added at evenly spaced points if given, all shifted by a random number of samples up to
+    +/- jitter. A simulated target calls trigger() when it runs an encryption; for any other target capture()
+    triggers itself so there is always data.
+
+    Supports segmented capture: armSegments(n) records the next n triggers, captureSegments() makes them
+    available as rows of segmentData.
+    """
+
+    def __init__(self, numPoints=5000, noise=0.01, jitter=0, seed=None):
+        self.numPoints = numPoints
+        self.noise = noise
+        self.jitter = jitter
+        self.leakageOffset = 100
+        self.leakageSpacing = 10
+        self.offset = 0
+        self.datapoints = np.zeros(numPoints)
+        self.segmentData = None
+        self._rng = np.random.RandomState(seed)
+        self._nsegs = 0
+        self._count = 0
+
+    def con(self):
+        pass
+
+    def dis(self):
+        pass
+
+    def arm(self):
+        self.armSegments(1)
+
+    def armSegments(self, nsegs):
+        if self.segmentData is None or self.segmentData.shape != (nsegs, self.numPoints):
+            self.segmentData = np.zeros((nsegs, self.numPoints))
+        self._nsegs = nsegs
+        self._count = 0
+
+    def trigger(self, leakage=None):
+        """Record one trace if armed, leakage is a list of values to add to the trace"""
+        if self._count >= self._nsegs:
+            # Not armed, same as a real scope this trigger is missed
+            return
+
+        trace = self.segmentData[self._count]
+        trace[:] = self._rng.standard_normal(self.numPoints)
+        trace *= self.noise
+
+        if leakage is not None:
+            leakage = np.asarray(leakage, dtype=np.float64)
+            points = self.leakageOffset + np.arange(len(leakage)) * self.leakageSpacing
+            if self.jitter:
+                points += self._rng.randint(-self.jitter, self.jitter + 1)
+            points = np.clip(points, 0, self.numPoints - 1)
+            np.add.at(trace, points, leakage)
+
+        self._count += 1
+
+    def capture(self, update=True, NumberPoints=None, waitingCallback=None):
+        """Returns 'False' (no timeout), trace is in datapoints"""
+        return self.captureSegments(update, waitingCallback)
+
+    def captureSegments(self, update=True, waitingCallback=None):
+        """Returns 'False' (no timeout), traces are the rows of segmentData"""
+        while self._count < self._nsegs:
+            self.trigger()
+
+        self._nsegs = 0
+        self.datapoints = self.segmentData[-1]
+
+        if waitingCallback is not None:
+            waitingCallback()
+
+        return False
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Authors: Colin O'Flynn
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+import sys
+
+try:
+    from PySide.QtCore import *
+    from PySide.QtGui import *
+except ImportError:
+    print "ERROR: PySide is required for this program"
+    sys.exit()
+
+from openadc.ExtendedParameter import ExtendedParameter
+
+try:
+    from pyqtgraph.parametertree import Parameter
+except ImportError:
+    print "ERROR: PyQtGraph is required for this program"
+    sys.exit()
+
+from chipwhisperer.capture.scopes.SimulatedScope import SimulatedScope
+
+class SimulatedScopeInterface(QObject):
+    """GUI scope module for SimulatedScope, use with the 'Simulated' connection of the Simple Serial target"""
+    connectStatus = Signal(bool)
+    dataUpdated = Signal(object, int)
+    paramListUpdated = Signal(list)
+
+    def __init__(self, parent=None, console=None, showScriptParameter=None):
+        super(SimulatedScopeInterface, self).__init__(parent)
+        self.parent = parent
+        self.sim = SimulatedScope()
+        self.datapoints = []
+        self.segmentData = None
+        self.offset = 0
+        self._plotUpdate = True
+
+        scopeParams = [{'name':'Sample Length', 'key':'samplelength', 'type':'int', 'limits':(1, 10E6), 'value':self.sim.numPoints, 'set':self.setNumPoints},
+                       {'name':'Noise (RMS)', 'key':'noise', 'type':'float', 'step':1E-3, 'limits':(0, 10), 'value':self.sim.noise, 'set':self.setNoise},
+                       {'name':'Jitter (samples)', 'key':'jitter', 'type':'int', 'limits':(0, 10000), 'value':self.sim.jitter, 'set':self.setJitter},
+                       {'name':'Leakage Offset', 'key':'leakoffset', 'type':'int', 'limits':(0, 10E6), 'value':self.sim.leakageOffset, 'set':self.setLeakageOffset},
+                       {'name':'Leakage Spacing', 'key':'leakspacing', 'type':'int', 'limits':(1, 10E6), 'value':self.sim.leakageSpacing, 'set':self.setLeakageSpacing},
+                      ]
+
+        self.params = Parameter.create(name='Simulated Scope', type='group', children=scopeParams)
+        ExtendedParameter.setupExtended(self.params, self)
+        self.showScriptParameter = showScriptParameter
+
+    def setNumPoints(self, npoints):
+        self.sim.numPoints = npoints
+
+    def setNoise(self, noise):
+        self.sim.noise = noise
+
+    def setJitter(self, jitter):
+        self.sim.jitter = jitter
+
+    def setLeakageOffset(self, offset):
+        self.sim.leakageOffset = offset
+
+    def setLeakageSpacing(self, spacing):
+        self.sim.leakageSpacing = spacing
+
+    def con(self):
+        self.sim.con()
+        self.connectStatus.emit(True)
+
+    def dis(self):
+        self.sim.dis()
+        self.connectStatus.emit(False)
+
+    def trigger(self, leakage=None):
+        self.sim.trigger(leakage)
+
+    def arm(self):
+        self.sim.arm()
+
+    def armSegments(self, nsegs):
+        self.sim.armSegments(nsegs)
+
+    def doDataUpdated(self):
+        self.datapoints = self.sim.datapoints
+        self.segmentData = self.sim.segmentData
+        if self._plotUpdate:
+            self.dataUpdated.emit(self.datapoints, self.offset)
+
+    def capture(self, update=True, NumberPoints=None, waitingCallback=None):
+        """Returns 'False' (no timeout). update=False only skips the plot update (dataUpdated signal)"""
+        self._plotUpdate = update
+        ret = self.sim.capture(update, NumberPoints, waitingCallback)
+        self.doDataUpdated()
+        return ret
+
+    def captureSegments(self, update=True, waitingCallback=None):
+        """Returns 'False' (no timeout), traces are the rows of segmentData"""
+        self._plotUpdate = update
+        ret = self.sim.captureSegments(update, waitingCallback)
+        self.doDataUpdated()
+        return ret
+
+    def paramList(self):
+        return [self.params]
@@ -45,10 +45,11 @@ except ImportError:
 
 from visa import *
 import time
+import numpy as np
 
 class VisaScope(QWidget):
     paramListUpdated = Signal(list)
-    dataUpdated = Signal(list, int)
+    dataUpdated = Signal(object, int)
 
     xScales = {"500 mS":500E-3, "200 mS":200E-3, "100 mS":100E-3, "50 mS":50E-3,
                "20 mS":20E-3, "10 mS":10E-3, "5 mS":5E-3, "2 mS":2E-3, "1 mS":1E-3,
@@ -124,6 +125,28 @@ class VisaScope(QWidget):
         self.dataUpdated.emit(self.datapoints, 0)
         pass
 
+    def decodeWordBlock(self, data):
+        """Decode IEEE 488.2 definite-length block (#<n><length><data>) of signed 16-bit LSB-first words,
+           returns samples as numpy array or None if header is bad"""
+
+        #Find '#' which is start of frame
+        start = data.find('#')
+
+        if start < 0:
+            print "Error in header"
+            return None
+
+        start = start + 1
+        hdrlen = int(data[start])
+
+        start = start + 1
+        datalen = int(data[start:(start + hdrlen)])
+
+        start = start + hdrlen
+
+        #Each is two bytes, view the raw data directly instead of converting each sample
+        return np.frombuffer(data, dtype='<i2', count=datalen // 2, offset=start)
+
 class VisaScopeInterface_DSO1024A(VisaScope):
 
     # TODO: What scales & ranges are allowed on the DSO1024A?
@@ -184,38 +207,11 @@ class VisaScopeInterface_DSO1024A(VisaScope):
         self.visaInst.write(":WAVeform:DATA?")
         data = self.visaInst.read_raw()
 
-        # Find '#' which is start of frame
-        start = data.find('#')
-
-        if start < 0:
-            print "Error in header"
+        wavdata = self.decodeWordBlock(data)
+        if wavdata is None:
             return
 
-        start = start + 1
-        hdrlen = data[start]
-        hdrlen = int(hdrlen)
-
-        # print hdrlen
-
-        start = start + 1
-        datalen = data[start:(start + hdrlen)]
-        datalen = int(datalen)
-        # print datalen
-
-        start = start + hdrlen
-
-        # Each is two bytes
-        wavdata = bytearray(data[start:(start + datalen)])
-
-        self.datapoints = []
-
-        for j in range(0, datalen, 2):
-            data = wavdata[j] | (wavdata[j + 1] << 8)
-
-            if (data & 0x8000):
-                data = -65536 + data
-
-            self.datapoints.append(data)
+        self.datapoints = wavdata
 
         self.dataUpdated.emit(self.datapoints, 0)
 
@@ -297,38 +293,11 @@ class VisaScopeInterface_MSO54831D(VisaScope):
         self.visaInst.write(command)
         data = self.visaInst.read_raw()
 
-        #Find '#' which is start of frame
-        start = data.find('#')
-
-        if start < 0:
-            print "Error in header"
+        wavdata = self.decodeWordBlock(data)
+        if wavdata is None:
             return
 
-        start = start+1
-        hdrlen = data[start]
-        hdrlen = int(hdrlen)
-
-        #print hdrlen
-
-        start = start+1
-        datalen = data[start:(start+hdrlen)]
-        datalen = int(datalen)
-        #print datalen
-
-        start = start+hdrlen
-
-        #Each is two bytes
-        wavdata = bytearray(data[start:(start + datalen)])
-
-        self.datapoints = []
-
-        for j in range(0, datalen, 2):
-            data = wavdata[j] | (wavdata[j+1] << 8)
-
-            if (data & 0x8000):
-                data = -65536 + data
-
-            self.datapoints.append(data)
+        self.datapoints = wavdata
 
         self.dataUpdated.emit(self.datapoints, 0)
 
@@ -336,7 +305,7 @@ class VisaScopeInterface_MSO54831D(VisaScope):
 
 class VisaScopeInterface(QObject):
     connectStatus = Signal(bool)
-    dataUpdated = Signal(list, int)
+    dataUpdated = Signal(object, int)
     paramListUpdated = Signal(list)
 
     def __init__(self, parent=None, console=None, showScriptParameter=None):
@@ -344,6 +313,7 @@ class VisaScopeInterface(QObject):
         self.parent = parent
         self.scopetype = None
         self.datapoints = []
+        self._plotUpdate = True
 
         try:
             mso54831d = VisaScopeInterface_MSO54831D(console=console, showScriptParameter=showScriptParameter)
@@ -397,7 +367,8 @@ class VisaScopeInterface(QObject):
     def passUpdated(self, lst, offset):
         self.datapoints = lst
         self.offset = offset
-        self.dataUpdated.emit(lst, offset)
+        if self._plotUpdate:
+            self.dataUpdated.emit(lst, offset)
 
     def setCurrentScope(self, scope, update=True):
         self.scopetype = scope
@@ -418,14 +389,15 @@ class VisaScopeInterface(QObject):
     def doDataUpdated(self,  l, offset=0):
         self.datapoints = l
         self.offset = offset
-        if len(l) > 0:
+        if len(l) > 0 and self._plotUpdate:
             self.dataUpdated.emit(l, offset)
 
     def arm(self):
         self.scopetype.arm()
 
     def capture(self, update=True, NumberPoints=None, waitingCallback=None):
-        """Raises IOError if unknown failure, returns 'False' if successful, 'True' if timeout"""
+        """Raises IOError if unknown failure, returns 'False' if successful, 'True' if timeout. update=False only skips the plot update (dataUpdated signal)"""
+        self._plotUpdate = update
         return self.scopetype.capture(update, NumberPoints, waitingCallback)
 
     def paramList(self):
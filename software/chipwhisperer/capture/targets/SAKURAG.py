@@ -346,8 +346,8 @@ class SakuraG(TargetTemplate):
         self.hw.write(0x0002, 0x00, 0x02)
 
         #Wait for done
-        while self.isDone() == False:
-            continue
+        if self.waitDone(1.0) == False:
+            raise IOError("Timeout waiting for SAKURA-G key schedule")
 
     def loadInput(self, inputtext):
         self.hw.write(0x0140, inputtext[0], inputtext[1])
@@ -42,7 +42,12 @@ except ImportError:
 from openadc.ExtendedParameter import ExtendedParameter
 
 import ChipWhispererTargets
-from TargetTemplate import TargetTemplate
+from TargetTemplate import TargetTemplate, pollDone
+
+def waitKeyDone(isDone, timeout=1.0):
+    """Wait for isDone() without spinning, raises IOError if the board isn't done after timeout seconds"""
+    if pollDone(isDone, timeout) == False:
+        raise IOError("Timeout waiting for SASEBO-GII")
 
 class SaseboGIIDPAContest(object):
     def init(self):
@@ -59,8 +64,7 @@ class SaseboGIIDPAContest(object):
         self.write(0x000A, 0x00, 0x00)
         
         self.write(0x0002, 0x00, 0x02)
-        while self.isDone() == False:
-            continue
+        waitKeyDone(self.isDone)
 
     def setModeEncrypt(self):
         self.write(0x000C, 0x00, 0x00)
@@ -86,8 +90,7 @@ class SaseboGIIDPAContest(object):
 
         #Generate key
         self.write(0x0002, 0x00, 0x02)
-        while self.isDone() == False:
-            continue
+        waitKeyDone(self.isDone)
 
     def loadInput(self, inputtext):
         self.write(0x0140, inputtext[0], inputtext[1])
@@ -159,8 +162,7 @@ class SaseboGIIAESRev1(object):
         #Generate key
         self.write(0x0002, 0x00, 0x02)
 
-        while self.isDone() == False:
-            continue
+        waitKeyDone(self.isDone)
 
     def loadInput(self, inputtext):
         self.write(0x0140, inputtext[0], inputtext[1])
@@ -301,8 +303,7 @@ class SaseboGII(TargetTemplate):
         
         #Generate key
         self.write(0x0002, 0x00, 0x02)
-        while self.isDone() == False:
-            continue
+        self.timeoutWait()
 
     def setModeEncrypt(self):
         self.write(0x000C, 0x00, 0x00)
@@ -313,13 +314,9 @@ class SaseboGII(TargetTemplate):
     def checkEncryptionKey(self, key):          
         return key 
     
-    def timeoutWait(self, timeout=100):
-        tm = 0
-        while self.isDone() == False:
-            tm += 1
-            if tm > timeout:
-                raise IOError("Timeout")
-        
+    def timeoutWait(self, timeout=1.0):
+        if self.waitDone(timeout) == False:
+            raise IOError("Timeout waiting for SASEBO-GII")
 
     def loadEncryptionKey(self, key):
         """Encryption key is bytearray"""
@@ -42,6 +42,8 @@ from openadc.ExtendedParameter import ExtendedParameter
 import openadc.scan as scan
 
 from chipwhisperer.capture.scopes.ChipWhispererLite import USART as CWLite_USART
+from chipwhisperer.capture.targets.SimulatedTarget import SimulatedAES, SimulatedSerial
+import chipwhisperer.capture.global_mod as global_mod
 
 class SimpleSerial_serial(TargetTemplate):
     def setupParameters(self):
@@ -163,10 +165,14 @@ class SimpleSerial_ChipWhisperer(TargetTemplate):
                                     'set':self.setStopBits, 'readonly':True},
                     {'name':'Parity', 'key':'parity', 'type':'list', 'values':{'None':'n', 'Even':'e'}, 'value':0, 'get':self.parity,
                                     'set':self.setParity, 'readonly':True},
+                    {'name':'Burst Transfers', 'key':'burst', 'type':'bool', 'value':False, 'set':self.setBurst,
+                                    'tip':'Send a whole command & read all waiting bytes in one register access. Needs an FPGA bitstream '
+                                    'where every byte of a data register access goes to/from the FIFO.'},
                     ]
+        self._regVer = 0
+        self._burst = False
         self.params = Parameter.create(name='Serial Port Settings', type='group', children=ssParams)
         ExtendedParameter.setupExtended(self.params, self)
-        self._regVer = 0
 
 
     def paramTreeChanged(self, param, changes):
@@ -278,14 +284,20 @@ class SimpleSerial_ChipWhisperer(TargetTemplate):
         #    self.debugLog(lastTx, lastRx)
         pass
 
+    def setBurst(self, enabled):
+        self._burst = enabled
+
     def write(self, string):
+        if isinstance(string, basestring):
+            string = bytearray(string, 'latin-1')
+
+        if self._burst:
+            self.oa.sendMessage(self.CODE_WRITE, self.ADDR_DATA, bytearray(string), Validate=False)
+            self.debugInfo(string)
+            return
+
         for s in string:
-            if isinstance(string, basestring):
-                d = bytearray(s, 'latin-1')
-            else:
-                d = [s]
-            #print "%x"%d[0]
-            self.oa.sendMessage(self.CODE_WRITE, self.ADDR_DATA, d, Validate=False)
+            self.oa.sendMessage(self.CODE_WRITE, self.ADDR_DATA, [s], Validate=False)
 
             self.debugInfo(s)
 
@@ -295,26 +307,47 @@ class SimpleSerial_ChipWhisperer(TargetTemplate):
         # print "%d waiting"%resp
         return resp
 
+    def _readFIFO(self, num):
+        """Read num bytes the FIFO reports as waiting"""
+        if self._burst:
+            resp = self.oa.sendMessage(self.CODE_READ, self.ADDR_DATA, Validate=False, maxResp=num)
+            if resp:
+                return bytearray(resp[0:num])
+            return bytearray()
+
+        data = bytearray()
+        for i in range(0, num):
+            resp = self.oa.sendMessage(self.CODE_READ, self.ADDR_DATA, Validate=False, maxResp=1)
+            if resp:
+                data.append(resp[0])
+        return data
+
     def read(self, num=0, timeout=100):
+        """Read num bytes, waiting up to timeout*10 mS for them to arrive"""
         waiting = self.inWaiting()
         data = bytearray()
 
         #TODO: why is this needed? Some garbage at front...
         # num = num + 1
 
-        while (len(data) < num) and (timeout > 1):
+        deadline = time.time() + timeout * 0.01
+        delay = 0.0005
+
+        while len(data) < num:
             if waiting > 0:
-                resp = self.oa.sendMessage(self.CODE_READ, self.ADDR_DATA, Validate=False, maxResp=1)
-                if resp:
-                    data.append(resp[0])
+                #Everything already waiting can be read without asking again
+                data += self._readFIFO(min(waiting, num - len(data)))
+                delay = 0.0005
+                if len(data) == num:
+                    break
+            elif time.time() > deadline:
+                self.log("CW Serial timed out")
+                break
             else:
-                time.sleep(0.01)
-                timeout = timeout - 1
+                time.sleep(delay)
+                delay = min(delay * 2, 0.01)
             waiting = self.inWaiting()
 
-        if timeout <= 0:
-            self.log("CW Serial timed out")
-
         #TODO: fix removing garbage at front
         # result = data[1:(len(data)+1)]
         result = data
@@ -325,7 +358,7 @@ class SimpleSerial_ChipWhisperer(TargetTemplate):
     def flush(self):
         waiting = self.inWaiting()
         while waiting > 0:
-            self.oa.sendMessage(self.CODE_READ, self.ADDR_DATA, Validate=False, maxResp=1)
+            self._readFIFO(waiting)
             waiting = self.inWaiting()
 
     def flushInput(self):
@@ -339,13 +372,51 @@ class SimpleSerial_ChipWhisperer(TargetTemplate):
         self.checkVersion()
         self.params.getAllParameters()
 
+class SimpleSerial_Simulated(TargetTemplate):
+    def setupParameters(self):
+        ssParams = [{'name':'Leakage Gain', 'key':'gain', 'type':'float', 'step':1E-3, 'value':0.01, 'set':self.setGain,
+                     'tip':'Leakage is sent to the scope if the scope module is the simulated scope'}]
+        self.ser = SimulatedSerial(SimulatedAES())
+        self.params = Parameter.create(name='Simulated Device', type='group', children=ssParams)
+        ExtendedParameter.setupExtended(self.params, self)
+
+    def paramList(self):
+        return [self.params]
+
+    def setGain(self, gain):
+        self.ser.device.gain = gain
+
+    def write(self, string):
+        # Leak to whatever scope is selected now
+        self.ser.device.scope = global_mod.active_scope
+        self.ser.write(string)
+
+    def inWaiting(self):
+        return self.ser.inWaiting()
+
+    def read(self, num=0, timeout=100):
+        return self.ser.read(num)
+
+    def flush(self):
+        self.ser.flushInput()
+
+    def flushInput(self):
+        self.ser.flushInput()
+
+    def close(self):
+        pass
+
+    def con(self):
+        pass
+
 class SimpleSerial(TargetTemplate):
     paramListUpdated = Signal(list)
 
     def setupParameters(self):
         ssParams = [{'name':'connection', 'type':'list', 'key':'con', 'values':{"System Serial Port":SimpleSerial_serial(showScriptParameter=self.showScriptParameter),
                                                                                 "ChipWhisperer":SimpleSerial_ChipWhisperer(showScriptParameter=self.showScriptParameter),
-                                                                                "ChipWhisperer-Lite":SimpleSerial_ChipWhispererLite(showScriptParameter=self.showScriptParameter)},
+                                                                                "ChipWhisperer-Lite":SimpleSerial_ChipWhispererLite(showScriptParameter=self.showScriptParameter),
+                                                                                "Simulated":SimpleSerial_Simulated(showScriptParameter=self.showScriptParameter)},
                                                                                 'value':"System Serial Port", 'set':self.setConnection},
                     {'name':'Key Length', 'type':'list', 'values':[128, 256], 'value':128, 'set':self.setKeyLen},
                  #   {'name':'Plaintext Command', 'key':'ptcmd', 'type':'list', 'values':['p', 'h'], 'value':'p'},
@@ -0,0 +1,174 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Authors: Colin O'Flynn
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+
+import binascii
+
+import numpy as np
+
+from chipwhisperer.common.aes_cipher import AESCipher
+from chipwhisperer.analyzer.attacks.models import AES128_8bit
+from chipwhisperer.analyzer.models.aes.key_schedule import keyScheduleRounds
+
+class SimulatedAES(object):
+    """
+    AES-128 device without any hardware. Encrypts like the real firmware, and each encryption sends the leakage
+    of all 16 bytes (using the analyzer's AES128_8bit model, so an attack with that model should work) scaled by
+    gain to scope.trigger(). scope is normally a SimulatedScope, anything else is ignored.
+    """
+
+    def __init__(self, scope=None, leakageModel=AES128_8bit.LEAK_HW_SBOXOUT_FIRSTROUND, gain=0.01):
+        self.scope = scope
+        self.leakageModel = leakageModel
+        self.gain = gain
+        self.setKey([0] * 16)
+
+    def setKey(self, key):
+        self.key = list(key)
+        expanded = []
+        for r in range(0, 11):
+            expanded.extend(keyScheduleRounds(self.key, 0, r))
+        self._cipher = AESCipher(expanded)
+        self._modelKey = AES128_8bit.processKnownKey(self.leakageModel, self.key)
+
+    def encrypt(self, pt):
+        pt = list(pt)
+        ct = self._cipher.cipher_block(list(pt))
+
+        if self.scope is not None:
+            leak = [AES128_8bit.leakage(pt, ct, self._modelKey[b], b, self.leakageModel, None) for b in range(0, 16)]
+            try:
+                self.scope.trigger(np.array(leak, dtype=np.float64) * self.gain)
+            except AttributeError:
+                # Not a simulated scope
+                pass
+
+        return ct
+
+class SimulatedSerial(object):
+    """
+    Serial port (same methods as pyserial) with a SimpleSerial AES device on the other end: 'k<key>\\n' loads
+    the key, 'p<text>\\n' encrypts & replies 'r<ciphertext>\\n', 'x' resets. Hex is upper or lower case.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self._line = ""
+        self._out = ""
+
+    def write(self, data):
+        self._line += str(data)
+        while "\n" in self._line:
+            cmd, self._line = self._line.split("\n", 1)
+            self._command(cmd.lstrip("x").strip())
+
+    def _command(self, cmd):
+        if len(cmd) == 0:
+            return
+
+        try:
+            data = bytearray(binascii.unhexlify(cmd[1:]))
+        except TypeError:
+            # Not hex, real device would ignore it too
+            return
+
+        if cmd[0] == 'k':
+            self.device.setKey(data)
+        elif cmd[0] == 'p':
+            ct = self.device.encrypt(data)
+            self._out += "r" + "".join(["%02X" % c for c in ct]) + "\n"
+
+    def inWaiting(self):
+        return len(self._out)
+
+    def read(self, num=0, timeout=None):
+        if num == 0:
+            num = len(self._out)
+        data = self._out[0:num]
+        self._out = self._out[num:]
+        return data
+
+    def flushInput(self):
+        self._out = ""
+
+    def close(self):
+        pass
+
+class SimulatedTarget(object):
+    """
+    Target for scripts & benchmarks without the GUI: has the TargetTemplate methods used by the capture code,
+    and encrypts with a SimulatedAES sending leakage to scope. For the GUI, use the 'Simulated' connection of
+    the Simple Serial target instead.
+    """
+
+    def __init__(self, scope=None, leakageModel=AES128_8bit.LEAK_HW_SBOXOUT_FIRSTROUND, gain=0.01):
+        self.device = SimulatedAES(scope, leakageModel, gain)
+        self.key = None
+        self.input = None
+        self._output = None
+
+    def con(self):
+        pass
+
+    def dis(self):
+        pass
+
+    def close(self):
+        pass
+
+    def reinit(self):
+        pass
+
+    def setModeEncrypt(self):
+        pass
+
+    def keyLen(self):
+        return 16
+
+    def checkEncryptionKey(self, key):
+        return key
+
+    def loadEncryptionKey(self, key):
+        self.key = key
+        if key:
+            self.device.setKey(key)
+
+    def loadInput(self, inputtext):
+        self.input = inputtext
+
+    def go(self):
+        self._output = bytearray(self.device.encrypt(self.input))
+
+    def isDone(self):
+        return True
+
+    def waitDone(self, timeout=None):
+        return True
+
+    def readOutput(self):
+        return self._output
+
+    def getExpected(self):
+        return self._output
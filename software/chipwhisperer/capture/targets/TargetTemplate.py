@@ -23,6 +23,7 @@
 #    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
 #=================================================
 import sys
+import time
 
 from PySide.QtCore import *
 from PySide.QtGui import *
@@ -40,6 +41,17 @@ try:
 except ImportError:
     AES = None
 
+def pollDone(isDone, timeout=None):
+    """Call isDone() with an increasing sleep (0.1ms up to 10ms) until it returns True, or False after timeout seconds"""
+    start = time.time()
+    delay = 0.0001
+    while isDone() == False:
+        if timeout is not None and (time.time() - start) > timeout:
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, 0.01)
+    return True
+
 class TargetTemplate(QObject):
     paramListUpdated = Signal(list)
     newInputData = Signal(list)
@@ -124,6 +136,12 @@ class TargetTemplate(QObject):
         """If encryption takes some time after 'go' called, lets user poll if done"""
         return True
 
+    def waitDone(self, timeout=None):
+        """Block until done or timeout (in seconds, None waits forever). Returns False on timeout.
+
+        Polls isDone() with an increasing sleep, overload if the hardware can block until done."""
+        return pollDone(self.isDone, timeout)
+
     def readOutput(self):        
         """Read result"""
 
@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Authors: Colin O'Flynn
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+"""
+Capture pipeline benchmark using the simulated scope & target, so it runs on any machine without hardware or
+a display. Reports traces/second for each phase of the capture loop. Run with:
+
+    python -m chipwhisperer.capture.utils.CaptureBenchmark --traces 5000 --writer native
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from chipwhisperer.capture.CaptureEngine import CaptureEngine
+from chipwhisperer.capture.scopes.SimulatedScope import SimulatedScope
+from chipwhisperer.capture.targets.SimulatedTarget import SimulatedTarget
+
+class RandomTextPattern(object):
+    """Fixed key, random plaintext (same as the 'Basic' pattern, which needs the GUI)"""
+
+    def __init__(self, seed=0):
+        self.key = bytearray(range(0, 16))
+        self._rng = np.random.RandomState(seed)
+
+    def initPair(self):
+        pass
+
+    def newPair(self):
+        return (self.key, bytearray(self._rng.randint(0, 256, 16).astype(np.uint8).tostring()))
+
+def makeWriter(writerType, directory, ntraces):
+    """Trace writer saving into directory, or None. Trace containers need PySide for their config"""
+    if writerType == "none":
+        return None
+    elif writerType == "native":
+        from chipwhisperer.common.traces.TraceContainerNative import TraceContainerNative
+        writer = TraceContainerNative()
+    elif writerType == "chunked":
+        from chipwhisperer.common.traces.TraceContainerChunked import TraceContainerChunked
+        writer = TraceContainerChunked()
+    else:
+        raise ValueError("Invalid writer: %s" % writerType)
+
+    writer.config.setAttr("prefix", "bench_")
+    writer.config.setConfigFilename(os.path.join(directory, "config_bench_.cfg"))
+    writer.setTraceHint(ntraces)
+    return writer
+
+def runBenchmark(ntraces=1000, npoints=5000, segments=1, pipelined=False, writerType="none", noise=0.01, jitter=0):
+    """Capture ntraces simulated traces, returns dictionary of traces/second for each phase & 'total'"""
+    scope = SimulatedScope(npoints, noise=noise, jitter=jitter, seed=0)
+    target = SimulatedTarget(scope)
+    directory = tempfile.mkdtemp(prefix="cwbench")
+
+    try:
+        writer = makeWriter(writerType, directory, ntraces)
+        engine = CaptureEngine(scope, target, writer, keyTextPattern=RandomTextPattern())
+        engine.setMaxtraces(ntraces)
+        engine.setSegments(segments)
+        engine.setPipelined(pipelined)
+
+        start = time.time()
+        engine.doReadings()
+        total = time.time() - start
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    rates = dict((name, ntraces / t if t > 0 else float('inf')) for name, t in engine.phaseTimes.items())
+    rates['total'] = ntraces / total
+    return rates
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the capture pipeline with a simulated scope & target")
+    parser.add_argument("--traces", type=int, default=1000)
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--segments", type=int, default=1, help="Traces per arm (segmented capture)")
+    parser.add_argument("--pipelined", action="store_true")
+    parser.add_argument("--writer", choices=["none", "native", "chunked"], default="none")
+    parser.add_argument("--noise", type=float, default=0.01)
+    parser.add_argument("--jitter", type=int, default=0)
+    args = parser.parse_args()
+
+    rates = runBenchmark(args.traces, args.points, args.segments, args.pipelined, args.writer, args.noise, args.jitter)
+
+    print "%d traces x %d points, writer=%s, segments=%d, pipelined=%s" % (args.traces, args.points, args.writer,
+                                                                          args.segments, args.pipelined)
+    for name in CaptureEngine.phaseNames + ['total']:
+        print "%-10s %12.1f traces/s" % (name, rates[name])
+
+if __name__ == "__main__":
+    main()
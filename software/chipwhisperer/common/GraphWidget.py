@@ -37,6 +37,8 @@ except ImportError:
     print "ERROR: PyQtGraph is required for this program"
     sys.exit()
 
+import numpy as np
+
 import chipwhisperer.common.qrc_resources
 
 class ColorDialog(QDialog):
@@ -281,7 +283,7 @@ class GraphWidget(QWidget):
             self.acolor = self.color
             self.pw.clear()
             
-        xaxis = range(startoffset, len(trace)+startoffset)
+        xaxis = np.arange(startoffset, len(trace)+startoffset)
             
         if pen is None:
             pen = pg.mkPen(self.acolor)
@@ -18,7 +18,11 @@ Licensed under the MIT license http://www.opensource.org/licenses/mit-license.ph
 """
 __author__ = "Adam Newman"
 
-import aes_tables
+try:
+    import aes_tables
+except ImportError:
+    # Tables live in chipwhisperer.capture
+    from chipwhisperer.capture import aes_tables
 
 class AESCipher:
     """Perform single block AES cipher/decipher"""
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import traceback
+from collections import deque
+from functools import partial
+
+import numpy as np
+
+class BackgroundTraceWriter(object):
+    """
+    Saves trace segments (or chunks of traces) from a worker thread, so the capture hardware isn't idle
+    while data is written to disk. Jobs run one at a time in the order they were submitted.
+
+    submit() blocks while more than maxBytes of data is waiting to be written, so a slow disk slows the
+    capture down instead of using up all the memory. Errors in the worker are raised as IOError from the
+    next submit(), wait() or close().
+    """
+
+    def __init__(self, maxBytes=256*1024*1024):
+        self.maxBytes = maxBytes
+        self._jobs = deque()
+        self._queuedBytes = 0
+        self._submitted = 0
+        self._done = 0
+        self._tickets = {}
+        self._error = None
+        self._running = True
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="BackgroundTraceWriter")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, func, nbytes=0):
+        """Queue func() to run in the writer thread, nbytes is the memory it holds. Returns a ticket for wait()"""
+        with self._cond:
+            self._checkError()
+            while self._jobs and self._queuedBytes + nbytes > self.maxBytes:
+                self._cond.wait()
+                self._checkError()
+
+            self._submitted += 1
+            self._queuedBytes += nbytes
+            self._jobs.append((self._submitted, func, nbytes))
+            self._cond.notify_all()
+            return self._submitted
+
+    def closeWriter(self, writer):
+        """Save & close a finished segment, keeping its traces in memory (closeAll(clearTrace=False))"""
+        # Config is saved here in the caller's thread, which owns it, so it's already current when the caller
+        # goes on to use the segment. The job only writes the trace data files.
+        writer.writeDataToConfig()
+        writer.config.saveTrace()
+
+        nbytes = 0
+        if isinstance(writer.traces, np.ndarray):
+            nbytes = writer.traces.nbytes
+
+        with self._cond:
+            ticket = self.submit(partial(writer.closeAll, clearTrace=False, saveConfig=False), nbytes)
+            self._tickets[writer] = ticket
+        return ticket
+
+    def wait(self, ticket=None):
+        """Wait for a job to finish. ticket can be from submit(), a writer passed to closeWriter(), or None for all jobs"""
+        with self._cond:
+            if ticket is None:
+                ticket = self._submitted
+            elif not isinstance(ticket, (int, long)):
+                # Writers are dropped once their job is done
+                ticket = self._tickets.get(ticket, 0)
+
+            while self._done < ticket and self._error is None:
+                self._cond.wait()
+            self._checkError()
+
+    def close(self):
+        """Finish all queued jobs & stop the thread"""
+        try:
+            self.wait()
+        finally:
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+            self._thread.join()
+
+    def _checkError(self):
+        if self._error is not None:
+            err = self._error
+            self._error = None
+            raise IOError("Background trace writer failed: %s" % err)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._jobs and self._running:
+                    self._cond.wait()
+
+                if not self._jobs:
+                    return
+
+                # Job stays queued until done, so its memory counts against maxBytes
+                (ticket, func, nbytes) = self._jobs[0]
+
+            err = None
+            try:
+                func()
+            except Exception, e:
+                traceback.print_exc()
+                err = str(e)
+
+            with self._cond:
+                self._jobs.popleft()
+                self._queuedBytes -= nbytes
+                self._done = ticket
+                for writer in [w for (w, t) in self._tickets.items() if t <= ticket]:
+                    del self._tickets[writer]
+                if err is not None:
+                    self._error = err
+                self._cond.notify_all()
@@ -78,6 +78,7 @@ class TraceContainer(object):
         self.pointhint = 0
         self._numTraces = 0
         self._isloaded = False
+        self.backgroundWriter = None
         
         if params is not None:
             self.getParams = params
@@ -97,7 +98,7 @@ class TraceContainer(object):
             return 0
         
     def setTraceBuffer(self, tracebuffer):
-        """Reuse a trace buffer allocated elsewhere"""
+        """Reuse a trace buffer allocated elsewhere. Ignored by addWave() if the number of points or dtype differ"""
         self.traces = tracebuffer
 
     def setTraceHint(self, traces):
@@ -112,7 +113,7 @@ class TraceContainer(object):
             self._numTraces = max(cfint, self._numTraces)
         return self._numTraces
 
-    def addTrace(self, trace, textin, textout, key, dtype=np.double):
+    def addTrace(self, trace, textin, textout, key, dtype=None):
         self.addWave(trace, dtype)
         self.addTextin(textin)
         self.addTextout(textout)
@@ -122,34 +123,36 @@ class TraceContainer(object):
         self.config.setAttr("numTraces", self.numTraces())
         self.config.setAttr("numPoints", self.numPoints())      
 
-    def addWave(self, trace, dtype=None):                
+    def addWave(self, trace, dtype=None):
+        """
+        Append one trace. The trace array grows geometrically when the trace hint was too small, so appending
+        stays amortized O(1). The config is not updated here, formats do that when the segment is saved.
+        """
+        if dtype is None:
+            dtype = self.tracedtype
 
         try:
+            if self.traces is not None and self._numTraces == 0:
+                # Buffer from setTraceBuffer() can only be reused if it matches this capture
+                if self.traces.shape[1] != len(trace) or self.traces.dtype != dtype:
+                    self.traces = None
+
             if self.traces is None:
-                if dtype is None:
-                    dtype = np.double
                 self.tracedtype = dtype
-                self.traces = np.zeros((self.tracehint, len(trace)), dtype=dtype)
-                self.traces[self._numTraces][:] = trace
-            else:
-                # Check can fit this
-                if self.traces.shape[0] <= self._numTraces:
-                    if self._numTraces >= self.tracehint:
-                        # Tracehint wrong - increase by 25
-                        self.tracehint += 25
-
-                    print self.tracehint
-
-                    # Do a resize now to allocate more memory
-                    self.traces.resize((self.tracehint, self.traces.shape[1]))
-
-                self.traces[self._numTraces][:] = trace
+                self.traces = np.zeros((max(self.tracehint, 1), len(trace)), dtype=dtype)
+            elif self.traces.shape[0] <= self._numTraces:
+                # Tracehint wrong - grow by 50%, copying into a new array as the old one may be shared
+                self.tracehint = max(self.tracehint, self.traces.shape[0] + self.traces.shape[0] // 2 + 1)
+                newtraces = np.zeros((self.tracehint, self.traces.shape[1]), dtype=self.traces.dtype)
+                newtraces[0:self._numTraces] = self.traces[0:self._numTraces]
+                self.traces = newtraces
+
+            self.traces[self._numTraces][:] = trace
         except MemoryError:
-            raise MemoryError("Failed to allocate/resize array for %d x %d, if you have sufficient memory it may be fragmented. Use smaller segments and retry." % (self.tracehint, self.traces.shape[1]))
-            
+            raise MemoryError("Failed to allocate/resize array for %d x %d, if you have sufficient memory it may be fragmented. Use smaller segments and retry." % (self.tracehint, len(trace)))
+
         self._numTraces += 1
         self.setDirty(True)
-        self.writeDataToConfig()
 
     def setKnownKey(self, key):
         self.knownkey = key
@@ -183,6 +186,36 @@ class TraceContainer(object):
                 return self.keylist[n]
 
         return self.knownkey
+
+    def _itemBlock(self, store, getItem, start, end):
+        """Items start to end-1 from store, or one at a time from getItem() if a subclass doesn't keep them in store"""
+        # Stored arrays may have more rows allocated than traces added
+        if start < 0 or end > self.numTraces():
+            raise IndexError("Block %d-%d is outside the %d traces" % (start, end, self.numTraces()))
+        if store is None or len(store) < end:
+            return np.asarray([getItem(n) for n in range(start, end)])
+        return np.asarray(store[start:end])
+
+    def getTraceBlock(self, start, end, pointRange=None):
+        """Get traces start to end-1 as a 2-D array. This is a view of the stored data when possible, not a copy"""
+        data = self._itemBlock(self.traces, self.getTrace, start, end)
+        if pointRange is not None:
+            data = data[:, pointRange[0]:pointRange[1]]
+        return data
+
+    def getTextinBlock(self, start, end):
+        return self._itemBlock(self.textins, self.getTextin, start, end)
+
+    def getTextoutBlock(self, start, end):
+        return self._itemBlock(self.textouts, self.getTextout, start, end)
+
+    def getKnownKeyBlock(self, start, end):
+        """Get known keys start to end-1 as a list"""
+        if hasattr(self, 'keylist'):
+            if self.keylist is not None:
+                return list(self.keylist[start:end])
+
+        return [self.knownkey] * (end - start)
     
     def getAuxDataConfig(self, newmodule):
         """
@@ -253,6 +286,17 @@ class TraceContainer(object):
         return newdict
 
 
+    def setBackgroundWriter(self, bgwriter):
+        """Formats which write to disk during capture can hand blocks of traces to this BackgroundTraceWriter"""
+        self.backgroundWriter = bgwriter
+
+    def setSampleFormat(self, dtype, gain=1.0, offset=0.0):
+        """
+        Placeholder called before capture with the scope's raw sample format, where the scope value is
+        sample * gain + offset. Formats which can store raw samples do so, others keep floating point.
+        """
+        pass
+
     def prepareDisk(self):
         """Placeholder called after creating a new file setup, but before actually writing traces to it"""
         
@@ -0,0 +1,388 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import bisect
+from collections import OrderedDict
+from functools import partial
+
+import numpy as np
+import TraceContainerNative
+from TraceContainerConfig import makeAttrDict
+
+from pyqtgraph.parametertree import Parameter
+from openadc.ExtendedParameter import ExtendedParameter
+
+class parameters(object):
+    def __init__(self, openMode=False):
+        traceParams = [{'name':'Chunked Storage', 'type':'group', 'children':[
+                        {'name':'Traces per Chunk', 'key':'chunkSize', 'type':'int', 'limits':(1, 1E6), 'value':1000},
+                        {'name':'Compression', 'key':'compression', 'type':'list', 'values':['zlib', 'none'], 'value':'zlib'},
+                        {'name':'Sample Encoding', 'key':'encoding', 'type':'list', 'values':{'ADC Codes (lossless)':'adc', 'Floating Point':'float'}, 'value':'adc'},
+                        {'name':'ADC Bits', 'key':'adcBits', 'type':'int', 'limits':(1, 16), 'value':10},
+                        {'name':'ADC Offset', 'key':'adcOffset', 'type':'float', 'value':-0.5},
+                      ]}]
+
+        self.traceParams = traceParams
+
+        self.params = Parameter.create(name='Chunked Storage Settings', type='group', children=traceParams)
+        ExtendedParameter.setupExtended(self.params, self)
+
+    def paramList(self):
+        return [self.params]
+
+class TraceContainerChunked(TraceContainerNative.TraceContainerNative):
+    """
+    Stores traces as fixed-size chunks, each one a .npz file holding separate trace, textin, textout and key
+    columns, plus an index file listing the first trace & number of traces in each chunk. Chunks are written
+    as the capture runs so a segment never has to fit in memory, and reading only decodes the chunks used.
+
+    With 'ADC Codes' encoding, traces which are really N-bit ADC samples scaled to floats (code / 2^N + offset,
+    as OpenADC returns them) are stored as the integer codes, which is exact. Chunks where that doesn't hold
+    are stored as floating point instead.
+    """
+
+    getParamsClass = parameters
+    getParams = parameters()
+
+    #Number of decoded chunks kept in memory when reading
+    chunkCacheSize = 4
+
+    def __init__(self, params=None, configfile=None):
+        super(TraceContainerChunked, self).__init__(params=params)
+
+        #Save extra configuration options
+        self.attrDict = makeAttrDict("Chunked Config", "chunked", self.getParams.traceParams)
+        self.config.attrList.append(self.attrDict)
+
+        #Format name must agree with names from TraceContainerFormatList
+        self.config.setAttr("format", "chunked")
+
+        if configfile is not None:
+            self.config.loadTrace(configfile)
+
+        self._index = np.zeros((0, 2), dtype=np.int64)
+        self._starts = []
+        self._chunkCache = OrderedDict()
+        self._columns = {}
+        self._numPoints = 0
+        self._wbuf = None
+        self._wcount = 0
+        self._warnedEncoding = False
+
+    def _setting(self, key):
+        return self.config.attr(key, "chunked")
+
+    def _filename(self, name):
+        directory = self.directory
+        if directory is None:
+            directory = os.path.dirname(self.config.configFilename())
+
+        prefix = self.prefix
+        if prefix is None:
+            prefix = self.config.attr("prefix")
+
+        return directory + "/" + prefix + name
+
+    def _chunkFilename(self, cnum):
+        return self._filename("chunk%05d.npz" % cnum)
+
+    def loadAllConfig(self):
+        for p in self.getParams.traceParams[0]['children']:
+            try:
+                val = self._setting(p["key"])
+                self.getParams.findParam(p["key"]).setValue(val)
+            except ValueError:
+                pass
+
+    def prepareDisk(self):
+        #Save attributes from config settings
+        for p in self.getParams.traceParams[0]['children']:
+            self.config.setAttr(p["key"], self.getParams.findParam(p["key"]).value(), "chunked")
+
+        self._index = np.zeros((0, 2), dtype=np.int64)
+        self._starts = []
+        self._numTraces = 0
+        self._wbuf = None
+        self._wcount = 0
+
+    def setSampleFormat(self, dtype, gain=1.0, offset=0.0):
+        """Chunks record their own encoding (see 'Sample Encoding'), traces are buffered as floating point"""
+        pass
+
+    def addTrace(self, trace, textin, textout, key, dtype=np.double):
+        if self._wbuf is None:
+            self._numPoints = len(trace)
+            self._wbuf = np.zeros((int(self._setting("chunkSize")), self._numPoints), dtype=dtype)
+            self._wtextins = []
+            self._wtextouts = []
+            self._wkeys = []
+
+        self._wbuf[self._wcount][:] = trace
+        self._wtextins.append(textin)
+        self._wtextouts.append(textout)
+        self._wkeys.append(key)
+        self._wcount += 1
+        self._numTraces += 1
+        self.setDirty(True)
+
+        if self._wcount == self._wbuf.shape[0]:
+            self._flushChunk(background=True)
+
+    def _textColumn(self, data):
+        try:
+            return np.array(data, dtype=np.uint8)
+        except (TypeError, ValueError):
+            #Missing (None) entries - column isn't stored
+            return None
+
+    def _encodeTraces(self, traces):
+        """Convert traces to ADC codes if that can be done exactly, returns dictionary of arrays to store"""
+        if self._setting("encoding") == 'adc':
+            bits = int(self._setting("adcBits"))
+            offset = float(self._setting("adcOffset"))
+            gain = 1.0 / (1 << bits)
+            codes = np.round((traces - offset) / gain)
+            if codes.min() >= 0 and codes.max() < (1 << bits) and np.array_equal(codes * gain + offset, traces):
+                return {'traces':codes.astype(np.uint16), 'gain':np.float64(gain), 'offset':np.float64(offset)}
+
+            if not self._warnedEncoding:
+                print "WARNING: Traces are not %d-bit ADC codes, storing as floating point" % bits
+                self._warnedEncoding = True
+
+        return {'traces':traces}
+
+    def _flushChunk(self, background=False, saveConfig=True):
+        """
+        Write buffered traces out as a new chunk & update the index, from the background writer if requested.
+        The config is saved too unless saveConfig is False.
+        """
+        if self._wcount == 0:
+            return
+
+        first = int(self._index[-1].sum()) if len(self._index) else 0
+        self._index = np.vstack((self._index, [[first, self._wcount]]))
+        self._starts.append(first)
+        self._columns = {}
+
+        job = partial(self._writeChunk, len(self._index) - 1, self._wbuf[0:self._wcount],
+                      self._wtextins, self._wtextouts, self._wkeys, self._index.copy())
+
+        if background and self.backgroundWriter is not None:
+            # Buffer now belongs to the job, capture continues into a new one
+            self.backgroundWriter.submit(job, self._wbuf.nbytes)
+            self._wbuf = np.zeros_like(self._wbuf)
+        else:
+            job()
+
+        #Keep the config file current, so everything flushed can be read if the capture is interrupted. This is
+        #done here rather than in the job, as the config belongs to the capture thread.
+        if saveConfig:
+            self.config.setAttr("numTraces", first + self._wcount)
+            self.config.setAttr("numPoints", self._numPoints)
+            self.config.saveTrace()
+
+        self._wcount = 0
+        self._wtextins = []
+        self._wtextouts = []
+        self._wkeys = []
+
+    def _writeChunk(self, cnum, traces, textins, textouts, keys, index):
+        data = self._encodeTraces(traces)
+        for name, column in [('textin', textins), ('textout', textouts), ('keys', keys)]:
+            column = self._textColumn(column)
+            if column is not None:
+                data[name] = column
+
+        fname = self._chunkFilename(cnum)
+        if self._setting("compression") == 'zlib':
+            np.savez_compressed(fname, **data)
+        else:
+            np.savez(fname, **data)
+
+        np.save(self._filename("chunkindex.npy"), index)
+
+    def loadAllTraces(self, directory=None, prefix=None):
+        """Read the chunk index. Chunks themselves are only read when traces from them are used"""
+        if directory is not None:
+            self.directory = directory
+
+        if prefix is not None:
+            self.prefix = prefix
+
+        self._index = np.load(self._filename("chunkindex.npy"))
+        self._starts = list(self._index[:, 0])
+        self._numTraces = int(self._index[:, 1].sum())
+        self._numPoints = int(self.config.attr("numPoints"))
+        self._chunkCache.clear()
+        self._columns = {}
+
+        try:
+            self.knownkey = np.load(self._filename("knownkey.npy"))
+        except IOError:
+            self.knownkey = None
+
+        self.setDirty(False)
+        self._isloaded = True
+
+    def unloadAllTraces(self):
+        self._chunkCache.clear()
+        self._columns = {}
+        self.knownkey = None
+        self._isloaded = False
+
+    def saveAllTraces(self, directory, prefix="", saveConfig=True):
+        """Flush & save the data files, and the config unless saveConfig is False (see BackgroundTraceWriter)"""
+        self.directory = directory
+        self.prefix = prefix
+        self._flushChunk(saveConfig=saveConfig)
+        if self.knownkey is not None:
+            np.save(self._filename("knownkey.npy"), np.asarray(self.knownkey))
+        if saveConfig:
+            self.writeDataToConfig()
+            self.config.saveTrace()
+        self.setDirty(False)
+
+    def closeAll(self, clearTrace=True, clearText=True, clearKeys=True, saveConfig=True):
+        self.saveAllTraces(os.path.dirname(self.config.configFilename()), prefix=self.config.attr("prefix"), saveConfig=saveConfig)
+
+        #Everything is on disk now, only the index is needed to read it back
+        self._wbuf = None
+        self._isloaded = True
+
+    def numPoints(self):
+        if self._numPoints == 0:
+            self._numPoints = int(self.config.attr("numPoints"))
+        return self._numPoints
+
+    def _chunkFor(self, n):
+        return bisect.bisect_right(self._starts, n) - 1
+
+    def _chunkTraces(self, cnum):
+        """Decoded traces from chunk cnum, keeping the most recently used chunks in memory"""
+        if cnum in self._chunkCache:
+            traces = self._chunkCache.pop(cnum)
+        else:
+            f = np.load(self._chunkFilename(cnum))
+            traces = f['traces']
+            if 'gain' in f.files:
+                traces = traces * float(f['gain']) + float(f['offset'])
+            f.close()
+            traces.flags.writeable = False
+
+            while len(self._chunkCache) >= self.chunkCacheSize:
+                self._chunkCache.popitem(last=False)
+
+        self._chunkCache[cnum] = traces
+        return traces
+
+    def _column(self, name):
+        """Text or key column for all traces, read from each chunk without decoding the traces, plus any not yet flushed"""
+        if name not in self._columns:
+            data = []
+            for cnum in range(0, len(self._index)):
+                f = np.load(self._chunkFilename(cnum))
+                if name not in f.files:
+                    data = None
+                    f.close()
+                    break
+                data.append(f[name])
+                f.close()
+
+            if data:
+                data = np.concatenate(data)
+            else:
+                data = None
+            self._columns[name] = data
+
+        data = self._columns[name]
+        if self._wcount:
+            buffered = self._textColumn({'textin':self._wtextins, 'textout':self._wtextouts, 'keys':self._wkeys}[name])
+            if buffered is None or len(self._index) == 0:
+                data = buffered
+            elif data is not None:
+                data = np.concatenate((data, buffered))
+        return data
+
+    def getTrace(self, n):
+        flushed = self._numTraces - self._wcount
+        if n >= flushed:
+            return self._wbuf[n - flushed]
+
+        cnum = self._chunkFor(n)
+        return self._chunkTraces(cnum)[n - self._starts[cnum]]
+
+    def getTraceBlock(self, start, end, pointRange=None):
+        if start < 0 or end > self._numTraces or start > end:
+            raise IndexError("Trace block %d to %d out of range (%d traces)" % (start, end, self._numTraces))
+
+        #Traces past the last chunk are still in the write buffer
+        flushed = self._numTraces - self._wcount
+        blocks = []
+        n = start
+        while n < min(end, flushed):
+            cnum = self._chunkFor(n)
+            first = self._starts[cnum]
+            cend = min(end, first + int(self._index[cnum][1]))
+            blocks.append(self._chunkTraces(cnum)[n - first:cend - first])
+            n = cend
+
+        if end > flushed:
+            #Copied, as the buffer is reused once it's flushed
+            blocks.append(np.array(self._wbuf[n - flushed:end - flushed]))
+
+        if len(blocks) == 0:
+            data = np.zeros((0, self.numPoints()))
+        elif len(blocks) == 1:
+            data = blocks[0]
+        else:
+            data = np.concatenate(blocks)
+
+        if pointRange is not None:
+            data = data[:, pointRange[0]:pointRange[1]]
+        return data
+
+    def getTextin(self, n):
+        return self._column('textin')[n]
+
+    def getTextout(self, n):
+        return self._column('textout')[n]
+
+    def getKnownKey(self, n=0):
+        keys = self._column('keys')
+        if keys is not None:
+            return keys[n]
+        return self.knownkey
+
+    def getTextinBlock(self, start, end):
+        return self._column('textin')[start:end]
+
+    def getTextoutBlock(self, start, end):
+        return self._column('textout')[start:end]
+
+    def getKnownKeyBlock(self, start, end):
+        keys = self._column('keys')
+        if keys is not None:
+            return list(keys[start:end])
+        return [self.knownkey] * (end - start)
@@ -111,7 +111,10 @@ class TraceContainerConfig(object):
                     "scopeSampleRate":{"order":8, "value":0, "desc":"Sample Rate (s/sec)", "changed":False, "headerLabel":"Sample Rate", "editable":True},
                     "scopeYUnits":{"order":9, "value":0, "desc":"Units of Y Points", "changed":False, "editable":True},
                     "scopeXUnits":{"order":10, "value":0, "desc":"Units of X Points", "changed":False, "editable":True},
-                    "notes":{"order":11, "value":"", "desc":"Additional Notes about Capture Setup", "changed":False, "headerLabel":"Notes", "editable":True}                
+                    "notes":{"order":11, "value":"", "desc":"Additional Notes about Capture Setup", "changed":False, "headerLabel":"Notes", "editable":True},
+                    "sampleGain":{"order":12, "value":1.0, "desc":"Gain to convert stored samples to scope units (sample * gain + offset)", "changed":False},
+                    "sampleOffset":{"order":13, "value":0.0, "desc":"Offset to convert stored samples to scope units (sample * gain + offset)", "changed":False},
+                    "patternSeed":{"order":14, "value":0, "desc":"Random seed of the key/text pattern, to generate the same keys & texts again", "changed":False}
                     },
                 }
     
@@ -247,7 +247,7 @@ class TraceContainerMySQL(TraceContainer.TraceContainer):
         self.config.setAttr("tableName", self.tableName, "mysql")
         self.config.saveTrace()
 
-    def closeAll(self, clearTrace=True, clearText=True, clearKeys=True):
+    def closeAll(self, clearTrace=True, clearText=True, clearKeys=True, saveConfig=True):
         # self.saveAllTraces(os.path.dirname(self.config.configFilename()), prefix=self.config.attr("prefix"))
 
         # Release memory associated with data in case this isn't deleted
@@ -291,5 +291,24 @@ class TraceContainerMySQL(TraceContainer.TraceContainer):
         asc = self.db.query("SELECT EncKey FROM %s LIMIT 1 OFFSET %d"%(self.tableName, n)).rows[0][0]
         return self.asc2list(asc)
 
+    def _queryBlock(self, column, start, end):
+        """Column for rows start to end-1, using one query instead of one per row"""
+        return [r[0] for r in self.db.query("SELECT %s FROM %s LIMIT %d OFFSET %d"%(column, self.tableName, end - start, start)).rows]
+
+    def getTraceBlock(self, start, end, pointRange=None):
+        data = np.array([self.formatWave(wv, read=True) for wv in self._queryBlock("Wave", start, end)])
+        if pointRange is not None:
+            data = data[:, pointRange[0]:pointRange[1]]
+        return data
+
+    def getTextinBlock(self, start, end):
+        return np.array([self.asc2list(asc) for asc in self._queryBlock("Textin", start, end)])
+
+    def getTextoutBlock(self, start, end):
+        return np.array([self.asc2list(asc) for asc in self._queryBlock("Textout", start, end)])
+
+    def getKnownKeyBlock(self, start, end):
+        return [self.asc2list(asc) for asc in self._queryBlock("EncKey", start, end)]
+
 
 
@@ -25,9 +25,67 @@
 import os
 import numpy as np
 import TraceContainer
+from chipwhisperer.common.traces.utils import loadNpy, saveNpy
 
 class TraceContainerNative(TraceContainer.TraceContainer):
 
+    #Per-trace arrays are memory-mapped read-only so only the traces used are read from disk. Set to
+    #None to read everything into memory when loading.
+    mmapMode = 'r'
+
+    #(gain, offset) if traces are stored as raw samples, None if stored in scope units
+    _sampleScale = None
+
+    def setSampleFormat(self, dtype, gain=1.0, offset=0.0):
+        """Store traces as dtype, converted back to floating point (sample * gain + offset) when read"""
+        self.tracedtype = dtype
+        self.config.setAttr("sampleGain", gain)
+        self.config.setAttr("sampleOffset", offset)
+        self._updateSampleScale()
+
+    def _updateSampleScale(self):
+        gain = float(self.config.attr("sampleGain"))
+        offset = float(self.config.attr("sampleOffset"))
+        if gain == 1.0 and offset == 0.0:
+            self._sampleScale = None
+        else:
+            self._sampleScale = (gain, offset)
+
+    def addWave(self, trace, dtype=None):
+        if self._sampleScale is not None:
+            codes = np.round((np.asarray(trace) - self._sampleScale[1]) / self._sampleScale[0])
+            info = np.iinfo(self.tracedtype)
+            if np.all(np.isfinite(codes)) and codes.min() >= info.min and codes.max() <= info.max:
+                trace = codes
+            else:
+                self._storeFloat()
+                dtype = None
+        super(TraceContainerNative, self).addWave(trace, dtype)
+
+    def _storeFloat(self):
+        """Samples don't fit the raw format, store this segment as floating point (converting traces already added)"""
+        print "WARNING: Samples out of range for %s, storing traces as floating point" % np.dtype(self.tracedtype).name
+        (gain, offset) = self._sampleScale
+        if self.traces is not None and self._numTraces > 0:
+            self.traces = self.traces.astype(np.double) * gain + offset
+        self.tracedtype = np.double
+        self.config.setAttr("sampleGain", 1.0)
+        self.config.setAttr("sampleOffset", 0.0)
+        self._updateSampleScale()
+
+    def getTrace(self, n):
+        data = super(TraceContainerNative, self).getTrace(n)
+        if self._sampleScale is not None:
+            data = data * self._sampleScale[0] + self._sampleScale[1]
+        return data
+
+    def getTraceBlock(self, start, end, pointRange=None):
+        """Get traces start to end-1 as a 2-D array, raw samples are converted to floating point for just this block"""
+        data = super(TraceContainerNative, self).getTraceBlock(start, end, pointRange)
+        if self._sampleScale is not None:
+            data = data * self._sampleScale[0] + self._sampleScale[1]
+        return data
+
     def copyTo(self, srcTraces=None):
         self.NumTrace = srcTraces.NumTrace
         self.NumPoint = srcTraces.NumPoint
@@ -64,9 +122,9 @@ class TraceContainerNative(TraceContainer.TraceContainer):
         if prefix is None:
             prefix = self.prefix
 
-        self.traces = np.load(directory + "/%straces.npy" % prefix, mmap_mode='r')
-        self.textins = np.load(directory + "/%stextin.npy" % prefix)
-        self.textouts = np.load(directory + "/%stextout.npy" % prefix)
+        self.traces = loadNpy(directory + "/%straces.npy" % prefix, self.mmapMode)
+        self.textins = loadNpy(directory + "/%stextin.npy" % prefix, self.mmapMode)
+        self.textouts = loadNpy(directory + "/%stextout.npy" % prefix, self.mmapMode)
 
         try:
             self.knownkey = np.load(directory + "/%sknownkey.npy" % prefix)
@@ -75,10 +133,12 @@ class TraceContainerNative(TraceContainer.TraceContainer):
 
         # OK if this fails
         try:
-            self.keylist = np.load(directory + "/%skeylist.npy" % prefix)
+            self.keylist = loadNpy(directory + "/%skeylist.npy" % prefix, self.mmapMode)
         except IOError:
             self.keylist = None
 
+        self._updateSampleScale()
+
         # Traces loaded means saved
         self.setDirty(False)
         self._isloaded = True
@@ -110,19 +170,27 @@ class TraceContainerNative(TraceContainer.TraceContainer):
         path = os.path.dirname(self.config.configFilename())
         # prefix = self.config.attr("prefix")
         # fname = "%s%s.npy" % (prefix, extraname)
-        return np.load(path + "/" + fname)
-
-    def saveAllTraces(self, directory, prefix=""):
-        self.config.saveTrace()
-        np.save(directory + "/%straces.npy" % prefix, self.traces)
-        np.save(directory + "/%stextin.npy" % prefix, self.textins)
-        np.save(directory + "/%stextout.npy" % prefix, self.textouts)
-        np.save(directory + "/%skeylist.npy" % prefix, self.keylist)
-        np.save(directory + "/%sknownkey.npy" % prefix, self.knownkey)
+        return loadNpy(path + "/" + fname, self.mmapMode)
+
+    def saveAllTraces(self, directory, prefix="", saveConfig=True):
+        """Save the trace data files, and the config unless saveConfig is False (see BackgroundTraceWriter)"""
+        if saveConfig:
+            self.writeDataToConfig()
+            self.config.saveTrace()
+
+        # Capture buffer may have more rows allocated than traces added
+        traces = self.traces
+        if traces is not None and traces.shape[0] > self.numTraces():
+            traces = traces[0:self.numTraces()]
+        saveNpy(directory + "/%straces.npy" % prefix, traces)
+        saveNpy(directory + "/%stextin.npy" % prefix, self.textins)
+        saveNpy(directory + "/%stextout.npy" % prefix, self.textouts)
+        saveNpy(directory + "/%skeylist.npy" % prefix, self.keylist)
+        saveNpy(directory + "/%sknownkey.npy" % prefix, self.knownkey)
         self.setDirty(False)
 
-    def closeAll(self, clearTrace=True, clearText=True, clearKeys=True):
-        self.saveAllTraces(os.path.dirname(self.config.configFilename()), prefix=self.config.attr("prefix"))
+    def closeAll(self, clearTrace=True, clearText=True, clearKeys=True, saveConfig=True):
+        self.saveAllTraces(os.path.dirname(self.config.configFilename()), prefix=self.config.attr("prefix"), saveConfig=saveConfig)
 
         # Release memory associated with data in case this isn't deleted
         if clearTrace:
@@ -28,16 +28,20 @@ import sys
 from PySide.QtCore import *
 from PySide.QtGui import *
 import os.path
+import numpy as np
 sys.path.append('../common')
 
 #import TraceContainer
 import TraceContainerConfig
 import TraceContainerNative
+import TraceContainerChunked
 from TraceContainerDPAv3 import ImportDPAv3Dialog
 
 from TraceManagerImport import TraceManagerImport
 
 import re
+import bisect
+from collections import OrderedDict
 
 #For copying files when adding existing traces
 import shutil
@@ -61,6 +65,24 @@ class TraceManager(object):
         self.NumPoint = 0
         self.lastMapped = None
 
+        #Sorted start of each mapped range, for bisect lookup in findMappedTrace()
+        self._rangeStarts = []
+        self._rangeTraces = []
+
+        #Loaded segments, least recently used first
+        self._loadedSegments = OrderedDict()
+        self.setCacheSize()
+
+    def setCacheSize(self, maxBytes=512*1024*1024, maxSegments=16):
+        """
+        Set how many segments stay loaded when moving between them. Least recently used segments are
+        unloaded once the loaded segments use more than maxBytes, or more than maxSegments are loaded.
+        The segment being accessed is always kept, so maxSegments=1 gives one-segment-at-a-time behaviour.
+        """
+        self._cacheMaxBytes = maxBytes
+        self._cacheMaxSegments = max(1, maxSegments)
+        self._cacheEvict()
+
     def getSegmentList(self, start=0, end=-1):
         """
         Get a list of segments.
@@ -80,23 +102,65 @@ class TraceManager(object):
         return dataDict
 
     def findMappedTrace(self, n):
-        if self.lastMapped is not None:
-            if self.lastMapped.mappedRange is not None and n >= self.lastMapped.mappedRange[0] and n <= self.lastMapped.mappedRange[1]:
+        if self.lastMapped is not None and self.lastMapped.mappedRange is not None:
+            if n >= self.lastMapped.mappedRange[0] and n <= self.lastMapped.mappedRange[1]:
                 return self.lastMapped
-            else:
-                # Only load one segment at a time for memory reasons
-                self.lastMapped.unloadAllTraces()
-                self.lastMapped = None
 
-        for t in self.dlg.traceList:
-            if t.mappedRange:
-                if n >= t.mappedRange[0] and n <= t.mappedRange[1]:
-                    if not t.isLoaded():
-                        t.loadAllTraces(None, None)
-                    self.lastMapped = t
-                    return t
-
-        raise ValueError("n = %d not in mapped range"%n)
+        t = self._lookupSegment(n)
+        if t is None:
+            #Mapping may have changed without UpdateTraces() being called
+            self._updateIndex()
+            t = self._lookupSegment(n)
+            if t is None:
+                raise ValueError("n = %d not in mapped range"%n)
+
+        if not t.isLoaded():
+            t.loadAllTraces(None, None)
+
+        self._cacheTouch(t)
+        self.lastMapped = t
+        return t
+
+    def _updateIndex(self):
+        mapped = [t for t in self.dlg.traceList if t.mappedRange]
+        mapped.sort(key=lambda t: t.mappedRange[0])
+        self._rangeStarts = [t.mappedRange[0] for t in mapped]
+        self._rangeTraces = mapped
+
+    def _lookupSegment(self, n):
+        i = bisect.bisect_right(self._rangeStarts, n) - 1
+        if i >= 0:
+            t = self._rangeTraces[i]
+            if t.mappedRange and n >= t.mappedRange[0] and n <= t.mappedRange[1]:
+                return t
+        return None
+
+    def _segmentBytes(self, t):
+        """Memory used by a loaded segment. Memory-mapped arrays are counted at their full size"""
+        size = 0
+        for attr in ('traces', 'textins', 'textouts', 'keylist'):
+            data = getattr(t, attr, None)
+            if isinstance(data, np.ndarray):
+                size += data.nbytes
+        return size
+
+    def _cacheTouch(self, t):
+        """Mark segment t as most recently used, unloading old segments if over the limits"""
+        key = id(t)
+        if key in self._loadedSegments:
+            del self._loadedSegments[key]
+        self._loadedSegments[key] = t
+        self._cacheEvict()
+
+    def _cacheEvict(self):
+        total = sum(self._segmentBytes(t) for t in self._loadedSegments.values())
+        while len(self._loadedSegments) > 1 and \
+              (len(self._loadedSegments) > self._cacheMaxSegments or total > self._cacheMaxBytes):
+            (key, old) = self._loadedSegments.popitem(last=False)
+            total -= self._segmentBytes(old)
+            old.unloadAllTraces()
+            if old is self.lastMapped:
+                self.lastMapped = None
 
     def getAuxData(self, n, auxDic):
         t = self.findMappedTrace(n)
@@ -124,7 +188,50 @@ class TraceManager(object):
         t = self.findMappedTrace(n)
         return t.getKnownKey(n - t.mappedRange[0])
 
+    def _blockSegments(self, start, end):
+        """
+        Split traces start to end-1 into (segment, segment start, segment end) pieces. This is a generator so
+        each piece is read before the next segment is loaded, which may unload older segments.
+        """
+        n = start
+        while n < end:
+            t = self.findMappedTrace(n)
+            segend = min(end, t.mappedRange[1] + 1)
+            yield (t, n - t.mappedRange[0], segend - t.mappedRange[0])
+            n = segend
+
+    def _joinBlocks(self, blocks):
+        if len(blocks) == 1:
+            return blocks[0]
+        return np.concatenate(blocks)
+
+    def getTraceBlock(self, start, end, pointRange=None, valid=None):
+        """
+        Get traces start to end-1 as a 2-D array. If the range is inside one segment this is a view of the
+        stored data, otherwise the segments are copied into one array. If valid is a list, the numbers of
+        the traces returned are appended to it (used by preprocessing modules which drop traces).
+        """
+        blocks = [t.getTraceBlock(s, e, pointRange) for (t, s, e) in self._blockSegments(start, end)]
+        if valid is not None:
+            valid.extend(range(start, end))
+        return self._joinBlocks(blocks)
+
+    def getTextinBlock(self, start, end):
+        return self._joinBlocks([t.getTextinBlock(s, e) for (t, s, e) in self._blockSegments(start, end)])
+
+    def getTextoutBlock(self, start, end):
+        return self._joinBlocks([t.getTextoutBlock(s, e) for (t, s, e) in self._blockSegments(start, end)])
+
+    def getKnownKeyBlock(self, start, end):
+        keys = []
+        for (t, s, e) in self._blockSegments(start, end):
+            keys.extend(t.getKnownKeyBlock(s, e))
+        return keys
+
     def UpdateTraces(self):
+        self._updateIndex()
+        self.lastMapped = None
+
         #Find total (last mapped range)
         num = []
         pts = []
@@ -234,6 +341,8 @@ class TraceManagerDialog(QDialog):
                 # print "Opening %s"%fname
                 ti = TraceContainerNative.TraceContainerNative()
                 ti.config.loadTrace(fname)
+                if ti.config.attr("format") == "chunked":
+                    ti = TraceContainerChunked.TraceContainerChunked(configfile=fname)
                 self.traceList.append(ti)
                 self.addRow(ti)
 
@@ -66,6 +66,7 @@ class TraceManagerImport(QDialog):
         self.modName.addItem("Select format for manual mode only...")
         self.modName.addItem("ChipWhisperer/Native")
         self.modName.addItem("DPAContestv3")
+        self.modName.addItem("ChipWhisperer/Chunked", TraceContainerTypes.TraceContainerFormatList["chunked"])
         if TraceContainerMySQL is not None:        
             self.modName.addItem("MySQL", TraceContainerMySQL)
         self.modName.currentIndexChanged.connect(self.traceTypeChanged)
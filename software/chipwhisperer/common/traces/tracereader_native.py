@@ -24,6 +24,7 @@
 
 import numpy as np
 import os
+from chipwhisperer.common.traces.utils import loadNpy, saveNpy
 
 class tracereader_native:
     def __init__(self):
@@ -35,6 +36,7 @@ class tracereader_native:
         self.directory = None
         self.tracesSaved = False
         self.tracedtype = None
+        self.mmapMode = 'r'
 
     def copyTo(self, srcTraces=None):
         self.NumTrace = srcTraces.NumTrace
@@ -64,9 +66,9 @@ class tracereader_native:
         
         
     def loadAllTraces(self, directory=None, prefix=""):
-        self.traces = np.load(directory + "/%straces.npy"%prefix)
-        self.textins = np.load(directory + "/%stextin.npy"%prefix)
-        self.textouts = np.load(directory + "/%stextout.npy"%prefix)
+        self.traces = loadNpy(directory + "/%straces.npy"%prefix, self.mmapMode)
+        self.textins = loadNpy(directory + "/%stextin.npy"%prefix, self.mmapMode)
+        self.textouts = loadNpy(directory + "/%stextout.npy"%prefix, self.mmapMode)
         self.knownkey = np.load(directory + "/%sknownkey.npy"%prefix)
 
         self.NumTrace = self.traces.shape[0]
@@ -77,10 +79,10 @@ class tracereader_native:
         return
 
     def saveAllTraces(self, directory, prefix=""):
-        np.save(directory + "/%straces.npy"%prefix, self.traces)
-        np.save(directory + "/%stextin.npy"%prefix, self.textins)
-        np.save(directory + "/%stextout.npy"%prefix, self.textouts)
-        np.save(directory + "/%sknownkey.npy"%prefix, self.knownkey)
+        saveNpy(directory + "/%straces.npy"%prefix, self.traces)
+        saveNpy(directory + "/%stextin.npy"%prefix, self.textins)
+        saveNpy(directory + "/%stextout.npy"%prefix, self.textouts)
+        saveNpy(directory + "/%sknownkey.npy"%prefix, self.knownkey)
         self.tracesSaved = True
 
     def numPoints(self):
@@ -23,6 +23,10 @@
 #    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
 
 import ast
+import mmap
+import os
+import struct
+import numpy as np
     
 def strListToList(strlist):
     """
@@ -37,3 +41,116 @@ def strListToList(strlist):
         return listeval
     except ValueError:
         raise ValueError("Failed to convert %s to list" % (strlist))
+
+def getTraceBlockData(tracedata, start, end, pointRange=None):
+    """
+    Get traces start to end-1 from a TraceManager or preprocessing module, returns a tuple of
+    (traces, textins, textouts, knownkeys). traces/textins/textouts are 2-D arrays and knownkeys
+    is a list. Traces dropped by preprocessing are left out of all of them.
+    """
+
+    if not hasattr(tracedata, 'getTraceBlock'):
+        # Older trace sources: fetch one at a time
+        data = []
+        textins = []
+        textouts = []
+        knownkeys = []
+        for tnum in range(start, end):
+            d = tracedata.getTrace(tnum)
+            if d is None:
+                continue
+
+            if pointRange is not None:
+                d = d[pointRange[0]:pointRange[1]]
+
+            data.append(d)
+            textins.append(tracedata.getTextin(tnum))
+            textouts.append(tracedata.getTextout(tnum))
+            knownkeys.append(tracedata.getKnownKey(tnum))
+
+        return (np.array(data), np.array(textins), np.array(textouts), knownkeys)
+
+    valid = []
+    traces = tracedata.getTraceBlock(start, end, pointRange, valid)
+    textins = tracedata.getTextinBlock(start, end)
+    textouts = tracedata.getTextoutBlock(start, end)
+    knownkeys = tracedata.getKnownKeyBlock(start, end)
+
+    if len(valid) != (end - start):
+        idx = np.array(valid, dtype=np.int64) - start
+        if len(textins) > 0:
+            textins = textins[idx]
+        if len(textouts) > 0:
+            textouts = textouts[idx]
+        knownkeys = [knownkeys[i] for i in idx]
+
+    return (traces, textins, textouts, knownkeys)
+
+def loadNpy(fname, mmapMode='r'):
+    """
+    Load a .npy file, memory-mapped if mmapMode is not None so only the parts actually used are read
+    from disk. Files which can't be mapped (object arrays such as a saved None, or empty arrays) are
+    loaded normally.
+    """
+
+    if mmapMode is not None:
+        try:
+            return np.load(fname, mmap_mode=mmapMode)
+        except ValueError:
+            pass
+    return np.load(fname)
+
+def saveNpy(fname, data):
+    """
+    Save data to a .npy file. Rewriting a file while it is mapped truncates the data being written,
+    so a read-only map of all of that same file is skipped (it can't have changed), and a view of
+    part of it is copied into memory first.
+    """
+
+    if isinstance(data, np.memmap) and data.filename:
+        if os.path.abspath(data.filename) == os.path.abspath(fname):
+            if isinstance(data.base, mmap.mmap) and data.mode == 'r':
+                return
+            data = np.array(data)
+    np.save(fname, data)
+
+class NpyAppender(object):
+    """
+    Writes a 1-D .npy file of records (e.g. a structured dtype) as they are produced. Records are added to the end
+    of the file and only the fixed-size header is rewritten, so each append takes the same time however large the
+    file gets. The file can be read with np.load() or loadNpy() at any time.
+    """
+
+    #Header is padded to this size so it can be rewritten in place as the record count grows
+    headerSize = 1024
+
+    def __init__(self, fname, dtype):
+        self.fname = fname
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self._f = open(fname, 'w+b')
+        self._writeHeader()
+
+    def _writeHeader(self):
+        header = "{'descr': %s, 'fortran_order': False, 'shape': (%d,), }" % (repr(np.lib.format.dtype_to_descr(self.dtype)), self.count)
+        prefix = np.lib.format.magic(1, 0) + struct.pack('<H', self.headerSize - 10)
+        pad = self.headerSize - len(prefix) - len(header) - 1
+        if pad < 0:
+            raise ValueError("Record type too complex for .npy header of %d bytes" % self.headerSize)
+
+        self._f.seek(0)
+        self._f.write(prefix + header + ' ' * pad + '\n')
+        self._f.flush()
+
+    def append(self, records):
+        """Add one record or an array of records to the end of the file"""
+        records = np.asarray(records, dtype=self.dtype).reshape(-1)
+        self._f.seek(0, os.SEEK_END)
+        self._f.write(records.tostring())
+        self.count += len(records)
+        self._writeHeader()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
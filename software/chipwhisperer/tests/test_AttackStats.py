@@ -0,0 +1,166 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from chipwhisperer.analyzer.attacks.CPAAccumulator import CorrelationPeaks
+
+#AttackStats exits if PySide is missing, so check first
+try:
+    import PySide
+    from chipwhisperer.analyzer.attacks.AttackStats import DataTypeDiffs, RankingHistory
+except ImportError:
+    PySide = None
+
+def sortedMaxes(diffs):
+    """Ranking the way the original findMaximums() did it: sort on value, then reverse"""
+    mag = np.fabs(diffs)
+    maxes = np.zeros(diffs.shape[0], dtype=[('hyp', 'i2'), ('point', 'i4'), ('value', 'f8')])
+    maxes['hyp'] = np.arange(0, diffs.shape[0])
+    maxes['point'] = np.argmax(mag, axis=1)
+    maxes['value'] = np.max(mag, axis=1)
+    maxes.sort(order='value')
+    return maxes[::-1]
+
+@unittest.skipIf(PySide is None, "PySide is not installed")
+class TestRankingHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def maxes(self, value):
+        m = np.zeros(4, dtype=[('hyp', 'i2'), ('value', 'f8')])
+        m['hyp'] = [3, 1, 0, 2]
+        m['value'] = [value, 0.5, 0.25, 0.125]
+        return m
+
+    def test_average(self):
+        history = RankingHistory(numSubkeys=2, numPerms=4, maxRows=None)
+        #Two attack runs reporting the same trace counts
+        for run in range(0, 2):
+            for tnum in range(50, 10001, 50):
+                history.add(0, tnum, run * 2, self.maxes(tnum))
+        history.add(1, 100, 7, self.maxes(1.0))
+
+        self.assertEqual(list(history.traces()), range(50, 10001, 50))
+        self.assertTrue(np.all(history.trials()[:, 0] == 2))
+        self.assertTrue(np.all(history.pge()[:, 0] == 1.0))
+        self.assertEqual(history.pge()[1, 1], 7)
+        self.assertTrue(np.isnan(history.pge()[0, 1]))
+
+        peaks = history.peaks(0)
+        self.assertEqual(peaks.shape, (4, 200))
+        self.assertEqual(peaks[3, -1], 10000)
+        self.assertEqual(peaks[2, 0], 0.125)
+
+    def test_bounded(self):
+        history = RankingHistory(numSubkeys=1, numPerms=4, maxRows=16)
+        for tnum in range(25, 25 * 1000 + 1, 25):
+            history.add(0, tnum, 1, self.maxes(tnum))
+
+        traces = history.traces()
+        self.assertTrue(len(traces) <= 16)
+        self.assertEqual(traces[-1], 25000)
+        self.assertEqual(traces[0], 25)
+        #Older results are thinned out evenly, without leaving large gaps
+        self.assertTrue(np.all(np.diff(traces) > 0))
+        self.assertTrue(np.diff(traces).max() <= 4 * 25000 / 16)
+        self.assertTrue(np.all(history.peaks(0)[3] == traces))
+
+    def test_spill(self):
+        history = RankingHistory(numSubkeys=1, numPerms=4, maxRows=200, spillDir=self.tmpdir)
+        for tnum in range(1, 150):
+            history.add(0, tnum, 0, self.maxes(tnum))
+        self.assertEqual(len(os.listdir(self.tmpdir)), 4)
+        self.assertEqual(list(history.traces()), range(1, 150))
+
+        history.close()
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+@unittest.skipIf(PySide is None, "PySide is not installed")
+class TestDataTypeDiffs(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(3)
+        self.knownkey = list(rng.randint(0, 256, 16))
+        #Rounded so many hypotheses tie
+        self.diffs = [np.round(rng.randn(256, 10) * 3) / 10 for i in range(0, 16)]
+
+    def stats(self, diffs):
+        stats = DataTypeDiffs()
+        stats.setKnownkey(self.knownkey)
+        for i in range(0, 16):
+            stats.updateSubkey(i, diffs[i], tnum=100)
+        stats.findMaximums()
+        return stats
+
+    def test_ranking(self):
+        stats = self.stats(self.diffs)
+        for i in range(0, 16):
+            ref = sortedMaxes(self.diffs[i])
+            self.assertTrue(np.array_equal(stats.maxes[i]['hyp'], ref['hyp']))
+            self.assertTrue(np.array_equal(stats.maxes[i]['value'], ref['value']))
+            self.assertEqual(stats.pge[i], np.flatnonzero(ref['hyp'] == self.knownkey[i])[0])
+
+    def test_nan(self):
+        diffs = [np.array(d) for d in self.diffs]
+        diffs[0][self.knownkey[0]] = np.nan
+        other = (self.knownkey[1] + 1) % 256
+        diffs[1][other] = np.nan
+        stats = self.stats(diffs)
+
+        self.assertEqual(stats.pge[0], 128)
+        #NaN hypotheses are ranked last, & don't count against the known key
+        self.assertEqual(stats.maxes[1]['hyp'][-1], other)
+        ref = sortedMaxes(np.delete(diffs[1], other, axis=0))['hyp']
+        ref[ref >= other] += 1
+        self.assertEqual(stats.pge[1], np.flatnonzero(ref == self.knownkey[1])[0])
+
+    def test_peaks(self):
+        full = self.stats(self.diffs)
+        peaks = self.stats([CorrelationPeaks.fromArray(d) for d in self.diffs])
+        for i in range(0, 16):
+            self.assertTrue(np.array_equal(full.maxes[i]['hyp'], peaks.maxes[i]['hyp']))
+            self.assertTrue(np.array_equal(full.maxes[i]['value'], peaks.maxes[i]['value']))
+        self.assertEqual(full.pge, peaks.pge)
+
+    def test_history(self):
+        stats = self.stats(self.diffs)
+        #Nothing new to rank, so no extra history entries
+        stats.findMaximums()
+        self.assertEqual(list(stats.history.traces()), [100])
+        self.assertTrue(np.all(stats.history.trials() == 1))
+        self.assertTrue(np.array_equal(stats.history.pge()[0], stats.pge))
+
+if __name__ == '__main__':
+    unittest.main()
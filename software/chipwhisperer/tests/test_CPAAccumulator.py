@@ -0,0 +1,202 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from chipwhisperer.analyzer.attacks.CPAAccumulator import CPAAccumulator, CPACenteredAccumulator, CorrelationPeaks, \
+    saveAccumulators, loadAccumulators, accumulatorsExist, mergeAccumulatorFiles
+
+def referenceCorrelation(traces, hyp):
+    """Pearson correlation of every hypothesis column with every trace point, the slow way"""
+    out = np.zeros((hyp.shape[1], traces.shape[1]))
+    for g in range(0, hyp.shape[1]):
+        for p in range(0, traces.shape[1]):
+            out[g, p] = np.corrcoef(hyp[:, g], traces[:, p])[0, 1]
+    return out
+
+class TestCPAAccumulator(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.hyp = rng.randint(0, 9, (300, 16)).astype(np.float64)
+        self.traces = rng.randn(300, 12) + 0.2 * self.hyp[:, [3]]
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_correlation(self):
+        for cls in (CPAAccumulator, CPACenteredAccumulator):
+            acc = cls(16)
+            acc.add(self.traces, self.hyp)
+            self.assertTrue(np.allclose(acc.correlation(), referenceCorrelation(self.traces, self.hyp)))
+            self.assertTrue(np.allclose(acc.correlation(2, 7), acc.correlation()[:, 2:7]))
+
+    def test_merge(self):
+        for cls in (CPAAccumulator, CPACenteredAccumulator):
+            whole = cls(16)
+            whole.add(self.traces, self.hyp)
+
+            #Shards of different sizes, merged in a different order to the one they were captured in
+            shards = []
+            for (start, end) in [(0, 50), (50, 210), (210, 300)]:
+                shard = cls(16)
+                shard.add(self.traces[start:end], self.hyp[start:end])
+                shards.append(shard)
+            merged = cls(16)
+            for shard in reversed(shards):
+                merged.merge(shard)
+
+            self.assertEqual(merged.totalTraces, 300)
+            self.assertTrue(np.allclose(merged.correlation(), whole.correlation()))
+
+    def test_mergeMismatch(self):
+        a = CPAAccumulator(16)
+        a.add(self.traces, self.hyp)
+        b = CPAAccumulator(16)
+        b.add(self.traces[:, 0:5], self.hyp)
+        self.assertRaises(ValueError, a.merge, b)
+
+        c = CPACenteredAccumulator(16)
+        c.add(self.traces, self.hyp)
+        self.assertRaises(ValueError, a.merge, c)
+
+    def test_centeredOffset(self):
+        #Large DC offset loses precision in the raw sums, but not the centered moments
+        traces = self.traces + 1E7
+        acc = CPACenteredAccumulator(16)
+        acc.add(traces, self.hyp)
+        self.assertTrue(np.allclose(acc.correlation(), referenceCorrelation(self.traces, self.hyp), atol=1E-9))
+
+    def test_saveLoad(self):
+        fname = os.path.join(self.tmpdir, 'ckpt.npz')
+        self.assertFalse(accumulatorsExist(fname))
+
+        raw = CPAAccumulator(16)
+        raw.add(self.traces, self.hyp)
+        centered = CPACenteredAccumulator(16)
+        centered.add(self.traces, self.hyp)
+        saveAccumulators(fname, {0:raw, 3:centered, 5:CPAAccumulator(16)}, (100, 400))
+        saveAccumulators(fname, {0:raw, 3:centered, 5:CPAAccumulator(16)}, (100, 400))
+
+        (accs, tracerange) = loadAccumulators(fname)
+        self.assertEqual(tracerange, (100, 400))
+        self.assertEqual(sorted(accs.keys()), [0, 3, 5])
+        self.assertTrue(isinstance(accs[3], CPACenteredAccumulator))
+        self.assertTrue(accs[5].isEmpty())
+        self.assertTrue(np.allclose(accs[0].correlation(), raw.correlation()))
+        self.assertTrue(np.allclose(accs[3].correlation(), centered.correlation()))
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['ckpt.npz'])
+
+    def test_interruptedSave(self):
+        fname = os.path.join(self.tmpdir, 'ckpt.npz')
+        acc = CPAAccumulator(16)
+        acc.add(self.traces, self.hyp)
+        saveAccumulators(fname, {0:acc}, (0, 100))
+        saveAccumulators(fname, {0:acc}, (0, 200))
+
+        #Partly written new file is ignored
+        with open(fname + '.tmp.npz', 'wb') as f:
+            f.write('junk')
+        self.assertEqual(loadAccumulators(fname)[1], (0, 200))
+
+        #Crash after the old file was moved out of the way
+        os.rename(fname, fname + '.bak')
+        self.assertTrue(accumulatorsExist(fname))
+        self.assertEqual(loadAccumulators(fname)[1], (0, 200))
+
+        saveAccumulators(fname, {0:acc}, (0, 300))
+        self.assertEqual(loadAccumulators(fname)[1], (0, 300))
+        self.assertFalse(os.path.exists(fname + '.bak'))
+
+    def test_mergeFiles(self):
+        whole = CPAAccumulator(16)
+        whole.add(self.traces, self.hyp)
+
+        fnames = []
+        for (i, (start, end)) in enumerate([(0, 120), (120, 300)]):
+            shard = CPAAccumulator(16)
+            shard.add(self.traces[start:end], self.hyp[start:end])
+            fnames.append(os.path.join(self.tmpdir, 'shard%d.npz' % i))
+            saveAccumulators(fnames[-1], {2:shard})
+
+        outname = os.path.join(self.tmpdir, 'merged.npz')
+        mergeAccumulatorFiles(fnames, outname)
+        (accs, _) = loadAccumulators(outname)
+        self.assertTrue(np.allclose(accs[2].correlation(), whole.correlation()))
+
+class TestCorrelationPeaks(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        self.data = rng.randn(32, 1000)
+        self.data[5, :] = np.nan
+        self.data[7, 10:20] = np.nan
+
+    def test_peaks(self):
+        #Small blocks so the result is combined from several of them
+        oldBlockSize = CorrelationPeaks.blockSize
+        CorrelationPeaks.blockSize = 64
+        try:
+            peaks = CorrelationPeaks.fromArray(self.data, envelopeBins=10)
+        finally:
+            CorrelationPeaks.blockSize = oldBlockSize
+
+        valid = np.ones(32, dtype=bool)
+        valid[5] = False
+        mag = np.fabs(self.data[valid])
+        (values, points) = peaks.peaks(useAbsolute=True)
+        self.assertTrue(np.array_equal(values[valid], np.nanmax(mag, axis=1)))
+        self.assertTrue(np.array_equal(points[valid], np.nanargmax(mag, axis=1)))
+        self.assertTrue(np.isnan(values[5]))
+
+        (values, points) = peaks.peaks(useAbsolute=False)
+        self.assertTrue(np.array_equal(values[valid], np.nanmax(self.data[valid], axis=1)))
+
+    def test_envelope(self):
+        peaks = CorrelationPeaks.fromArray(self.data, envelopeBins=10)
+        (points, env) = peaks.envelope()
+        self.assertEqual(list(points), range(0, 1000, 100))
+        self.assertEqual(env.shape, (32, 10))
+
+        bin3 = self.data[0, 300:400]
+        self.assertEqual(env[0, 3], bin3[np.argmax(np.fabs(bin3))])
+
+    def test_fromAccumulator(self):
+        rng = np.random.RandomState(2)
+        acc = CPAAccumulator(8)
+        acc.add(rng.randn(100, 50), rng.randint(0, 9, (100, 8)))
+        full = CorrelationPeaks.fromArray(acc.correlation())
+        (values, points) = acc.peaks().peaks()
+        self.assertTrue(np.array_equal(values, full.peaks()[0]))
+        self.assertTrue(np.array_equal(points, full.peaks()[1]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+import unittest
+
+import numpy as np
+
+from chipwhisperer.analyzer.attacks.CPAAccumulator import CorrelationPeaks
+from chipwhisperer.analyzer.attacks.models import AES128_8bit
+
+try:
+    import PySide
+    from chipwhisperer.analyzer.attacks.CPAProgressive import CPAProgressiveOneSubkey
+except ImportError:
+    PySide = None
+
+class ProgressBar(object):
+    def __init__(self, skipped=False):
+        self.skipped = skipped
+
+    def setValue(self, value):
+        pass
+
+    def updateStatus(self, tracerange, bnum):
+        pass
+
+    def wasCanceled(self):
+        return False
+
+    def wasSkipped(self):
+        return self.skipped
+
+@unittest.skipIf(PySide is None, "PySide is not installed")
+class TestCPAProgressiveOneSubkey(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.textins = rng.randint(0, 256, (300, 16)).astype(np.uint8)
+        self.leakage = AES128_8bit.LEAK_HW_SBOXOUT_FIRSTROUND
+        hyp = AES128_8bit.leakageMatrix(self.textins, None, 2, self.leakage, None).astype(np.float64)
+        self.traces = rng.randn(300, 15) + 0.3 * hyp[:, [0x2b]]
+
+        #Correlation of every guess with every point, computed directly
+        self.reference = np.zeros((256, 15))
+        for g in range(0, 256):
+            for p in range(0, 15):
+                self.reference[g, p] = np.corrcoef(hyp[:, g], self.traces[:, p])[0, 1]
+
+    def addBlocks(self, cpa, blocks, progressBar=None, **kwargs):
+        for (start, end) in blocks:
+            (data, _) = cpa.oneSubkey(2, None, self.traces[start:end], end - start, self.textins[start:end], self.textins[start:end],
+                                      None, progressBar, AES128_8bit, self.leakage, cpa.modelstate, 0, **kwargs)
+        return data
+
+    def test_engines(self):
+        for vectorized in (True, False):
+            for centered in (False, True):
+                data = self.addBlocks(CPAProgressiveOneSubkey(), [(0, 120), (120, 300)], vectorized=vectorized, centered=centered)
+                self.assertTrue(np.allclose(np.asarray(data, dtype=np.float64), self.reference),
+                                "vectorized=%s centered=%s" % (vectorized, centered))
+
+    def test_skipped(self):
+        #Skipping stops the loop at the first guess, the vectorized engine must leave the same state behind
+        results = []
+        for vectorized in (True, False):
+            cpa = CPAProgressiveOneSubkey()
+            data = self.addBlocks(cpa, [(0, 300)], ProgressBar(skipped=True), vectorized=vectorized)
+            results.append((np.asarray(data, dtype=np.float64), np.array(cpa.sumht)))
+        self.assertTrue(np.allclose(results[0][0], results[1][0]))
+        self.assertTrue(np.allclose(results[0][1], results[1][1]))
+
+    def test_peaks(self):
+        for centered in (False, True):
+            peaks = self.addBlocks(CPAProgressiveOneSubkey(), [(0, 120), (120, 300)], centered=centered, peaks=True, envelopeBins=5)
+            self.assertTrue(isinstance(peaks, CorrelationPeaks))
+            (values, points) = peaks.peaks()
+            self.assertTrue(np.allclose(values, np.max(np.fabs(self.reference), axis=1)))
+            self.assertTrue(np.array_equal(points, np.argmax(np.fabs(self.reference), axis=1)))
+            self.assertEqual(np.argmax(values), 0x2b)
+
+    def test_accumulatorRoundTrip(self):
+        for centered in (False, True):
+            first = CPAProgressiveOneSubkey()
+            self.addBlocks(first, [(0, 120)], centered=centered)
+
+            resumed = CPAProgressiveOneSubkey()
+            resumed.setAccumulator(first.getAccumulator())
+            data = self.addBlocks(resumed, [(120, 300)], centered=centered)
+            self.assertTrue(np.allclose(np.asarray(data, dtype=np.float64), self.reference))
+            self.assertEqual(resumed.getAccumulator().totalTraces, 300)
+
+    def test_accumulatorMismatch(self):
+        for centered in (False, True):
+            first = CPAProgressiveOneSubkey()
+            self.addBlocks(first, [(0, 120)], centered=centered)
+
+            #Continuing in the other mode would silently drop the earlier traces
+            resumed = CPAProgressiveOneSubkey()
+            resumed.setAccumulator(first.getAccumulator())
+            self.assertRaises(ValueError, self.addBlocks, resumed, [(120, 300)], centered=not centered)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+import unittest
+
+import numpy as np
+
+from chipwhisperer.analyzer.attacks.models import AES128_8bit
+from chipwhisperer.capture.CaptureEngine import CaptureEngine, RateLimiter
+from chipwhisperer.capture.scopes.SimulatedScope import SimulatedScope
+from chipwhisperer.capture.targets.SimulatedTarget import SimulatedTarget
+from chipwhisperer.capture.utils.CaptureBenchmark import RandomTextPattern
+
+class ListWriter(object):
+    """Keeps captured traces in lists, with the trace writer methods CaptureEngine uses"""
+
+    def __init__(self):
+        self.traces = []
+        self.textins = []
+        self.textouts = []
+        self.closed = False
+
+    def prepareDisk(self):
+        pass
+
+    def setKnownKey(self, key):
+        self.knownkey = key
+
+    def setBackgroundWriter(self, bgWriter):
+        pass
+
+    def addTrace(self, trace, textin, textout, key):
+        self.traces.append(np.array(trace))
+        self.textins.append(list(textin))
+        self.textouts.append(list(textout))
+
+    def closeAll(self, clearTrace=True):
+        self.closed = True
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_rate(self):
+        limiter = RateLimiter(10)
+        self.assertTrue(limiter.ready())
+        self.assertFalse(limiter.ready())
+        limiter._last -= 0.1
+        self.assertTrue(limiter.ready())
+
+    def test_unlimited(self):
+        for rate in (0, None):
+            limiter = RateLimiter(rate)
+            self.assertTrue(all(limiter.ready() for i in range(0, 100)))
+
+class TestCaptureEngine(unittest.TestCase):
+
+    def capture(self, ntraces=200, segments=1, pipelined=False, updateRate=10):
+        scope = SimulatedScope(300, noise=0.01, seed=0)
+        writer = ListWriter()
+        engine = CaptureEngine(scope, SimulatedTarget(scope), writer, keyTextPattern=RandomTextPattern(), updateRate=updateRate)
+        engine.setMaxtraces(ntraces)
+        engine.setSegments(segments)
+        engine.setPipelined(pipelined)
+        return (engine, writer)
+
+    def test_capture(self):
+        (engine, writer) = self.capture()
+        counts = []
+        engine.traceCallback = counts.append
+        self.assertTrue(engine.doReadings())
+
+        self.assertEqual(counts, range(1, 201))
+        self.assertTrue(writer.closed)
+        self.assertEqual(len(writer.traces), 200)
+        #Every trace gets the next plaintext from the pattern
+        pattern = RandomTextPattern()
+        texts = [list(pattern.newPair()[1]) for i in range(0, 210)]
+        first = texts.index(writer.textins[0])
+        self.assertEqual(writer.textins, texts[first:first + 200])
+        self.assertEqual(list(writer.knownkey), range(0, 16))
+
+        #Simulated leakage is the S-box output HW of each byte, so CPA on its point finds the key
+        traces = np.array(writer.traces)
+        textins = np.array(writer.textins)
+        for bnum in (0, 7, 15):
+            hyp = AES128_8bit.leakageMatrix(textins, None, bnum, AES128_8bit.LEAK_HW_SBOXOUT_FIRSTROUND, None)
+            point = traces[:, 100 + 10 * bnum]
+            corr = [abs(np.corrcoef(hyp[:, g], point)[0, 1]) for g in range(0, 256)]
+            self.assertEqual(np.argmax(corr), bnum)
+
+    def test_samePipelinedOrSegmented(self):
+        (engine, reference) = self.capture(60)
+        engine.doReadings()
+
+        for (segments, pipelined) in [(1, True), (7, False)]:
+            (engine, writer) = self.capture(60, segments, pipelined)
+            engine.doReadings()
+            self.assertEqual(writer.textins, reference.textins)
+            self.assertEqual(writer.textouts, reference.textouts)
+            self.assertEqual(len(writer.traces), 60)
+
+    def test_updates(self):
+        (engine, writer) = self.capture(50, updateRate=0)
+        updates = []
+        engine.updateCallback = lambda nt, data, offset: updates.append(nt)
+        engine.doReadings()
+        self.assertEqual(updates, range(1, 51))
+
+        #Rate limited updates still end with the final count
+        (engine, writer) = self.capture(50, updateRate=1)
+        updates = []
+        engine.updateCallback = lambda nt, data, offset: updates.append(nt)
+        engine.doReadings()
+        self.assertTrue(len(updates) < 50)
+        self.assertEqual(updates[-1], 50)
+
+    def test_abort(self):
+        (engine, writer) = self.capture()
+        engine.traceCallback = lambda nt: engine.abortCapture(nt == 10)
+        self.assertFalse(engine.doReadings())
+        self.assertEqual(len(writer.traces), 10)
+
+if __name__ == '__main__':
+    unittest.main()
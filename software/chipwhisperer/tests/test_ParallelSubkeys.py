@@ -0,0 +1,269 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from chipwhisperer.analyzer.attacks.CPAAccumulator import CPAAccumulator, CPACenteredAccumulator, CorrelationPeaks, loadAccumulators
+from chipwhisperer.analyzer.attacks import ParallelSubkeys
+from chipwhisperer.analyzer.attacks.ParallelSubkeys import SubkeyParallelRunner, ProgressiveSubkeysMixin
+from chipwhisperer.analyzer.attacks.models import AES128_8bit
+
+class AccumulatorSubkey(object):
+    """Minimal per-subkey engine with the same interface as CPAProgressiveOneSubkey"""
+
+    def __init__(self):
+        self.acc = CPAAccumulator()
+        self.modelstate = {'knownkey':None}
+
+    def getAccumulator(self):
+        return CPAAccumulator().merge(self.acc)
+
+    def setAccumulator(self, acc):
+        self.acc = CPAAccumulator().merge(acc)
+
+    def oneSubkey(self, bnum, pointRange, traces, numtraces, plaintexts, ciphertexts, knownkeys, progressBar, model, leakagetype,
+                  state, pbcnt, peaks=False):
+        hyp = model.leakageMatrix(plaintexts, ciphertexts, bnum, leakagetype, state)
+        self.acc.add(np.asarray(traces)[:, pointRange[0]:pointRange[1]], hyp)
+        if peaks:
+            return (self.acc.peaks(), pbcnt)
+        return (self.acc.correlation(), pbcnt)
+
+class TraceSource(object):
+    def __init__(self, traces, textins):
+        self.traces = traces
+        self.textins = textins
+
+    def getTrace(self, n):
+        return self.traces[n]
+
+    def getTextin(self, n):
+        return self.textins[n]
+
+    def getTextout(self, n):
+        return self.textins[n]
+
+    def getKnownKey(self, n):
+        return None
+
+class Stats(object):
+    def __init__(self):
+        self.diffs = {}
+        self.tnum = {}
+
+    def updateSubkey(self, bnum, data, tnum=None):
+        self.diffs[bnum] = data
+        self.tnum[bnum] = tnum
+
+    def simplePGE(self, bnum):
+        return 1
+
+class ProgressBar(object):
+    def setMinimum(self, value):
+        pass
+
+    def setMaximum(self, value):
+        pass
+
+    def setValue(self, value):
+        pass
+
+    def updateStatus(self, tracerange, bnum):
+        pass
+
+    def wasCanceled(self):
+        return False
+
+    def wasSkipped(self):
+        return False
+
+    def clearSkipped(self):
+        pass
+
+class Attack(ProgressiveSubkeysMixin):
+    oneSubkeyClass = AccumulatorSubkey
+
+    def __init__(self, mode='off'):
+        self.model = AES128_8bit
+        self.leakage = AES128_8bit.LEAK_HW_SBOXOUT_FIRSTROUND
+        self.brange = [0, 1, 5]
+        self.stats = Stats()
+        self.sr = None
+        self._reportingInterval = 70
+        self.setParallelMode(mode, 2)
+        self.setCheckpoint(None)
+
+class CenteredAttack(Attack):
+    def _accumulatorClass(self):
+        return CPACenteredAccumulator
+
+def makeData(ntraces=400, npoints=20):
+    rng = np.random.RandomState(0)
+    traces = rng.randn(ntraces, npoints)
+    textins = rng.randint(0, 256, (ntraces, 16)).astype(np.uint8)
+    return (traces, textins)
+
+class TestSubkeyParallelRunner(unittest.TestCase):
+
+    def setUp(self):
+        (self.traces, self.textins) = makeData()
+        self.brange = [0, 1, 5]
+        self.pointRanges = {0:(0, 20), 1:(5, 15), 5:(0, 20)}
+        self.leakage = AES128_8bit.LEAK_HW_SBOXOUT_FIRSTROUND
+
+    def runBlocks(self, mode, blocks, kwargs=None):
+        cpa = [AccumulatorSubkey() for bnum in range(0, 6)]
+        runner = SubkeyParallelRunner(AccumulatorSubkey, AES128_8bit, self.leakage, self.brange, mode, 2, kwargs)
+        try:
+            results = None
+            for (start, end) in blocks:
+                traces = self.traces[start:end]
+                if runner.cpa is None:
+                    runner.start(cpa, traces)
+                results = runner.run(traces, len(traces), self.textins[start:end], self.textins[start:end], [None] * (end - start),
+                                     self.pointRanges)
+            accs = runner.getAccumulators()
+        finally:
+            runner.close()
+        return (results, accs)
+
+    def reference(self, bnum, end):
+        acc = CPAAccumulator()
+        pr = self.pointRanges[bnum]
+        acc.add(self.traces[0:end, pr[0]:pr[1]], AES128_8bit.leakageMatrix(self.textins[0:end], None, bnum, self.leakage, None))
+        return acc
+
+    def test_modes(self):
+        #Second block is larger than the first, so process mode has to grow its shared buffers
+        blocks = [(0, 50), (50, 220), (220, 400)]
+        for mode in ('thread', 'process'):
+            (results, accs) = self.runBlocks(mode, blocks)
+            for bnum in self.brange:
+                ref = self.reference(bnum, 400)
+                self.assertTrue(np.allclose(results[bnum], ref.correlation()), "%s mode, subkey %d" % (mode, bnum))
+                self.assertEqual(accs[bnum].totalTraces, 400)
+                self.assertTrue(np.allclose(accs[bnum].sumht, ref.sumht))
+
+    def test_peaks(self):
+        (results, _) = self.runBlocks('process', [(0, 100), (100, 400)], {'peaks':True})
+        for bnum in self.brange:
+            self.assertTrue(isinstance(results[bnum], CorrelationPeaks))
+            full = CorrelationPeaks.fromArray(self.reference(bnum, 400).correlation())
+            self.assertTrue(np.array_equal(results[bnum].peaks()[1], full.peaks()[1]))
+
+    def test_invalidMode(self):
+        self.assertRaises(ValueError, SubkeyParallelRunner, AccumulatorSubkey, AES128_8bit, self.leakage, self.brange, 'gpu')
+
+class TestProgressiveSubkeysMixin(unittest.TestCase):
+
+    def setUp(self):
+        (traces, textins) = makeData()
+        self.source = TraceSource(traces, textins)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parallelMatchesSerial(self):
+        results = {}
+        for mode in ('off', 'thread', 'process'):
+            attack = Attack(mode)
+            attack.addTraces(self.source, (0, 400), ProgressBar(), pointRange=(0, 20))
+            results[mode] = attack.stats
+
+        for mode in ('thread', 'process'):
+            for bnum in [0, 1, 5]:
+                self.assertTrue(np.allclose(results[mode].diffs[bnum], results['off'].diffs[bnum]))
+                self.assertEqual(results[mode].tnum[bnum], 400)
+
+    def test_resume(self):
+        whole = Attack()
+        whole.addTraces(self.source, (0, 400), ProgressBar(), pointRange=(0, 20))
+
+        fname = os.path.join(self.tmpdir, 'ckpt.npz')
+        first = Attack()
+        first.setCheckpoint(fname)
+        first.addTraces(self.source, (0, 150), ProgressBar(), pointRange=(0, 20))
+
+        #Resumed attack starts with the checkpoint results & only adds the remaining traces
+        for mode in ('off', 'process'):
+            #Resuming keeps saving to the checkpoint, so each run gets its own copy
+            modename = os.path.join(self.tmpdir, 'ckpt_%s.npz' % mode)
+            shutil.copy(fname, modename)
+            resumed = Attack(mode)
+            resumed.setCheckpoint(modename, resume=True)
+            self.assertEqual(resumed._loadCheckpoint([AccumulatorSubkey() for b in range(0, 6)], (0, 400)), 150)
+            resumed.addTraces(self.source, (0, 400), ProgressBar(), pointRange=(0, 20))
+            for bnum in [0, 1, 5]:
+                self.assertTrue(np.allclose(resumed.stats.diffs[bnum], whole.stats.diffs[bnum]))
+
+        #Checkpoint from a different starting trace is ignored
+        other = Attack()
+        other.setCheckpoint(fname, resume=True)
+        self.assertEqual(other._loadCheckpoint([AccumulatorSubkey() for b in range(0, 6)], (10, 400)), 0)
+
+    def test_checkpointInterval(self):
+        saved = []
+        save = ParallelSubkeys.saveAccumulators
+        ParallelSubkeys.saveAccumulators = lambda fname, accs, tracerange: saved.append(tracerange)
+        try:
+            #Reporting interval is 70 traces, so saves are at the first interval end 100 traces after the last
+            attack = Attack()
+            attack.setCheckpoint(os.path.join(self.tmpdir, 'ckpt.npz'), interval=100)
+            attack.addTraces(self.source, (0, 400), ProgressBar(), pointRange=(0, 20))
+            self.assertEqual(saved, [(0, 140), (0, 280), (0, 400)])
+
+            del saved[:]
+            attack.setCheckpoint(os.path.join(self.tmpdir, 'ckpt.npz'), interval=0)
+            attack.addTraces(self.source, (0, 400), ProgressBar(), pointRange=(0, 20))
+            self.assertEqual(saved, [(0, t) for t in (70, 140, 210, 280, 350, 400)])
+        finally:
+            ParallelSubkeys.saveAccumulators = save
+
+    def test_resumeMismatch(self):
+        fname = os.path.join(self.tmpdir, 'ckpt.npz')
+        first = Attack()
+        first.setCheckpoint(fname)
+        first.addTraces(self.source, (0, 150), ProgressBar(), pointRange=(0, 20))
+
+        #Raw sums can't be continued by an attack keeping centered state, resuming must fail rather than drop them
+        resumed = CenteredAttack()
+        resumed.setCheckpoint(fname, resume=True)
+        cpa = [AccumulatorSubkey() for b in range(0, 6)]
+        self.assertRaises(ValueError, resumed._loadCheckpoint, cpa, (0, 400))
+        self.assertTrue(cpa[0].acc.isEmpty())
+        self.assertRaises(ValueError, resumed.addTraces, self.source, (0, 400), ProgressBar(), (0, 20))
+
+        #Checkpoint is left as it was
+        (accs, tracerange) = loadAccumulators(fname)
+        self.assertEqual(tracerange, (0, 150))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from chipwhisperer.analyzer.attacks.dataanalysis import DataAnalysis
+from chipwhisperer.common.traces.utils import NpyAppender, loadNpy
+
+recordType = [('tracecnt', 'i8', (4,)), ('diffsmax', 'f8', (4, 16)), ('diffsmin', 'f8', (4, 16))]
+
+def referencePGE(diffsmax, diffsmin, knownkey, useAbs):
+    """PGE of one subkey the way the original calculate() found it: sort on value, reverse, skip NaNs"""
+    maxes = np.zeros(len(diffsmax), dtype=[('hyp', 'i2'), ('value', 'f8')])
+    maxes['hyp'] = np.arange(0, len(diffsmax))
+    if useAbs:
+        maxes['value'] = np.fmax(np.fabs(diffsmax), np.fabs(diffsmin))
+    else:
+        maxes['value'] = diffsmax
+    numnans = np.isnan(maxes['value']).sum()
+    maxes.sort(order='value')
+    maxes = maxes[::-1]
+    try:
+        pge = np.flatnonzero(maxes['hyp'] == knownkey)[0] - numnans
+    except IndexError:
+        return 255
+    if pge < 0:
+        return 128
+    return pge
+
+class TestNpyAppender(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmpdir, 'records.npy')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_reload(self):
+        rng = np.random.RandomState(0)
+        records = np.zeros(25, dtype=recordType)
+        records['tracecnt'] = rng.randint(0, 1000, (25, 4))
+        records['diffsmax'] = rng.randn(25, 4, 16)
+
+        f = NpyAppender(self.fname, recordType)
+        self.assertEqual(len(np.load(self.fname)), 0)
+        f.append(records[0])
+        f.append(records[1:10])
+
+        #Readable while still being written
+        self.assertTrue(np.array_equal(np.load(self.fname), records[0:10]))
+        for i in range(10, 25):
+            f.append(records[i])
+        f.close()
+
+        self.assertTrue(np.array_equal(np.load(self.fname), records))
+        mapped = loadNpy(self.fname)
+        self.assertTrue(isinstance(mapped, np.memmap))
+        self.assertTrue(np.array_equal(mapped, records))
+
+class TestDataAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        rng = np.random.RandomState(1)
+        self.knownkey = [3, 15, 0, 7]
+
+        self.records = np.zeros(60, dtype=recordType)
+        for i in range(0, 60):
+            tnum = 25 * (i % 6 + 1)
+            self.records['tracecnt'][i] = tnum
+            #Rounded so hypotheses tie
+            self.records['diffsmax'][i] = np.round(rng.rand(4, 16), 1)
+            self.records['diffsmin'][i] = -np.round(rng.rand(4, 16), 1)
+            self.records['diffsmax'][i, np.arange(0, 4), self.knownkey] += tnum / 150.0
+        self.records['diffsmax'][5, 1, 2] = np.nan
+        self.records['diffsmin'][5, 1, 2] = np.nan
+        self.records['diffsmax'][7, 2, 0] = np.nan
+        self.records['diffsmin'][7, 2, 0] = np.nan
+
+        self.fname = os.path.join(self.tmpdir, 'stats.npy')
+        f = NpyAppender(self.fname, recordType)
+        f.append(self.records)
+        f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def analysis(self, knownkey=None):
+        a = DataAnalysis()
+        a.loadData(self.fname)
+        a.setKnownkey(knownkey or self.knownkey)
+        return a
+
+    def test_ranks(self):
+        for useAbs in (True, False):
+            (tracecnt, pge) = self.analysis().ranks(useAbs)
+            self.assertTrue(np.array_equal(tracecnt, self.records['tracecnt'][:, 0]))
+            for i in range(0, 60):
+                for k in range(0, 4):
+                    ref = referencePGE(self.records['diffsmax'][i, k], self.records['diffsmin'][i, k], self.knownkey[k], useAbs)
+                    self.assertEqual(pge[i, k], ref, "record %d subkey %d useAbs=%s" % (i, k, useAbs))
+
+        self.assertEqual(pge[7, 2], 128)
+
+    def test_invalidKey(self):
+        (_, pge) = self.analysis([3, 15, 300, 7]).ranks()
+        self.assertTrue(np.all(pge[:, 2] == 255))
+
+    def test_smallBlocks(self):
+        a = self.analysis()
+        (_, pge) = a.ranks()
+        a.blockSize = 7
+        self.assertTrue(np.array_equal(a.ranks()[1], pge))
+
+    def test_oldFormat(self):
+        #Files from older versions are a pickled array of dictionaries
+        old = []
+        for r in self.records:
+            old.append({'tracecnt':list(r['tracecnt']), 'diffsmax':r['diffsmax'], 'diffsmin':r['diffsmin']})
+        oldname = os.path.join(self.tmpdir, 'old.npy')
+        np.save(oldname, old)
+
+        a = DataAnalysis()
+        a.loadData(oldname)
+        a.setKnownkey(self.knownkey)
+        self.assertEqual(a.calculate(), self.analysis().calculate())
+
+    def test_calculate(self):
+        data = self.analysis().calculate()
+        self.assertEqual(sorted(data.keys()), [25, 50, 75, 100, 125, 150])
+        (_, pge) = self.analysis().ranks()
+        for tnum in data:
+            rows = self.records['tracecnt'][:, 0] == tnum
+            self.assertEqual(data[tnum]['tests'], 10)
+            self.assertEqual(data[tnum]['pge'], list(pge[rows].sum(axis=0)))
+            self.assertEqual(data[tnum]['gsr'], np.all(pge[rows] == 0, axis=1).sum())
+
+    def test_statistics(self):
+        s = self.analysis().statistics()
+        self.assertEqual(list(s['traces']), [25, 50, 75, 100, 125, 150])
+        self.assertTrue(np.all(s['tests'] == 10))
+        self.assertTrue(np.all(s['pgeLow'] <= s['pge']) and np.all(s['pge'] <= s['pgeHigh']))
+        self.assertTrue(np.all(s['gsrLow'] <= s['gsr']) and np.all(s['gsr'] <= s['gsrHigh']))
+        self.assertTrue(np.all((s['gsrLow'] >= 0) & (s['gsrHigh'] <= 1)))
+        #Known key is clearly best with the most traces
+        self.assertEqual(s['gsr'][-1], 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,257 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from chipwhisperer.common.traces.BackgroundTraceWriter import BackgroundTraceWriter
+
+try:
+    import PySide
+    from chipwhisperer.common.traces.TraceContainer import TraceContainer
+    from chipwhisperer.common.traces import TraceContainerChunked
+    from chipwhisperer.common.traces.TraceContainerNative import TraceContainerNative
+except ImportError:
+    PySide = None
+
+def makeData(ntraces, npoints, seed=0):
+    """10-bit ADC codes scaled the way OpenADC returns them, & random text"""
+    rng = np.random.RandomState(seed)
+    traces = rng.randint(0, 1024, (ntraces, npoints)) / 1024.0 - 0.5
+    textins = rng.randint(0, 256, (ntraces, 16)).astype(np.uint8)
+    return (traces, textins)
+
+@unittest.skipIf(PySide is None, "PySide is not installed")
+class TestTraceContainerBlocks(unittest.TestCase):
+
+    def setUp(self):
+        (self.traces, self.textins) = makeData(20, 8)
+
+    def test_stored(self):
+        tc = TraceContainer()
+        for i in range(0, 20):
+            tc.addTrace(self.traces[i], self.textins[i], self.textins[i] ^ 1, None)
+
+        self.assertTrue(np.array_equal(tc.getTraceBlock(3, 11), self.traces[3:11]))
+        self.assertTrue(np.array_equal(tc.getTraceBlock(3, 11, (2, 5)), self.traces[3:11, 2:5]))
+        self.assertTrue(np.array_equal(tc.getTextinBlock(0, 20), self.textins))
+        self.assertTrue(np.array_equal(tc.getTextoutBlock(5, 6), self.textins[5:6] ^ 1))
+
+    def test_pastEnd(self):
+        #Buffer is preallocated larger than the traces added, rows past the end aren't returned
+        tc = TraceContainer()
+        tc.setTraceHint(50)
+        for i in range(0, 20):
+            tc.addTrace(self.traces[i], self.textins[i], self.textins[i] ^ 1, None)
+        self.assertEqual(tc.traces.shape[0], 50)
+        self.assertRaises(IndexError, tc.getTraceBlock, 10, 30)
+        self.assertRaises(IndexError, tc.getTextinBlock, 15, 21)
+
+    def test_perTrace(self):
+        #Containers which fetch each trace themselves (e.g. from a database) still work with the block methods
+        traces = self.traces
+        textins = self.textins
+
+        class PerTrace(TraceContainer):
+            def getTrace(self, n):
+                return traces[n]
+
+            def getTextin(self, n):
+                return textins[n]
+
+            def getTextout(self, n):
+                return textins[n] ^ 1
+
+            def numTraces(self):
+                return len(traces)
+
+        tc = PerTrace()
+        self.assertTrue(np.array_equal(tc.getTraceBlock(3, 11, (2, 5)), self.traces[3:11, 2:5]))
+        self.assertTrue(np.array_equal(tc.getTextinBlock(4, 9), self.textins[4:9]))
+        self.assertTrue(np.array_equal(tc.getTextoutBlock(4, 9), self.textins[4:9] ^ 1))
+
+@unittest.skipIf(PySide is None, "PySide is not installed")
+class TestTraceContainerNative(unittest.TestCase):
+
+    def setUp(self):
+        (self.traces, self.textins) = makeData(20, 8)
+
+    def writer(self):
+        tc = TraceContainerNative()
+        tc.setTraceHint(20)
+        tc.setSampleFormat(np.uint16, 1.0 / 1024, -0.5)
+        return tc
+
+    def test_rawSamples(self):
+        tc = self.writer()
+        for i in range(0, 20):
+            tc.addWave(self.traces[i])
+        self.assertEqual(tc.traces.dtype, np.uint16)
+        self.assertTrue(np.array_equal(tc.getTraceBlock(0, 20), self.traces))
+
+    def test_outOfRange(self):
+        #Samples which aren't ADC codes switch the segment to floating point instead of wrapping around
+        traces = np.array(self.traces)
+        traces[12, 3] = 1.5
+        traces[15, 0] = np.nan
+        tc = self.writer()
+        for i in range(0, 20):
+            tc.addWave(traces[i])
+        self.assertEqual(tc.traces.dtype, np.double)
+        self.assertTrue(np.array_equal(tc.getTraceBlock(0, 15), traces[0:15]))
+        self.assertTrue(np.isnan(tc.getTrace(15)[0]))
+        self.assertEqual(float(tc.config.attr("sampleGain")), 1.0)
+
+@unittest.skipIf(PySide is None, "PySide is not installed")
+class TestTraceContainerChunked(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        (self.traces, self.textins) = makeData(2500, 50)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def writer(self, prefix):
+        tc = TraceContainerChunked.TraceContainerChunked(TraceContainerChunked.parameters())
+        tc.config.setAttr("prefix", prefix)
+        tc.config.setConfigFilename(os.path.join(self.tmpdir, "config_%s.cfg" % prefix))
+        tc.prepareDisk()
+        return tc
+
+    def reader(self, prefix):
+        tc = TraceContainerChunked.TraceContainerChunked(configfile=os.path.join(self.tmpdir, "config_%s.cfg" % prefix))
+        tc.loadAllTraces(None, None)
+        return tc
+
+    def fill(self, tc, ntraces):
+        for i in range(0, ntraces):
+            tc.addTrace(self.traces[i], self.textins[i], self.textins[i] ^ 1, None)
+
+    def check(self, tc, ntraces):
+        self.assertEqual(tc.numTraces(), ntraces)
+        self.assertTrue(np.array_equal(tc.getTraceBlock(0, ntraces), self.traces[0:ntraces]))
+        self.assertTrue(np.array_equal(tc.getTraceBlock(900, 1200, (5, 20)), self.traces[900:1200, 5:20]))
+        self.assertTrue(np.array_equal(tc.getTrace(ntraces - 1), self.traces[ntraces - 1]))
+        self.assertTrue(np.array_equal(tc.getTextinBlock(990, 1010), self.textins[990:1010]))
+        self.assertTrue(np.array_equal(tc.getTextout(ntraces - 1), self.textins[ntraces - 1] ^ 1))
+        self.assertEqual(tc.getKnownKeyBlock(100, 1100), [None] * 1000)
+
+    def test_roundTrip(self):
+        tc = self.writer("a_")
+        self.fill(tc, 2500)
+        tc.closeAll(clearTrace=False)
+
+        tc = self.reader("a_")
+        self.check(tc, 2500)
+        #ADC codes are stored as integers, so the files are much smaller than the floating point data
+        size = sum(os.path.getsize(os.path.join(self.tmpdir, f)) for f in os.listdir(self.tmpdir))
+        self.assertTrue(size < self.traces.nbytes / 2)
+
+    def test_unflushed(self):
+        #Part of the data is still in the write buffer
+        tc = self.writer("b_")
+        self.fill(tc, 1500)
+        self.check(tc, 1500)
+        self.assertRaises(IndexError, tc.getTraceBlock, 1400, 1600)
+
+    def test_backgroundWriter(self):
+        bgWriter = BackgroundTraceWriter()
+        try:
+            tc = self.writer("c_")
+            tc.backgroundWriter = bgWriter
+            self.fill(tc, 2300)
+            bgWriter.closeWriter(tc)
+            self.assertEqual(int(tc.config.attr("numTraces")), 2300)
+        finally:
+            bgWriter.close()
+
+        self.check(self.reader("c_"), 2300)
+
+class ConfigWriter(object):
+    """Segment writer recording which thread touches its config"""
+
+    def __init__(self):
+        self.traces = np.zeros((10, 10))
+        self.config = self
+        self.configThreads = []
+        self.closed = []
+
+    def writeDataToConfig(self):
+        self.configThreads.append(threading.current_thread())
+
+    def saveTrace(self):
+        self.configThreads.append(threading.current_thread())
+
+    def closeAll(self, clearTrace=True, saveConfig=True):
+        self.closed.append((clearTrace, saveConfig))
+
+class TestBackgroundTraceWriter(unittest.TestCase):
+
+    def test_order(self):
+        done = []
+        bgWriter = BackgroundTraceWriter(maxBytes=10)
+        try:
+            tickets = [bgWriter.submit(lambda i=i: done.append(i), 4) for i in range(0, 20)]
+            bgWriter.wait(tickets[5])
+            self.assertEqual(done[0:6], range(0, 6))
+        finally:
+            bgWriter.close()
+        self.assertEqual(done, range(0, 20))
+
+    def test_closeWriter(self):
+        bgWriter = BackgroundTraceWriter()
+        try:
+            writers = [ConfigWriter() for i in range(0, 5)]
+            for writer in writers:
+                bgWriter.closeWriter(writer)
+            bgWriter.wait(writers[2])
+            self.assertEqual(writers[2].closed, [(False, False)])
+        finally:
+            bgWriter.close()
+
+        #Config is only saved from this thread, the job just writes the files
+        for writer in writers:
+            self.assertEqual(writer.configThreads, [threading.current_thread()] * 2)
+            self.assertEqual(writer.closed, [(False, False)])
+        #Finished writers aren't kept, & waiting on one is a no-op
+        self.assertEqual(bgWriter._tickets, {})
+        bgWriter.wait(writers[0])
+
+    def test_error(self):
+        def fail():
+            raise IOError("disk full")
+
+        bgWriter = BackgroundTraceWriter()
+        bgWriter.submit(fail)
+        self.assertRaises(IOError, bgWriter.close)
+
+if __name__ == '__main__':
+    unittest.main()